@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CONTRASEÑAS Y SESIONES ---
+# Las contraseñas se guardan con scrypt (hashlib, usa memoria a propósito para
+# que un ataque por fuerza bruta sea caro):
+#   scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>
+# Calcular un scrypt toma decenas de ms de CPU: se hace en HASH_POOL (pocos
+# hilos) y nunca en el event loop.
+#
+# Login entrega un token firmado con HMAC-SHA256 (usuario, rol, vencimiento).
+# Cada request del portal lo manda en "Authorization: Bearer ...". Verificar la
+# firma es barato, pero igual se guarda el resultado en TokenCache (LRU con
+# TTL) para no consultar la tabla users en cada llamada.
+
+SCRYPT_N = int(os.getenv("LIONS_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_DKLEN = 32
+HASH_PREFIX = "scrypt$"
+
+# Hilos para scrypt: cada uno usa ~128 * N * r bytes (16 MB con los valores por defecto)
+HASH_WORKERS = int(os.getenv("LIONS_AUTH_WORKERS", "2"))
+SESSION_TTL = int(os.getenv("LIONS_SESSION_HOURS", "12")) * 3600
+TOKEN_CACHE_SIZE = int(os.getenv("LIONS_TOKEN_CACHE_SIZE", "1024"))
+TOKEN_CACHE_TTL = int(os.getenv("LIONS_TOKEN_CACHE_TTL", "60"))
+# Cada cuánto se revisa si otro worker cambió/borró usuarios (no en cada request)
+USER_SYNC_SECONDS = float(os.getenv("LIONS_USER_SYNC_MS", "1000")) / 1000
+# LIONS_AUTH_REQUIRED=0 desactiva la revisión del token (solo desarrollo)
+AUTH_REQUIRED = os.getenv("LIONS_AUTH_REQUIRED", "1") != "0"
+
+HASH_POOL = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="scrypt")
+
+
+class InvalidToken(Exception):
+    """Token mal formado, con firma inválida o vencido (se traduce a un 401)."""
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def hash_password(password):
+    salt = secrets.token_bytes(16)
+    digest = hashlib.scrypt(
+        password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P,
+        maxmem=256 * SCRYPT_N * SCRYPT_R, dklen=SCRYPT_DKLEN,
+    )
+    return f"{HASH_PREFIX}{SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(HASH_PREFIX)
+
+
+def verify_password(password, stored):
+    """Compara en tiempo constante. Acepta también contraseñas antiguas en texto plano."""
+    if not stored:
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        _, n, r, p, salt, expected = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        digest = hashlib.scrypt(
+            password.encode(), salt=_unb64(salt), n=n, r=r, p=p,
+            maxmem=256 * n * r, dklen=len(_unb64(expected)),
+        )
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(digest, _unb64(expected))
+
+
+# --- BASE DE DATOS ---
+
+def create_schema(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS app_settings (name TEXT PRIMARY KEY, value TEXT)")
+    # Contraseñas que aún estén en texto plano (usuarios creados antes del hash)
+    rows = conn.execute("SELECT id, password FROM users").fetchall()
+    updates = [(hash_password(r["password"]), r["id"]) for r in rows if r["password"] and not is_hashed(r["password"])]
+    conn.executemany("UPDATE users SET password = ? WHERE id = ?", updates)
+
+
+def load_secret(conn):
+    """
+    Clave para firmar tokens: LIONS_SECRET_KEY, o una aleatoria guardada en
+    app_settings (así los tokens sobreviven reinicios y sirven en todos los workers).
+    """
+    secret = os.getenv("LIONS_SECRET_KEY")
+    if secret:
+        return secret.encode()
+    conn.execute(
+        "INSERT OR IGNORE INTO app_settings (name, value) VALUES ('session_secret', ?)", (secrets.token_hex(32),)
+    )
+    return conn.execute("SELECT value FROM app_settings WHERE name = 'session_secret'").fetchone()["value"].encode()
+
+
+# --- TOKENS ---
+
+class SessionSigner:
+    def __init__(self, secret, ttl=SESSION_TTL):
+        self.secret = secret
+        self.ttl = ttl
+
+    def _sign(self, payload):
+        return _b64(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, username, role, now=None):
+        now = int(now if now is not None else time.time())
+        claims = {"u": username, "r": role, "exp": now + self.ttl}
+        payload = _b64(json.dumps(claims, separators=(",", ":")).encode())
+        return f"{payload}.{self._sign(payload)}", claims
+
+    def verify(self, token, now=None):
+        """Devuelve los claims del token o lanza InvalidToken."""
+        try:
+            payload, signature = token.split(".")
+        except (AttributeError, ValueError):
+            raise InvalidToken("Token mal formado")
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidToken("Firma inválida")
+        try:
+            claims = json.loads(_unb64(payload))
+        except ValueError:
+            raise InvalidToken("Token mal formado")
+        if claims.get("exp", 0) < (now if now is not None else time.time()):
+            raise InvalidToken("Sesión vencida")
+        return claims
+
+
+class TokenCache:
+    """LRU con TTL: token -> usuario ya verificado (firma + existe en la base)."""
+
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL, sync=None, sync_interval=USER_SYNC_SECONDS):
+        """sync: cache_sync.CacheSync; sus avisos de "users" llegan vía forget_user()."""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sync = sync
+        self.sync_interval = sync_interval
+        self._next_sync = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        if self.sync is not None and time.monotonic() >= self._next_sync:
+            self._next_sync = time.monotonic() + self.sync_interval
+            self.sync.poll()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic() or user["exp"] < time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return user
+
+    def put(self, token, user):
+        with self._lock:
+            self._entries[token] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget_user(self, username=None):
+        """Saca de la caché las sesiones de un usuario (o todas), p.ej. al borrarlo."""
+        with self._lock:
+            if username is None:
+                self._entries.clear()
+                return
+            for token in [t for t, (_, u) in self._entries.items() if u["username"] == username]:
+                del self._entries[token]
@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# --- BENCHMARK / PRUEBA DE CARGA EN PROCESO ---
+# Crea una base temporal con stock sintético (mismo formato que Vehiculo) y
+# golpea la app ASGI directamente, sin red, con N clientes concurrentes que
+# mezclan lecturas del catálogo (listado, facetas, cambios, similares,
+# bajas de precio), clics, subidas de fotos, exportaciones y ediciones del
+# portal. Entrega por endpoint: requests/s y latencias p50/p95/p99 en JSON,
+# para comparar entre commits:
+#
+#   python benchmark.py --vehicles 10000 --clients 32 --duration 30 -o base.json
+#   python benchmark.py --vehicles 10000 --clients 32 --duration 30 --compare base.json
+#
+# Necesita httpx (pip install httpx). Nunca toca la base ni las fotos reales:
+# todo vive en un directorio temporal que se borra al terminar.
+
+MARCAS = {
+    "Toyota": ["Corolla", "Yaris", "Hilux", "RAV4", "Corona"],
+    "Chevrolet": ["Sail", "Tracker", "Spark", "Colorado"],
+    "Kia": ["Rio", "Sportage", "Morning", "Soluto"],
+    "Hyundai": ["Accent", "Tucson", "Santa Fe", "Grand i10"],
+    "Nissan": ["Versa", "Kicks", "NP300", "Qashqai"],
+    "Suzuki": ["Swift", "Vitara", "Baleno"],
+    "Citroën": ["C3", "C-Elysée", "Berlingo"],
+    "Peugeot": ["208", "2008", "Partner"],
+    "Mazda": ["3", "CX-5", "BT-50"],
+    "JAC": ["JS2", "T8", "S3"],
+}
+VENDEDORES = ["Admin Elite", "Ana", "Luis", "Camila", "Jorge"]
+ESTADOS = ["Disponible"] * 6 + ["Reservado", "Vendido", "Vendido"]
+COLORES = ["Blanco", "Negro", "Gris", "Rojo", "Azul", "Plata"]
+CARROCERIAS = ["Sedán", "Hatchback", "SUV", "Camioneta", "Furgón"]
+COMBUSTIBLES = ["Bencina", "Diésel", "Híbrido"]
+OBS = [
+    "Único dueño, mantenciones al día en concesionario.",
+    "Neumáticos nuevos, revisión técnica vigente.",
+    "Recién llegado, se recibe vehículo en parte de pago.",
+    "Camión liviano ideal para trabajo, papeles al día.",
+    "",
+]
+
+# Mezcla de operaciones: nombre -> peso (aprox. el tráfico del sitio)
+DEFAULT_MIX = {
+    "catalog_full": 4,
+    "catalog_page": 20,
+    "catalog_filtered": 12,
+    "get_auto": 15,
+    "search": 8,
+    "suggest": 10,
+    "view": 18,
+    "interested": 4,
+    "stats": 3,
+    "upload": 1,
+    "update_auto": 2,
+    "bulk_patch": 1,
+    "brands": 2,
+    "facets": 6,
+    "changes": 6,
+    "similar": 4,
+    "price_drops": 2,
+    "export": 1,
+    "create_delete": 1,
+    "upload_batch": 1,
+}
+
+
+# --- STOCK SINTÉTICO ---
+
+def synthetic_car(rng, i, today=None):
+    today = today or date.today()
+    marca = rng.choice(list(MARCAS))
+    modelo = rng.choice(MARCAS[marca])
+    ano = rng.randint(2008, today.year)
+    precio = rng.randrange(4_000_000, 45_000_000, 10_000)
+    n_images = rng.randint(3, 12)
+    folder = f"{marca}_{modelo}".lower().replace(" ", "_")
+    imagenes = [f"https://lionscars.cl/uploads/{folder}/{i}_{n}.jpg" for n in range(n_images)]
+    history, price = [], precio + rng.randint(0, 5) * 250_000
+    for k in range(rng.randint(1, 5)):
+        history.append({"date": (today - timedelta(days=30 * (5 - k))).isoformat(), "price": price})
+        price = max(precio, price - 250_000)
+    hotspots = [
+        {
+            "id": f"h{i}_{k}", "x": round(rng.uniform(5, 95), 1), "y": round(rng.uniform(5, 95), 1),
+            "label": rng.choice(["Rayón", "Tapiz", "Llanta", "Pantalla"]), "detail": "Detalle menor",
+            "imageIndex": rng.randrange(n_images),
+        }
+        for k in range(rng.randint(0, 4))
+    ]
+    return {
+        "marca": marca, "modelo": modelo, "version": rng.choice(["", "GL", "GLX", "XEI", "Limited"]),
+        "ano": ano, "precio": precio, "km": rng.randint(0, 250_000), "duenos": rng.randint(1, 4),
+        "traccion": rng.choice(["4x2", "4x4", "AWD"]), "transmision": rng.choice(["Manual", "Automática"]),
+        "cilindrada": rng.choice(["1.2", "1.4", "1.6", "2.0", "2.4"]), "combustible": rng.choice(COMBUSTIBLES),
+        "carroceria": rng.choice(CARROCERIAS), "puertas": rng.choice([3, 4, 5]), "pasajeros": rng.choice([2, 5, 7]),
+        "motor": rng.choice(["", "VVT-i", "Turbo", "CRDi"]), "techo": rng.random() < 0.2,
+        "asientos": rng.choice(["Tela", "Cuero"]), "tipoVenta": rng.choice(["Propio", "Consignación"]),
+        "vendedor": rng.choice(VENDEDORES), "financiable": rng.random() < 0.7, "valorPie": rng.randrange(0, 5_000_000, 100_000),
+        "aire": rng.random() < 0.9, "neumaticos": rng.choice(["Nuevos", "Buen estado", "Medio uso"]),
+        "llaves": rng.randint(1, 2), "obs": rng.choice(OBS), "imagenes": imagenes, "imagen": imagenes[0],
+        "estado": rng.choice(ESTADOS), "diasStock": rng.randint(0, 120), "vistas": rng.randint(0, 800),
+        "interesados": rng.randint(0, 40), "patente": f"{''.join(rng.choices('BCDFGHJKLPRSTVWXYZ', k=4))}{rng.randint(10, 99)}",
+        "color": rng.choice(COLORES), "comisionEstimada": rng.randrange(0, 1_500_000, 50_000),
+        "precioHistorial": history, "hotspots": hotspots,
+    }
+
+
+def seed(main, count, rng, batch_size=1000):
+    """Inserta `count` vehículos directo en la base (con triggers, igual que en producción)."""
+    for start in range(0, count, batch_size):
+        with main.db.transaction() as conn:
+            for i in range(start, min(count, start + batch_size)):
+                car = synthetic_car(rng, i)
+                history = car.pop("precioHistorial")
+                main.prices.import_history(conn, main.vehiculos.insert(conn, car), history)
+
+
+def synthetic_photo(rng):
+    """JPEG pequeño (Pillow) o bytes al azar si Pillow no está instalado."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return rng.randbytes(64 * 1024)
+    buffer = io.BytesIO()
+    color = tuple(rng.randrange(256) for _ in range(3))
+    Image.new("RGB", (800, 600), color).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+# --- OPERACIONES ---
+# Cada una devuelve (nombre_endpoint, respuesta). El nombre agrupa las
+# latencias en el reporte.
+
+class Workload:
+    def __init__(self, client, rng, ids, token):
+        self.client = client
+        self.rng = rng
+        self.ids = ids
+        self.auth = {"Authorization": f"Bearer {token}"} if token else {}
+        self.changes_version = 0
+
+    async def catalog_full(self):
+        return "GET /api/autos", await self.client.get("/api/autos")
+
+    async def catalog_page(self):
+        sort = self.rng.choice(["id", "-precio", "precio", "-ano", "km"])
+        params = {"limit": 24, "sort": sort, "view": "summary"}
+        return "GET /api/autos?limit", await self.client.get("/api/autos", params=params)
+
+    async def catalog_filtered(self):
+        params = {"limit": 24, "view": "summary", "marca": self.rng.choice(list(MARCAS))}
+        if self.rng.random() < 0.5:
+            params["precioMax"] = self.rng.randrange(8_000_000, 40_000_000, 1_000_000)
+        if self.rng.random() < 0.3:
+            params["anoMin"] = self.rng.randint(2010, 2022)
+        return "GET /api/autos?filtros", await self.client.get("/api/autos", params=params)
+
+    async def get_auto(self):
+        return "GET /api/autos/{id}", await self.client.get(f"/api/autos/{self.rng.choice(self.ids)}")
+
+    async def search(self):
+        q = self.rng.choice(["toyota", "hilux 4x4", "citroen", "unico dueno", "camion", "kia rio", "cuero"])
+        return "GET /api/autos/search", await self.client.get("/api/autos/search", params={"q": q, "view": "summary"})
+
+    async def suggest(self):
+        marca = self.rng.choice(list(MARCAS))
+        q = marca[: self.rng.randint(1, len(marca))]
+        return "GET /api/autos/suggest", await self.client.get("/api/autos/suggest", params={"q": q})
+
+    async def view(self):
+        return "POST /api/autos/{id}/view", await self.client.post(f"/api/autos/{self.rng.choice(self.ids)}/view")
+
+    async def interested(self):
+        return "POST /api/autos/{id}/interested", await self.client.post(f"/api/autos/{self.rng.choice(self.ids)}/interested")
+
+    async def stats(self):
+        path = self.rng.choice(["/api/stats", "/api/stats/vendedores", "/api/stats/top-conversion"])
+        return f"GET {path}", await self.client.get(path, headers=self.auth)
+
+    async def upload(self):
+        files = {"file": ("foto.jpg", synthetic_photo(self.rng), "image/jpeg")}
+        return "POST /api/upload", await self.client.post("/api/upload", files=files, headers=self.auth)
+
+    async def update_auto(self):
+        item_id = self.rng.choice(self.ids)
+        car = synthetic_car(self.rng, item_id)
+        return "PUT /api/autos/{id}", await self.client.put(f"/api/autos/{item_id}", json=car, headers=self.auth)
+
+    async def bulk_patch(self):
+        body = {"ids": self.rng.sample(self.ids, min(20, len(self.ids))), "patch": {"diasStock": self.rng.randint(0, 120)}}
+        return "PATCH /api/autos", await self.client.patch("/api/autos", json=body, headers=self.auth)
+
+    async def brands(self):
+        return "GET /api/brands", await self.client.get("/api/brands")
+
+    async def facets(self):
+        params = {"marca": self.rng.choice(list(MARCAS))} if self.rng.random() < 0.5 else {}
+        return "GET /api/autos/facets", await self.client.get("/api/autos/facets", params=params)
+
+    async def changes(self):
+        # Sin espera: mide el costo de la consulta, no el long-poll
+        params = {"since": self.changes_version, "wait": 0, "view": "summary"}
+        response = await self.client.get("/api/autos/changes", params=params)
+        if response.status_code == 200:
+            self.changes_version = response.json()["version"]
+        return "GET /api/autos/changes", response
+
+    async def similar(self):
+        return "GET /api/autos/{id}/similar", await self.client.get(f"/api/autos/{self.rng.choice(self.ids)}/similar")
+
+    async def price_drops(self):
+        params = {"sort": self.rng.choice(["descuento", "fecha"])}
+        return "GET /api/autos/price-drops", await self.client.get("/api/autos/price-drops", params=params)
+
+    async def export(self):
+        params = {"format": self.rng.choice(["ndjson", "csv"]), "marca": self.rng.choice(list(MARCAS))}
+        return "GET /api/autos/export", await self.client.get("/api/autos/export", params=params, headers=self.auth)
+
+    async def create_delete(self):
+        # Crea y borra un auto nuevo: los ids sembrados no se tocan
+        car = synthetic_car(self.rng, len(self.ids))
+        created = await self.client.post("/api/autos", json=car, headers=self.auth)
+        if created.status_code != 200:
+            return "POST /api/autos", created
+        return "POST+DELETE /api/autos", await self.client.delete(f"/api/autos/{created.json()['id']}", headers=self.auth)
+
+    async def upload_batch(self):
+        files = [("files", (f"foto{n}.jpg", synthetic_photo(self.rng), "image/jpeg")) for n in range(self.rng.randint(3, 8))]
+        return "POST /api/upload/batch", await self.client.post("/api/upload/batch", files=files, headers=self.auth)
+
+
+# --- EJECUCIÓN ---
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(ms for ms, _, _ in samples)
+    errors = sum(1 for _, status, _ in samples if status >= 400)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else None,
+        "p50_ms": round(percentile(latencies, 50), 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 3) if latencies else None,
+        "max_ms": round(latencies[-1], 3) if latencies else None,
+        "bytes_mean": round(sum(size for _, _, size in samples) / len(samples)) if samples else None,
+    }
+
+
+async def client_loop(workload, mix, deadline, max_requests, samples, counter):
+    names, weights = zip(*mix.items())
+    while time.perf_counter() < deadline and (max_requests is None or counter[0] < max_requests):
+        counter[0] += 1
+        op = getattr(workload, workload.rng.choices(names, weights)[0])
+        start = time.perf_counter()
+        try:
+            endpoint, response = await op()
+            status, size = response.status_code, len(response.content)
+        except Exception as e:
+            endpoint, status, size = f"{op.__name__} (excepción {type(e).__name__})", 599, 0
+        samples.setdefault(endpoint, []).append(((time.perf_counter() - start) * 1000, status, size))
+
+
+async def run(main, args, mix, ids):
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            login = await client.post("/api/login", json={"username": "admin", "password": "admin"})
+            token = login.json().get("token") if login.status_code == 200 else None
+
+            # Calentamiento: llena cachés y abre conexiones antes de medir
+            warm = Workload(client, random.Random(args.seed + 1), ids, token)
+            for name in mix:
+                await getattr(warm, name)()
+
+            samples, counter = {}, [0]
+            start = time.perf_counter()
+            deadline = start + args.duration
+            tasks = [
+                client_loop(
+                    Workload(client, random.Random(args.seed + 100 + n), ids, token),
+                    mix, deadline, args.requests, samples, counter,
+                )
+                for n in range(args.clients)
+            ]
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+    return samples, elapsed
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    """Imprime el cambio de p50/p95/rps respecto a un reporte anterior."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparación con {baseline_path} ({baseline['meta'].get('commit')})", file=sys.stderr)
+    print(f"{'endpoint':40} {'p50 ms':>18} {'p95 ms':>18} {'rps':>16}", file=sys.stderr)
+    for name, now in sorted(report["endpoints"].items()):
+        before = baseline["endpoints"].get(name)
+        if not before:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "rps"):
+            a, b = before.get(key), now.get(key)
+            delta = f"{(b - a) / a * 100:+.0f}%" if a and b is not None else "n/a"
+            cells.append(f"{b} ({delta})")
+        print(f"{name:40} {cells[0]:>18} {cells[1]:>18} {cells[2]:>16}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark en proceso del backend")
+    parser.add_argument("--vehicles", type=int, default=1000, help="Vehículos sintéticos (1k-100k)")
+    parser.add_argument("--clients", type=int, default=16, help="Clientes concurrentes")
+    parser.add_argument("--duration", type=float, default=15, help="Segundos de medición")
+    parser.add_argument("--requests", type=int, default=None, help="Tope de requests (además de --duration)")
+    parser.add_argument("--storage", choices=["json", "columnar"], default="json")
+    parser.add_argument("--mix", default=None, help='Pesos JSON, ej: \'{"catalog_page": 10, "view": 5}\'')
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", default=None, help="Archivo JSON de salida (por defecto stdout)")
+    parser.add_argument("--compare", default=None, help="Reporte JSON anterior para comparar")
+    args = parser.parse_args()
+
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix.update(json.loads(args.mix))
+    unknown = [name for name in mix if not hasattr(Workload, name)]
+    if unknown:
+        parser.error(f"Operaciones desconocidas en --mix: {', '.join(unknown)}")
+    mix = {name: weight for name, weight in mix.items() if weight > 0}
+
+    with tempfile.TemporaryDirectory(prefix="lions-bench-") as workdir:
+        # La configuración se lee al importar main: fijarla antes
+        os.environ.update({
+            "LIONS_STORAGE": args.storage,
+            "LIONS_DB_NAME": os.path.join(workdir, "bench.db"),
+            "LIONS_UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        })
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import main as app_main
+
+        rng = random.Random(args.seed)
+        t0 = time.perf_counter()
+        seed(app_main, args.vehicles, rng)
+        seed_seconds = time.perf_counter() - t0
+        with app_main.db.connection() as conn:
+            ids = [r["id"] for r in conn.execute("SELECT id FROM vehiculos")]
+        print(f"Stock sintético: {len(ids)} vehículos en {seed_seconds:.1f}s", file=sys.stderr)
+
+        samples, elapsed = asyncio.run(run(app_main, args, mix, ids))
+
+    everything = [s for values in samples.values() for s in values]
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "storage": args.storage,
+            "vehicles": args.vehicles,
+            "clients": args.clients,
+            "duration_s": round(elapsed, 3),
+            "seed_s": round(seed_seconds, 3),
+            "mix": mix,
+        },
+        "total": summarize(everything, elapsed),
+        "endpoints": {name: summarize(values, elapsed) for name, values in sorted(samples.items())},
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+
+# --- COHERENCIA DE CACHÉS ENTRE WORKERS ---
+# Con varios workers (LIONS_WORKERS) cada proceso tiene sus cachés en memoria
+# (respuestas serializadas, índice de variantes de fotos, sesiones) y las
+# escrituras pueden venir de cualquiera de ellos. cache_versions guarda un
+# contador por namespace que suben triggers sobre las tablas de origen, así que
+# cualquier escritura (otro worker, fix_brands.py, migraciones) queda registrada
+# en la misma transacción que el cambio.
+#
+# Para enterarse sin releer la tabla en cada request se usa PRAGMA data_version
+# sobre una conexión propia: solo cambia cuando OTRA conexión hizo commit. Si no
+# cambió no hay nada que revisar (unos pocos µs); si cambió se lee
+# cache_versions (una fila por namespace) y se avisa cuáles subieron.
+
+# Cada cuánto revisar como máximo (0 = en cada request cacheada)
+CACHE_SYNC_MS = float(os.getenv("LIONS_CACHE_SYNC_MS", "0"))
+
+# tabla -> namespace cuyo contador sube con cada fila insertada/modificada/borrada.
+# En vehiculos también sube con un flush de clics: las respuestas cacheadas
+# traen vistas/interesados y sin eso quedarían atrasadas en los otros workers.
+WATCHED_TABLES = {
+    "vehiculos": "autos",
+    "brands": "brands",
+    "colors": "colors",
+    "users": "users",
+    "image_variants": "images",
+    "events_hourly": "events",
+    "events_daily": "events",
+}
+
+
+def create_schema(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache_versions "
+        "(namespace TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID"
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO cache_versions (namespace) VALUES (?)",
+        [(ns,) for ns in sorted(set(WATCHED_TABLES.values()))],
+    )
+    # Versiones anteriores: "autos" no subía con los flush de clics (WHEN) y un
+    # namespace "counters" aparte lo hacía
+    conn.execute("DROP TRIGGER IF EXISTS trg_cache_vehiculos_update")
+    for op in ("insert", "update", "delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_cache_counters_{op}")
+    conn.execute("DELETE FROM cache_versions WHERE namespace = 'counters'")
+    for table, namespace in WATCHED_TABLES.items():
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_cache_{table}_{op.lower()} AFTER {op} ON {table} "
+                f"BEGIN UPDATE cache_versions SET version = version + 1 WHERE namespace = '{namespace}'; END"
+            )
+
+
+class CacheSync:
+    """Detecta commits de otros procesos/conexiones y avisa qué namespaces cambiaron."""
+
+    def __init__(self, path, interval_ms=CACHE_SYNC_MS):
+        self.path = path
+        self.interval = interval_ms / 1000
+        self._conn = None
+        self._data_version = None
+        self._versions = None
+        self._next_check = 0.0
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener):
+        """listener(changed) se llama con el set de namespaces que subieron."""
+        self._listeners.append(listener)
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        return self._conn
+
+    def poll(self, force=False):
+        """
+        Revisa si hubo cambios y avisa a los listeners. Devuelve el set de
+        namespaces que cambiaron. Sin force, respeta el intervalo y no espera
+        si otro hilo ya está revisando.
+        """
+        if not force:
+            if time.monotonic() < self._next_check:
+                return set()
+            if not self._lock.acquire(blocking=False):
+                return set()
+        else:
+            self._lock.acquire()
+        try:
+            self._next_check = time.monotonic() + self.interval
+            conn = self._connection()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version and not force:
+                return set()
+            self._data_version = data_version
+            try:
+                versions = dict(conn.execute("SELECT namespace, version FROM cache_versions").fetchall())
+            except sqlite3.OperationalError:
+                return set()  # esquema aún sin crear
+            previous, self._versions = self._versions, versions
+        finally:
+            self._lock.release()
+        if previous is None:
+            return set()  # primera lectura: solo se toma la foto
+        changed = {ns for ns, v in versions.items() if previous.get(ns) != v}
+        if changed:
+            for listener in self._listeners:
+                listener(changed)
+        return changed
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
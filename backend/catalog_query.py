@@ -0,0 +1,205 @@
+import base64
+import json
+
+import storage
+
+# --- CONSULTAS DEL CATÁLOGO (filtros, orden y paginación dentro de SQLite) ---
+
+# Campos que se pueden filtrar/ordenar. Cada uno tiene un índice creado en
+# ensure_indexes(): de expresión sobre json_extract(data, ...) en el formato
+# json, o sobre la columna en el columnar. Las consultas deben usar EXACTAMENTE
+# la misma expresión (field_expr) para que SQLite lo use.
+INDEXED_FIELDS = [
+    "marca", "ano", "precio", "km", "duenos", "combustible", "transmision",
+    "traccion", "carroceria", "tipoVenta", "financiable", "aire",
+    "neumaticos", "estado", "vendedor",
+]
+
+# Filtros de igualdad (aceptan varios valores: ?marca=Kia&marca=JAC)
+EQUALITY_FILTERS = [
+    "marca", "combustible", "transmision", "traccion", "carroceria",
+    "tipoVenta", "neumaticos", "estado", "vendedor",
+]
+
+# Filtros de rango: nombre del parámetro -> (campo, operador)
+RANGE_FILTERS = {
+    "anoMin": ("ano", ">="), "anoMax": ("ano", "<="),
+    "precioMin": ("precio", ">="), "precioMax": ("precio", "<="),
+    "kmMin": ("km", ">="), "kmMax": ("km", "<="),
+    "duenosMax": ("duenos", "<="),
+}
+
+BOOLEAN_FILTERS = ["financiable", "aire"]
+
+# Claves de orden permitidas ("-precio" = descendente). "id" desempata siempre.
+SORT_FIELDS = ["id", "precio", "ano", "km"]
+
+MAX_PAGE_SIZE = 500
+
+
+class QueryError(ValueError):
+    """Parámetro de búsqueda inválido (se traduce a un 400)."""
+
+
+def field_expr(field):
+    return storage.backend.field_expr(field)
+
+
+def ensure_indexes(conn):
+    """Crea los índices de expresión usados por los filtros y el orden."""
+    for field in INDEXED_FIELDS:
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_vehiculos_{field.lower()} "
+            f"ON vehiculos ({field_expr(field)})"
+        )
+    # Combinación más común del catálogo: marca + rango de precio
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_vehiculos_marca_precio "
+        f"ON vehiculos ({field_expr('marca')}, {field_expr('precio')})"
+    )
+
+
+def check_filters(filters):
+    """
+    Valida filtros que llegan como JSON (PATCH masivo) y los deja como los de
+    la query string: listas de textos/números, números y booleanos.
+    """
+    unknown = set(filters) - FILTER_NAMES
+    if unknown:
+        raise QueryError(f"Filtros no soportados: {', '.join(sorted(unknown))}")
+    checked = {}
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name in EQUALITY_FILTERS:
+            values = value if isinstance(value, list) else [value]
+            if not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in values):
+                raise QueryError(f"Filtro {name}: se espera un texto o una lista de textos")
+        elif name in RANGE_FILTERS:
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise QueryError(f"Filtro {name}: se espera un número")
+            values = value
+        else:
+            if not isinstance(value, bool):
+                raise QueryError(f"Filtro {name}: se espera true o false")
+            values = value
+        checked[name] = values
+    return checked
+
+
+def build_where(filters):
+    """Traduce el dict de filtros a (sql_where, params). Ignora valores vacíos."""
+    clauses, params = [], []
+    for field in EQUALITY_FILTERS:
+        values = filters.get(field)
+        if not values:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        placeholders = ", ".join("?" for _ in values)
+        clauses.append(f"{field_expr(field)} IN ({placeholders})")
+        params.extend(values)
+    for name, (field, op) in RANGE_FILTERS.items():
+        value = filters.get(name)
+        if value is None:
+            continue
+        clauses.append(f"{field_expr(field)} {op} ?")
+        params.append(value)
+    for field in BOOLEAN_FILTERS:
+        value = filters.get(field)
+        if value is None:
+            continue
+        clauses.append(f"{field_expr(field)} = ?")
+        params.append(1 if value else 0)
+    return (" AND ".join(clauses) or "1"), params
+
+
+def parse_sort(sort):
+    descending = sort.startswith("-")
+    field = sort.lstrip("-")
+    if field not in SORT_FIELDS:
+        raise QueryError(f"Orden no soportado: {sort}")
+    return field, descending
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise QueryError("Cursor inválido")
+
+
+def search(conn, filters, sort="id", limit=None, cursor=None, select_list=None):
+    """
+    Ejecuta la búsqueda del catálogo y devuelve (rows, next_cursor).
+    `select_list` permite leer solo algunas columnas (ver storage.projection).
+    La paginación es por keyset: el cursor guarda (valor_orden, id) de la última
+    fila, así cada página cuesta lo mismo sin importar cuán profunda sea.
+    """
+    field, descending = parse_sort(sort)
+    expr = field_expr(field)
+    where, params = build_where(filters)
+
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor)
+        op = "<" if descending else ">"
+        if field == "id":
+            where += f" AND id {op} ?"
+            params.append(last_id)
+        else:
+            where += f" AND ({expr}, id) {op} (?, ?)"
+            params.extend([sort_value, last_id])
+
+    direction = "DESC" if descending else "ASC"
+    order = f"id {direction}" if field == "id" else f"{expr} {direction}, id {direction}"
+    sql = f"SELECT {select_list or storage.backend.select_list}, {expr} AS sort_value FROM vehiculos WHERE {where} ORDER BY {order}"
+
+    if limit is not None:
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise QueryError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+        # Se pide una fila extra para saber si hay página siguiente
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last["sort_value"], last["id"])
+    return rows, next_cursor
+
+
+# --- ACTUALIZACIÓN MASIVA ---
+
+FILTER_NAMES = set(EQUALITY_FILTERS) | set(RANGE_FILTERS) | set(BOOLEAN_FILTERS)
+
+
+def bulk_update(conn, values, ids=None, filters=None, all_rows=False):
+    """
+    Aplica `values` ({campo: valor}) a todos los vehículos seleccionados con un
+    solo UPDATE. La selección es por lista de ids, por filtros del catálogo
+    (los mismos de build_where) o explícitamente a todos con all_rows=True.
+    Devuelve la cantidad de filas modificadas.
+    """
+    if not values:
+        raise QueryError("No hay campos para actualizar")
+    filters = check_filters(filters or {})
+    if not (ids or filters or all_rows):
+        raise QueryError("Indica ids, filters o all=true")
+
+    set_sql, params = storage.backend.assign(values)
+    where, where_params = build_where(filters or {})
+    if ids:
+        where += f" AND id IN ({', '.join('?' for _ in ids)})"
+        where_params.extend(ids)
+    cur = conn.execute(f"UPDATE vehiculos SET {set_sql} WHERE {where}", params + where_params)
+    return cur.rowcount
@@ -0,0 +1,119 @@
+import asyncio
+import os
+
+import storage
+
+# --- FEED DE CAMBIOS DEL CATÁLOGO ---
+# vehicle_changes tiene una fila por vehículo con la versión de su último
+# cambio. La versión sale de un AUTOINCREMENT: crece siempre (aunque se borren
+# filas) y, como SQLite tiene un solo escritor, el orden de las versiones es el
+# orden de los commits. Un borrado deja la fila con deleted = 1 (tombstone) para
+# que los clientes sepan qué sacar.
+# La mantienen triggers sobre "vehiculos", igual que stats_totals y el índice
+# FTS: formulario, PATCH masivo y scripts quedan registrados (los clics no).
+#
+# GET /api/autos/changes?since=N devuelve solo lo que cambió después de N;
+# con ?wait= espera (long-poll) hasta que haya algo o se acabe el plazo.
+#
+# Los flush de clics van aparte, a counter_changes (misma idea, su propia
+# secuencia): con ?counters_since=M la respuesta trae además id, vistas e
+# interesados de los autos cuyos contadores cambiaron después de M. No
+# despiertan a los long-poll: llegan junto con el próximo cambio o al vencer
+# el plazo.
+
+CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+MAX_WAIT_SECONDS = 60
+# Cada cuánto vuelve a mirar la base un long-poll (cambios de otros workers)
+RECHECK_SECONDS = float(os.getenv("LIONS_CHANGES_RECHECK_MS", "1000")) / 1000
+
+
+def create_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS vehicle_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        vehiculo_id INTEGER NOT NULL UNIQUE,
+        deleted INTEGER NOT NULL DEFAULT 0)''')
+    # Los flush de contadores también son UPDATE: no son un cambio del catálogo
+    # (si no, cada flush despertaría a todos los long-poll). Versiones
+    # anteriores creaban el trigger sin WHEN.
+    conn.execute("DROP TRIGGER IF EXISTS trg_changes_update")
+    when = {"update": f"WHEN {storage.backend.content_changed()}"}
+    # REPLACE borra la fila anterior del vehículo y crea una con versión nueva
+    for event, (alias, deleted) in {"insert": ("NEW", 0), "update": ("NEW", 0), "delete": ("OLD", 1)}.items():
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_changes_{event} AFTER {event.upper()} ON vehiculos {when.get(event, "")}
+            BEGIN INSERT OR REPLACE INTO vehicle_changes (vehiculo_id, deleted) VALUES ({alias}.id, {deleted}); END''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS counter_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        vehiculo_id INTEGER NOT NULL UNIQUE)''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_counter_changes AFTER UPDATE ON vehiculos
+        WHEN ({storage.backend.counters_changed()}) AND NOT ({storage.backend.content_changed()})
+        BEGIN INSERT OR REPLACE INTO counter_changes (vehiculo_id) VALUES (NEW.id); END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_counter_changes_delete AFTER DELETE ON vehiculos
+        BEGIN DELETE FROM counter_changes WHERE vehiculo_id = OLD.id; END''')
+
+    # Base con autos anteriores a la tabla
+    if conn.execute("SELECT 1 FROM vehicle_changes LIMIT 1").fetchone() is None:
+        conn.execute("INSERT INTO vehicle_changes (vehiculo_id) SELECT id FROM vehiculos ORDER BY id")
+
+
+def current_version(conn):
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM vehicle_changes").fetchone()[0]
+
+
+def since(conn, version, select_list, limit=CHANGES_LIMIT):
+    """
+    (rows, latest): cambios con versión > `version` en orden, hasta `limit`.
+    Cada fila trae change_version, vehiculo_id, deleted y las columnas de
+    `select_list` (NULL si el vehículo ya no existe).
+    """
+    # Subconsulta con alias: en formato columnar vehiculos también tiene "version"
+    rows = conn.execute(
+        f"SELECT change_version, vehiculo_id, deleted, {select_list} FROM ("
+        f"SELECT version AS change_version, vehiculo_id, deleted FROM vehicle_changes "
+        f"WHERE version > ? ORDER BY version LIMIT ?) "
+        f"LEFT JOIN vehiculos ON id = vehiculo_id ORDER BY change_version",
+        (version, limit),
+    ).fetchall()
+    return rows, current_version(conn)
+
+
+def current_counters_version(conn):
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM counter_changes").fetchone()[0]
+
+
+def counters_since(conn, version, select_list, limit=CHANGES_LIMIT):
+    """(rows, latest): como since(), para los contadores (autos que siguen existiendo)."""
+    rows = conn.execute(
+        f"SELECT change_version, {select_list} FROM ("
+        f"SELECT version AS change_version, vehiculo_id FROM counter_changes "
+        f"WHERE version > ? ORDER BY version LIMIT ?) "
+        f"JOIN vehiculos ON id = vehiculo_id ORDER BY change_version",
+        (version, limit),
+    ).fetchall()
+    return rows, current_counters_version(conn)
+
+
+class ChangeWaiter:
+    """Despierta a los long-poll de este proceso cuando hay una escritura."""
+
+    def __init__(self):
+        self._loop = None
+        self._event = None
+
+    async def wait(self, timeout):
+        loop = asyncio.get_running_loop()
+        if self._event is None or self._loop is not loop:
+            self._loop, self._event = loop, asyncio.Event()
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def notify(self):
+        """Se puede llamar desde cualquier hilo."""
+        loop, event = self._loop, self._event
+        if event is None or loop.is_closed():
+            return
+        self._event = asyncio.Event()
+        loop.call_soon_threadsafe(event.set)
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+# --- CONTADORES CON ESCRITURA DIFERIDA (vistas / interesados) ---
+# Cada clic solo suma en memoria. Un hilo en segundo plano junta los deltas
+# pendientes y los escribe todos juntos en una sola transacción cada
+# COUNTER_FLUSH_MS milisegundos, o antes si se acumulan COUNTER_FLUSH_EVENTS.
+# Además de los deltas se guarda cada clic con su hora (item_id, campo, ts)
+# para el historial de events.py; ambos se escriben en el mismo flush.
+
+COUNTER_FLUSH_MS = int(os.getenv("LIONS_COUNTER_FLUSH_MS", "2000"))
+COUNTER_FLUSH_EVENTS = int(os.getenv("LIONS_COUNTER_FLUSH_EVENTS", "500"))
+
+COUNTER_FIELDS = ("vistas", "interesados")
+
+
+class CounterBuffer:
+    def __init__(self, flush_fn, interval_ms=COUNTER_FLUSH_MS, max_events=COUNTER_FLUSH_EVENTS):
+        """
+        flush_fn(deltas, events) recibe {item_id: {"vistas": n, "interesados": m}}
+        y la lista de clics [(item_id, campo, ts)] y los persiste.
+        """
+        self.flush_fn = flush_fn
+        self.interval = interval_ms / 1000
+        self.max_events = max_events
+        self._pending = {}
+        self._log = []
+        self._events = 0
+        self._lock = threading.Lock()
+        # Serializa los flush para que dos no escriban el mismo delta
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, item_id, field, amount=1):
+        with self._lock:
+            deltas = self._pending.get(item_id)
+            if deltas is None:
+                deltas = self._pending[item_id] = dict.fromkeys(COUNTER_FIELDS, 0)
+            deltas[field] += amount
+            self._log.append((item_id, field, int(time.time())))
+            self._events += 1
+            if self._events >= self.max_events:
+                self._wake.set()
+            return deltas[field]
+
+    def pending(self, item_id):
+        with self._lock:
+            return dict(self._pending.get(item_id) or {})
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def merge_into(self, car_data):
+        """Suma los deltas aún no escritos a un vehículo leído de la base."""
+        deltas = self._pending.get(car_data.get("id"))
+        if deltas:
+            for field, delta in deltas.items():
+                # Solo los campos presentes (las proyecciones pueden omitirlos)
+                if field in car_data:
+                    car_data[field] = (car_data[field] or 0) + delta
+        return car_data
+
+    def discard(self, item_id=None):
+        """
+        Olvida deltas pendientes (de un vehículo o de todos), p.ej. al resetear
+        métricas. Los clics del historial se conservan.
+        """
+        with self._lock:
+            if item_id is None:
+                self._pending.clear()
+            else:
+                self._pending.pop(item_id, None)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending and not self._log:
+                    return 0
+                batch, self._pending = self._pending, {}
+                log, self._log = self._log, []
+                self._events = 0
+            try:
+                self.flush_fn(batch, log)
+            except Exception:
+                # Devolver los deltas al buffer para reintentar en el próximo ciclo
+                with self._lock:
+                    self._log[:0] = log
+                    for item_id, deltas in batch.items():
+                        current = self._pending.setdefault(item_id, dict.fromkeys(COUNTER_FIELDS, 0))
+                        for field, delta in deltas.items():
+                            current[field] += delta
+                raise
+            return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error guardando contadores: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="counter-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo y escribe lo que quede pendiente."""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
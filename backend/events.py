@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+# --- HISTORIAL DE VISTAS / INTERESADOS ---
+# vehicle_events es un log solo-append (vehiculo_id, tipo, ts) que se escribe
+# en lotes junto con el flush de counters.py. Un hilo compacta cada
+# EVENT_ROLLUP_S segundos lo nuevo en buckets por hora (events_hourly) y por
+# día (events_daily); las consultas por rango leen solo esos buckets, así su
+# costo no crece con la cantidad de clics. reset-metrics no toca el historial.
+#
+# Retención (0 = para siempre):
+#   LIONS_EVENT_RAW_RETENTION_H     clics crudos ya compactados (48 h)
+#   LIONS_EVENT_HOURLY_RETENTION_D  buckets por hora (90 días)
+#   LIONS_EVENT_DAILY_RETENTION_D   buckets por día (para siempre)
+
+EVENT_ROLLUP_S = int(os.getenv("LIONS_EVENT_ROLLUP_S", "60"))
+RAW_RETENTION_H = int(os.getenv("LIONS_EVENT_RAW_RETENTION_H", "48"))
+HOURLY_RETENTION_D = int(os.getenv("LIONS_EVENT_HOURLY_RETENTION_D", "90"))
+DAILY_RETENTION_D = int(os.getenv("LIONS_EVENT_DAILY_RETENTION_D", "0"))
+
+# Tipo de evento -> código guardado (un entero ocupa menos que el texto)
+EVENT_KINDS = {"vistas": 0, "interesados": 1}
+
+GRANULARITIES = {"hour": "events_hourly", "day": "events_daily"}
+
+# Inicio del bucket de cada evento. Los días usan la hora local del servidor
+# (America/Santiago en producción) para que cuadren con el día comercial.
+BUCKET_EXPR = {
+    "events_hourly": "ts / 3600 * 3600",
+    "events_daily": "CAST(strftime('%s', ts, 'unixepoch', 'localtime', 'start of day', 'utc') AS INTEGER)",
+}
+
+
+def create_schema(conn):
+    # AUTOINCREMENT: los id nunca se reutilizan aunque se borren los últimos,
+    # así el avance de event_rollup_state es seguro
+    conn.execute('''CREATE TABLE IF NOT EXISTS vehicle_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, vehiculo_id INTEGER, kind INTEGER, ts INTEGER)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicle_events_ts ON vehicle_events (ts)")
+    for table in GRANULARITIES.values():
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+            bucket INTEGER, vehiculo_id INTEGER, kind INTEGER, count INTEGER,
+            PRIMARY KEY (bucket, vehiculo_id, kind)) WITHOUT ROWID''')
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_vehiculo ON {table} (vehiculo_id, bucket)")
+    # Hasta qué id de vehicle_events ya está sumado en los buckets
+    conn.execute("CREATE TABLE IF NOT EXISTS event_rollup_state (name TEXT PRIMARY KEY, value INTEGER)")
+    conn.execute("INSERT OR IGNORE INTO event_rollup_state (name, value) VALUES ('last_id', 0)")
+
+
+def record(conn, events):
+    """Agrega al log los clics [(item_id, campo, ts)] de un flush de contadores."""
+    conn.executemany(
+        "INSERT INTO vehicle_events (vehiculo_id, kind, ts) VALUES (?, ?, ?)",
+        [(item_id, EVENT_KINDS[field], ts) for item_id, field, ts in events],
+    )
+
+
+def rollup(conn, now=None):
+    """
+    Suma los eventos nuevos a los buckets y aplica la retención. Devuelve
+    cuántos eventos se compactaron. Los buckets se completan con UPSERT, así
+    una hora que sigue abierta se va acumulando en cada pasada.
+    """
+    now = int(now if now is not None else time.time())
+    last = conn.execute("SELECT value FROM event_rollup_state WHERE name = 'last_id'").fetchone()["value"]
+    top = conn.execute("SELECT MAX(id) AS top FROM vehicle_events").fetchone()["top"] or 0
+    compacted = 0
+    if top > last:
+        for table, bucket in BUCKET_EXPR.items():
+            conn.execute(
+                f"INSERT INTO {table} (bucket, vehiculo_id, kind, count) "
+                f"SELECT {bucket}, vehiculo_id, kind, COUNT(*) FROM vehicle_events "
+                f"WHERE id > ? AND id <= ? GROUP BY 1, 2, 3 "
+                f"ON CONFLICT (bucket, vehiculo_id, kind) DO UPDATE SET count = count + excluded.count",
+                (last, top),
+            )
+        conn.execute("UPDATE event_rollup_state SET value = ? WHERE name = 'last_id'", (top,))
+        compacted = top - last
+
+    # Solo se borran crudos ya compactados (id <= top)
+    if RAW_RETENTION_H:
+        conn.execute(
+            "DELETE FROM vehicle_events WHERE ts < ? AND id <= ?", (now - RAW_RETENTION_H * 3600, top)
+        )
+    if HOURLY_RETENTION_D:
+        conn.execute("DELETE FROM events_hourly WHERE bucket < ?", (now - HOURLY_RETENTION_D * 86400,))
+    if DAILY_RETENTION_D:
+        conn.execute("DELETE FROM events_daily WHERE bucket < ?", (now - DAILY_RETENTION_D * 86400,))
+    return compacted
+
+
+def timeseries(conn, granularity, since, until, vehiculo_id=None):
+    """
+    Serie [{bucket, vistas, interesados}] entre since y until (epoch, until
+    excluido), sumando todos los vehículos o solo `vehiculo_id`.
+    """
+    table = GRANULARITIES[granularity]
+    where, params = "bucket >= ? AND bucket < ?", [since, until]
+    if vehiculo_id is not None:
+        where += " AND vehiculo_id = ?"
+        params.append(vehiculo_id)
+    rows = conn.execute(
+        f"SELECT bucket, kind, SUM(count) AS total FROM {table} WHERE {where} GROUP BY bucket, kind ORDER BY bucket",
+        params,
+    ).fetchall()
+    series = {}
+    for row in rows:
+        point = series.get(row["bucket"])
+        if point is None:
+            point = series[row["bucket"]] = {
+                "bucket": datetime.fromtimestamp(row["bucket"]).isoformat(),
+                **dict.fromkeys(EVENT_KINDS, 0),
+            }
+        for field, kind in EVENT_KINDS.items():
+            if row["kind"] == kind:
+                point[field] = row["total"]
+    return list(series.values())
+
+
+def top_vehicles(conn, since, until, field="vistas", limit=10):
+    """Vehículos con más `field` en el rango, desde los buckets diarios."""
+    return conn.execute(
+        "SELECT vehiculo_id, SUM(count) AS total FROM events_daily "
+        "WHERE bucket >= ? AND bucket < ? AND kind = ? GROUP BY vehiculo_id ORDER BY total DESC LIMIT ?",
+        (since, until, EVENT_KINDS[field], limit),
+    ).fetchall()
+
+
+class RollupWorker:
+    """Hilo que llama a rollup() cada `interval` segundos."""
+
+    def __init__(self, writer, interval=EVENT_ROLLUP_S, on_change=None):
+        """writer: la cola de escrituras (writer.WriteQueue) donde corre rollup()."""
+        self.writer = writer
+        self.interval = interval
+        self.on_change = on_change
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        compacted = self.writer.run(rollup)
+        if compacted and self.on_change is not None:
+            self.on_change()
+        return compacted
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error compactando eventos: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="event-rollup", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+import zlib
+
+import catalog_query
+import prices
+import storage
+
+# --- EXPORTACIÓN DEL INVENTARIO (NDJSON / CSV) ---
+# Generadores que leen por keyset (id > último, de a FETCH_SIZE) y van
+# entregando bloques ya codificados: la memoria no depende del tamaño del stock
+# y el primer byte sale de inmediato. Cada lote usa una conexión del pool solo
+# mientras lo lee (filas e historial de precios en la misma); entre un yield y
+# otro no queda nada abierto, así una descarga lenta no ocupa el pool ni deja
+# fija una foto del WAL que impida el checkpoint. Se usan con StreamingResponse.
+
+FETCH_SIZE = 500
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+}
+
+
+def _batches(db, filters, select_list, with_history):
+    """Lotes de filas en orden de id; con with_history, también el historial de cada auto."""
+    where, params = catalog_query.build_where(filters)
+    last_id = 0
+    while True:
+        with db.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {select_list} FROM vehiculos WHERE ({where}) AND id > ? ORDER BY id LIMIT ?",
+                [*params, last_id, FETCH_SIZE],
+            ).fetchall()
+            histories = prices.load(conn, [r["id"] for r in rows]) if with_history and rows else {}
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        yield rows, histories
+        if len(rows) < FETCH_SIZE:
+            return
+
+
+def _decoded(batches, decode):
+    for rows, histories in batches:
+        cars = [decode(row) for row in rows]
+        if histories:
+            for car in cars:
+                car["precioHistorial"] = histories.get(car["id"], [])
+        yield cars
+
+
+def _ndjson_chunks(batches):
+    for cars in batches:
+        yield "".join(json.dumps(car, ensure_ascii=False) + "\n" for car in cars).encode("utf-8")
+
+
+def _csv_chunks(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM para que Excel abra bien los acentos
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    for cars in batches:
+        for car in cars:
+            writer.writerow(
+                json.dumps(car.get(c), ensure_ascii=False) if isinstance(car.get(c), (list, dict)) else car.get(c)
+                for c in columns
+            )
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 => formato gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(db, fmt, filters, columns, decorate=None, compress=False):
+    """
+    Devuelve un generador de bytes con los vehículos que cumplen `filters`.
+    `columns` es la lista de campos a exportar; `decorate` (opcional) completa
+    cada vehículo antes de codificarlo (p.ej. clics aún no escritos).
+    """
+    select_list, decode = storage.backend.projection(columns)
+    if decorate is not None:
+        base_decode = decode
+        decode = lambda row: decorate(base_decode(row))  # noqa: E731
+    batches = _decoded(_batches(db, filters, select_list, "precioHistorial" in columns), decode)
+    if fmt == "csv":
+        chunks = _csv_chunks(batches, ["id"] + [c for c in columns if c != "id"])
+    else:
+        chunks = _ndjson_chunks(batches)
+    return _gzip(chunks) if compress else chunks
@@ -0,0 +1,144 @@
+import catalog_query
+import storage
+
+# --- FACETAS DEL PANEL DE FILTROS ---
+# facet_counts guarda cuántos vehículos hay por valor de cada filtro
+# (marca, combustible, ...) y por tramo de precio / año / km. Igual que
+# stats_totals, la mantienen triggers sobre "vehiculos" (resta la fila vieja,
+# suma la nueva), así que el panel sin filtros sale de unas pocas filas.
+# Con filtros activos se cuenta en SQLite sobre los autos que calzan, y cada
+# faceta ignora su propio filtro: al elegir una marca siguen apareciendo las
+# demás con su cantidad.
+
+FACET_FIELDS = [
+    "marca", "vendedor", "combustible", "transmision", "traccion",
+    "carroceria", "tipoVenta", "neumaticos", "estado",
+]
+
+# campo -> ancho del tramo del histograma
+HISTOGRAMS = {
+    "precio": 2_000_000,
+    "ano": 1,
+    "km": 20_000,
+}
+
+# Filtros de rango que no se aplican al contar el histograma de su campo
+_RANGE_BY_FIELD = {
+    field: {name for name, (f, _) in catalog_query.RANGE_FILTERS.items() if f == field}
+    for field in HISTOGRAMS
+}
+
+
+def _category(field, alias=None):
+    return f"COALESCE({storage.backend.field_expr(field, alias)}, '')"
+
+
+def _bucket(field, alias=None):
+    expr = storage.backend.field_expr(field, alias)
+    width = HISTOGRAMS[field]
+    return f"CAST({expr} / {width} AS INTEGER) * {width}"
+
+
+def _upserts(alias, sign):
+    statements = [
+        f"INSERT INTO facet_counts (facet, value, count) VALUES ('{field}', {_category(field, alias)}, {sign}) "
+        f"ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count;"
+        for field in FACET_FIELDS
+    ]
+    # Sin valor (NULL) no cae en ningún tramo
+    statements += [
+        f"INSERT INTO facet_counts (facet, value, count) SELECT '{field}', {_bucket(field, alias)}, {sign} "
+        f"WHERE {storage.backend.field_expr(field, alias)} IS NOT NULL "
+        f"ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count;"
+        for field in HISTOGRAMS
+    ]
+    return "\n".join(statements)
+
+
+def create_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS facet_counts (
+        facet TEXT, value, count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (facet, value)) WITHOUT ROWID''')
+    # Los flush de contadores también son UPDATE: solo si cambió algún campo contado
+    changed = " OR ".join(
+        f"{storage.backend.field_expr(f, 'OLD')} IS NOT {storage.backend.field_expr(f, 'NEW')}"
+        for f in [*FACET_FIELDS, *HISTOGRAMS]
+    )
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_facets_insert AFTER INSERT ON vehiculos BEGIN {_upserts('NEW', 1)} END")
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS trg_facets_update AFTER UPDATE ON vehiculos WHEN {changed} "
+        f"BEGIN {_upserts('OLD', -1)} {_upserts('NEW', 1)} END"
+    )
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_facets_delete AFTER DELETE ON vehiculos BEGIN {_upserts('OLD', -1)} END")
+
+    # Base con autos anteriores a la tabla
+    if conn.execute("SELECT 1 FROM facet_counts LIMIT 1").fetchone() is None:
+        rebuild(conn)
+
+
+def rebuild(conn):
+    conn.execute("DELETE FROM facet_counts")
+    for field in FACET_FIELDS:
+        conn.execute(
+            f"INSERT INTO facet_counts (facet, value, count) "
+            f"SELECT '{field}', {_category(field)}, COUNT(*) FROM vehiculos GROUP BY 2"
+        )
+    for field in HISTOGRAMS:
+        conn.execute(
+            f"INSERT INTO facet_counts (facet, value, count) "
+            f"SELECT '{field}', {_bucket(field)}, COUNT(*) FROM vehiculos "
+            f"WHERE {storage.backend.field_expr(field)} IS NOT NULL GROUP BY 2"
+        )
+
+
+# --- LECTURA ---
+
+def _format(counts, total):
+    facets = {field: [] for field in FACET_FIELDS}
+    histograms = {field: {"width": width, "buckets": []} for field, width in HISTOGRAMS.items()}
+    for facet, value, count in counts:
+        if count <= 0:
+            continue
+        if facet in histograms:
+            width = histograms[facet]["width"]
+            histograms[facet]["buckets"].append({"from": value, "to": value + width - 1, "count": count})
+        elif facet in facets:
+            facets[facet].append({"value": value, "count": count})
+    for values in facets.values():
+        values.sort(key=lambda v: (-v["count"], str(v["value"])))
+    for histogram in histograms.values():
+        histogram["buckets"].sort(key=lambda b: b["from"])
+    return {"total": total, "facets": facets, "histograms": histograms}
+
+
+def _without(filters, names):
+    return {k: v for k, v in filters.items() if k not in names}
+
+
+def counts(conn, filters=None):
+    """Conteos por faceta y tramos; con `filters` se cuentan sobre los autos que calzan."""
+    filters = filters or {}
+    if not filters:
+        rows = conn.execute("SELECT facet, value, count FROM facet_counts WHERE count > 0").fetchall()
+        total = sum(r["count"] for r in rows if r["facet"] == "estado")
+        return _format([tuple(r) for r in rows], total)
+
+    where, params = catalog_query.build_where(filters)
+    total = conn.execute(f"SELECT COUNT(*) FROM vehiculos WHERE {where}", params).fetchone()[0]
+    rows = []
+    for field in FACET_FIELDS:
+        where, params = catalog_query.build_where(_without(filters, {field}))
+        rows += [
+            (field, r[0], r[1]) for r in conn.execute(
+                f"SELECT {_category(field)}, COUNT(*) FROM vehiculos WHERE {where} GROUP BY 1", params
+            )
+        ]
+    for field in HISTOGRAMS:
+        where, params = catalog_query.build_where(_without(filters, _RANGE_BY_FIELD[field]))
+        rows += [
+            (field, r[0], r[1]) for r in conn.execute(
+                f"SELECT {_bucket(field)}, COUNT(*) FROM vehiculos "
+                f"WHERE {where} AND {storage.backend.field_expr(field)} IS NOT NULL GROUP BY 1", params
+            )
+        ]
+    return _format(rows, total)
@@ -1,7 +1,6 @@
-import sqlite3
-import json
-
-DB_NAME = "lions_cars.db"
+from catalog_query import bulk_update
+from sqlite_pool import get_pool
+from storage import DB_NAME
 
 # Mapeo de correcciones de marcas
 BRAND_CORRECTIONS = {
@@ -14,34 +13,19 @@ BRAND_CORRECTIONS = {
 }
 
 def fix_brands():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Obtener todos los vehículos
-    c.execute("SELECT * FROM vehiculos")
-    rows = c.fetchall()
-    
+    # Agrupar por marca correcta: un UPDATE por destino, todos en la misma transacción
+    targets = {}
+    for wrong, right in BRAND_CORRECTIONS.items():
+        targets.setdefault(right, []).append(wrong)
+
     updated_count = 0
-    
-    for row in rows:
-        car_data = json.loads(row["data"])
-        original_marca = car_data.get("marca", "")
-        
-        # Si la marca necesita corrección
-        if original_marca in BRAND_CORRECTIONS:
-            car_data["marca"] = BRAND_CORRECTIONS[original_marca]
-            
-            # Actualizar en la base de datos
-            c.execute("UPDATE vehiculos SET data = ? WHERE id = ?", 
-                     (json.dumps(car_data), row["id"]))
-            
-            print(f"ID {row['id']}: '{original_marca}' -> '{car_data['marca']}'")
-            updated_count += 1
-    
-    conn.commit()
-    conn.close()
-    
+    with get_pool(DB_NAME).transaction() as conn:
+        for right, wrongs in targets.items():
+            count = bulk_update(conn, {"marca": right}, filters={"marca": wrongs})
+            if count:
+                print(f"{wrongs} -> '{right}': {count} vehículos")
+            updated_count += count
+
     print(f"\n✅ Total de vehículos actualizados: {updated_count}")
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional: sin él solo se guardan los originales
+    Image = None
+
+# --- VARIANTES DE FOTOS (miniaturas / WebP) ---
+# Después de guardar una foto se generan versiones reducidas en un pool de
+# procesos acotado (la codificación usa CPU y no debe competir con las
+# peticiones). Los originales se guardan por contenido (ver uploads.py) y cada
+# variante queda en la misma carpeta, con el hash como nombre y el tamaño antes
+# de la extensión:
+#   blobs/3f/3fa9...e1.jpg -> blobs/3f/3fa9...e1.thumb.webp, 3fa9...e1.thumb.jpg,
+#                             3fa9...e1.medium.webp, 3fa9...e1.medium.jpg
+# Las URLs se registran en la tabla image_variants, por URL del original. Las
+# fotos antiguas (marca_modelo/foto.jpg) siguen la misma regla en su carpeta.
+
+IMAGE_WORKERS = int(os.getenv("LIONS_IMAGE_WORKERS", "2"))
+
+# nombre -> (tamaño, ancho máximo, formato PIL, extensión, calidad)
+VARIANTS = {
+    "thumb": ("thumb", 480, "WEBP", "webp", 75),
+    "thumbJpg": ("thumb", 480, "JPEG", "jpg", 80),
+    "medium": ("medium", 1280, "WEBP", "webp", 80),
+    # JPEG porque el PDF (react-pdf) no soporta WebP
+    "mediumJpg": ("medium", 1280, "JPEG", "jpg", 85),
+}
+
+
+def enabled():
+    return Image is not None
+
+
+def variant_filename(filename, variant):
+    base_name, _ = os.path.splitext(filename)
+    size, _, _, extension, _ = VARIANTS[variant]
+    return f"{base_name}.{size}.{extension}"
+
+
+def build_variants(path):
+    """
+    Corre en un proceso del pool: genera todas las variantes de `path` y
+    devuelve {variante: nombre_de_archivo}. Escribe a un temporal y renombra
+    para que Nginx nunca sirva un archivo a medio escribir.
+    """
+    folder, filename = os.path.split(path)
+    created = {}
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+        for variant, (_, width, fmt, _, quality) in VARIANTS.items():
+            copy = image.copy()
+            copy.thumbnail((width, width * 4))
+            name = variant_filename(filename, variant)
+            tmp_path = os.path.join(folder, f".{name}.part")
+            copy.save(tmp_path, fmt, quality=quality, optimize=True)
+            os.replace(tmp_path, os.path.join(folder, name))
+            created[variant] = name
+    return created
+
+
+def create_schema(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS image_variants (url TEXT PRIMARY KEY, variants TEXT)")
+
+
+class VariantPipeline:
+    """Encola fotos al pool de procesos y mantiene en memoria el índice url -> variantes."""
+
+    def __init__(self, db, writer, on_change=None, workers=IMAGE_WORKERS):
+        """db: pool para leer; writer: cola de escrituras (writer.WriteQueue)."""
+        self.db = db
+        self.writer = writer
+        self.on_change = on_change
+        self.workers = workers
+        self._executor = None
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self.db.connection() as conn:
+            rows = conn.execute("SELECT url, variants FROM image_variants").fetchall()
+        with self._lock:
+            self._index = {r["url"]: json.loads(r["variants"]) for r in rows}
+
+    def get(self, url):
+        return self._index.get(url)
+
+    def attach(self, car_data):
+        """Agrega `imagenesVariantes` (paralela a `imagenes`) a un vehículo."""
+        car_data["imagenesVariantes"] = [self._index.get(u) for u in car_data.get("imagenes") or []]
+        return car_data
+
+    def submit(self, path, public_url):
+        """Programa la generación de variantes; no espera el resultado."""
+        if not enabled():
+            return None
+        with self._lock:
+            if self._executor is None:
+                # forkserver: el servidor tiene hilos (escritor, pool, contadores)
+                # y un fork directo podría copiar un lock tomado y colgar al hijo.
+                # Los hijos salen de un proceso aparte sin hilos, que importa
+                # __main__ una sola vez (no uno por hijo, como spawn).
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver")
+                )
+        future = self._executor.submit(build_variants, path)
+        future.add_done_callback(lambda f: self._done(f, public_url))
+        return future
+
+    def _done(self, future, public_url):
+        try:
+            created = future.result()
+        except Exception as e:
+            print(f"Error generando variantes de {public_url}: {e}")
+            return
+        base_url = public_url.rsplit("/", 1)[0]
+        variants = {v: f"{base_url}/{name}" for v, name in created.items()}
+        with self._lock:
+            self._index[public_url] = variants
+        # Corre en el hilo del pool de procesos: se encola sin esperar el commit
+        try:
+            write = self.writer.submit(
+                lambda conn: conn.execute(
+                    "INSERT OR REPLACE INTO image_variants (url, variants) VALUES (?, ?)",
+                    (public_url, json.dumps(variants)),
+                ),
+                block=False,
+            )
+        except Exception as e:
+            print(f"Error guardando variantes de {public_url}: {e}")
+            self._changed()
+            return
+        write.add_done_callback(lambda f: self._saved(f, public_url))
+
+    def _saved(self, future, public_url):
+        if future.exception() is not None:
+            print(f"Error guardando variantes de {public_url}: {future.exception()}")
+        self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -1,13 +1,65 @@
 import sqlite3
-import shutil
 import os
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+import json
+import logging
+import time
+import asyncio
+import signal
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Depends, Request, Header
 from pydantic import BaseModel
 from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-import json
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+import catalog_query
+import storage
+from response_cache import ResponseCache
+from sqlite_pool import get_pool, PoolTimeout
+from counters import CounterBuffer
+from writer import WriteQueue
+import uploads
+import upload_gc
+import images
+import export
+import stats
+import events
+import search
+import prices
+import changes
+import facets
+import similar
+import auth
+import metrics
+import cache_sync
+
+logger = logging.getLogger("lions")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    counter_buffer.start()
+    event_rollup.start()
+    upload_collector.start()
+    # kill -USR2 <pid> prende/apaga el profiler solo en ese worker
+    if hasattr(signal, "SIGUSR2"):
+        try:
+            signal.signal(signal.SIGUSR2, metrics.toggle_profiler)
+        except ValueError:
+            pass  # fuera del hilo principal (p.ej. TestClient)
+    # uvicorn recién acepta conexiones cuando termina el arranque
+    await prewarm()
+    yield
+    # Escribir los clics que quedaron en memoria antes de apagar
+    counter_buffer.stop()
+    event_rollup.stop()
+    event_rollup.run_once()
+    upload_collector.stop()
+    image_variants.shutdown()
+    # Último: los anteriores todavía escriben a través de la cola
+    db_writer.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CONFIGURACIÓN CORS ---
 app.add_middleware(
@@ -16,15 +68,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Changes-Version", "X-Counters-Version"],
 )
 
-DB_NAME = "lions_cars.db"
+# Latencia / tamaño por ruta para GET /metrics (el último agregado envuelve a todos)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Archivo y formato de la tabla vehiculos (LIONS_DB_NAME / LIONS_STORAGE)
+DB_NAME = storage.DB_NAME
+vehiculos = storage.backend
 # RUTA ABSOLUTA DONDE SE GUARDARÁN LAS FOTOS (Debe coincidir con la config de Nginx)
-UPLOAD_DIR = "/home/neuro/lions-cars-tienda/uploads"
+UPLOAD_DIR = os.getenv("LIONS_UPLOAD_DIR", "/home/neuro/lions-cars-tienda/uploads")
+PUBLIC_UPLOAD_URL = "https://lionscars.cl/uploads"
+
+# Conexiones SQLite compartidas (WAL, mmap, caché); ver sqlite_pool.py
+db = get_pool(DB_NAME)
 
 # Asegurarse de que la carpeta base exista
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Cambios hechos por otros workers / procesos (ver cache_sync.py)
+shared_caches = cache_sync.CacheSync(DB_NAME)
+
+# Respuestas GET ya serializadas; los endpoints que modifican datos invalidan
+# su namespace ("autos", "brands", "colors")
+response_cache = ResponseCache(sync=shared_caches)
+
 # --- MODELOS DE DATOS ---
 
 class Hotspot(BaseModel):
@@ -74,6 +143,47 @@ class Vehiculo(BaseModel):
     precioHistorial: List[dict]
     hotspots: List[Hotspot]
 
+class VehiculoPatch(BaseModel):
+    """Campos a cambiar en una actualización masiva (solo se aplican los enviados)."""
+    marca: Optional[str] = None
+    modelo: Optional[str] = None
+    version: Optional[str] = None
+    ano: Optional[int] = None
+    precio: Optional[int] = None
+    km: Optional[int] = None
+    duenos: Optional[int] = None
+    traccion: Optional[str] = None
+    transmision: Optional[str] = None
+    cilindrada: Optional[str] = None
+    combustible: Optional[str] = None
+    carroceria: Optional[str] = None
+    puertas: Optional[int] = None
+    pasajeros: Optional[int] = None
+    motor: Optional[str] = None
+    techo: Optional[bool] = None
+    asientos: Optional[str] = None
+    tipoVenta: Optional[str] = None
+    vendedor: Optional[str] = None
+    financiable: Optional[bool] = None
+    valorPie: Optional[int] = None
+    aire: Optional[bool] = None
+    neumaticos: Optional[str] = None
+    llaves: Optional[int] = None
+    obs: Optional[str] = None
+    estado: Optional[str] = None
+    diasStock: Optional[int] = None
+    vistas: Optional[int] = None
+    interesados: Optional[int] = None
+    patente: Optional[str] = None
+    color: Optional[str] = None
+    comisionEstimada: Optional[int] = None
+
+class BulkPatch(BaseModel):
+    ids: Optional[List[int]] = None
+    filters: Optional[dict] = None
+    all: bool = False
+    patch: VehiculoPatch
+
 class Brand(BaseModel):
     name: str
 
@@ -91,290 +201,997 @@ class LoginRequest(BaseModel):
     password: str
 
 # --- BASE DE DATOS ---
+# Subir al cambiar _create_schema (tablas, índices, triggers). Si la base ya
+# está en esta versión, el arranque no ejecuta DDL: con varios workers solo el
+# primero crea el esquema y los demás parten directo.
+SCHEMA_VERSION = 9
+
+def _schema_tag():
+    # Los triggers dependen del formato de la tabla vehiculos
+    return f"{SCHEMA_VERSION}:{storage.STORAGE_BACKEND}"
+
+def _schema_current(conn):
+    try:
+        row = conn.execute("SELECT value FROM app_settings WHERE name = 'schema_version'").fetchone()
+    except sqlite3.OperationalError:
+        return False
+    return row is not None and row["value"] == _schema_tag()
+
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
+    with db.connection() as conn:
+        if _schema_current(conn):
+            return
+    with db.transaction() as conn:
+        # Lock de escritura antes de revisar: los workers que arrancan a la vez esperan aquí
+        conn.execute("BEGIN IMMEDIATE")
+        if _schema_current(conn):
+            return
+        _create_schema(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO app_settings (name, value) VALUES ('schema_version', ?)", (_schema_tag(),)
+        )
+
+def _create_schema(conn):
     c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS vehiculos (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT)''')
+    vehiculos.create_schema(conn)
+    images.create_schema(conn)
+    uploads.create_schema(conn)
+    upload_gc.create_schema(conn)
+    stats.create_schema(conn)
+    events.create_schema(conn)
+    search.create_schema(conn)
+    prices.create_schema(conn)
+    changes.create_schema(conn)
+    facets.create_schema(conn)
     c.execute('''CREATE TABLE IF NOT EXISTS brands (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE)''')
     c.execute('''CREATE TABLE IF NOT EXISTS colors (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, hex TEXT)''')
     c.execute('''CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password TEXT, role TEXT)''')
     try:
         c.execute("INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, ?)", ("admin", "admin", "admin"))
     except: pass
-    conn.commit()
-    conn.close()
+    # Después del admin inicial: deja con hash las contraseñas en texto plano
+    auth.create_schema(conn)
+    catalog_query.ensure_indexes(conn)
+    # Al final: pone triggers sobre las tablas anteriores
+    cache_sync.create_schema(conn)
 
 init_db()
 
+# --- SESIONES ---
+with db.transaction() as conn:
+    session_signer = auth.SessionSigner(auth.load_secret(conn))
+# Usuarios borrados / cambiados en otro worker: revisa cada USER_SYNC_SECONDS
+token_cache = auth.TokenCache(sync=shared_caches)
+
+def current_user(authorization: Optional[str] = Header(None)):
+    """
+    Usuario del token "Authorization: Bearer ...". Una sesión ya verificada
+    sale de token_cache sin tocar la base.
+    """
+    if not auth.AUTH_REQUIRED:
+        return None
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Falta iniciar sesión", headers={"WWW-Authenticate": "Bearer"})
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    try:
+        claims = session_signer.verify(token)
+    except auth.InvalidToken as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    with db.connection() as conn:
+        row = conn.execute("SELECT role FROM users WHERE username = ?", (claims["u"],)).fetchone()
+    if row is None:
+        raise HTTPException(status_code=401, detail="Usuario no existe", headers={"WWW-Authenticate": "Bearer"})
+    user = {"username": claims["u"], "role": row["role"], "exp": claims["exp"]}
+    token_cache.put(token, user)
+    return user
+
+def require_admin(user: Optional[dict] = Depends(current_user)):
+    if user is not None and user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Solo para administradores")
+    return user
+
+# Todas las escrituras pasan por un único hilo escritor (ver writer.py)
+db_writer = WriteQueue(db)
+
+def _flush_counters(batch, log):
+    """Escribe los deltas de vistas/interesados y el historial de clics en una sola transacción."""
+    def write(conn):
+        conn.executemany(
+            f"UPDATE vehiculos SET {vehiculos.increment(('vistas', 'interesados'))} WHERE id = :id",
+            [{**d, "id": item_id} for item_id, d in batch.items()],
+        )
+        events.record(conn, log)
+    db_writer.run(write)
+    # Las respuestas cacheadas traen los clics pendientes al construirse: ya
+    # escritos, hay que reconstruirlas (una vez por intervalo de flush)
+    if batch:
+        response_cache.invalidate("autos")
+
+counter_buffer = CounterBuffer(_flush_counters)
+
+# Compacta el historial de clics en buckets por hora / día
+event_rollup = events.RollupWorker(db_writer, on_change=lambda: response_cache.invalidate("events"))
+
+# Miniaturas/WebP generadas en un pool de procesos después de cada subida
+image_variants = images.VariantPipeline(db, db_writer, on_change=lambda: response_cache.invalidate("autos"))
+image_variants.load()
+
+# Fotos que ningún auto usa: cuarentena y después se borran (ver upload_gc.py)
+upload_collector = upload_gc.UploadCollector(db, db_writer, UPLOAD_DIR, PUBLIC_UPLOAD_URL)
+
+# Long-poll de /api/autos/changes esperando una escritura
+change_waiter = changes.ChangeWaiter()
+
+# Autos parecidos (NumPy si está instalado); se pone al día con el feed de cambios
+similar_index = similar.SimilarIndex(db, sync=shared_caches)
+
+def _on_shared_change(changed):
+    """Cambios hechos por otro proceso en lo que este worker tiene en memoria."""
+    if "images" in changed:
+        image_variants.load()
+        response_cache.bump("autos")
+    if "users" in changed:
+        token_cache.forget_user()
+    if "autos" in changed:
+        change_waiter.notify()
+
+shared_caches.subscribe(_on_shared_change)
+
+metrics.register_gauge("lions_db_pool_connections_open", "Conexiones abiertas del pool", lambda: db.stats()["opened"])
+metrics.register_gauge("lions_db_pool_connections_idle", "Conexiones libres del pool", lambda: db.stats()["idle"])
+metrics.register_gauge("lions_db_write_queue_pending", "Escrituras esperando al hilo escritor", db_writer.pending)
+metrics.register_gauge("lions_counter_pending_vehicles", "Vehículos con clics aún no escritos", counter_buffer.pending_count)
+
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": "Servidor ocupado, intenta de nuevo"})
+
 # --- ENDPOINTS ---
 
 # NUEVO ENDPOINT PARA SUBIR IMÁGENES
-@app.post("/api/upload")
+async def _save_upload(file: UploadFile):
+    """
+    Copia la foto a disco (por contenido, ver uploads.py) en un hilo de trabajo
+    y devuelve la URL pública. Si la foto ya existía no se escribe nada nuevo.
+    """
+    try:
+        digest, relpath, size, created = await run_in_threadpool(
+            uploads.store_blob, file.file, UPLOAD_DIR, file.filename
+        )
+    finally:
+        await file.close()
+    if not created:
+        # Ya existía: que la limpieza de huérfanas no la borre antes de que se use
+        await run_in_threadpool(upload_gc.touch, UPLOAD_DIR, relpath)
+
+    def register(conn):
+        uploads.register_blob(conn, digest, relpath, size)
+        if not created:
+            upload_gc.keep(conn, relpath)
+    await db_writer.run_async(register)
+    # Nginx mapea /uploads/ -> UPLOAD_DIR
+    public_url = f"{PUBLIC_UPLOAD_URL}/{relpath}"
+    if created:
+        image_variants.submit(os.path.join(UPLOAD_DIR, relpath), public_url)
+    return public_url
+
+@app.post("/api/upload", dependencies=[Depends(current_user)])
 async def upload_image(
     file: UploadFile = File(...), 
-    marca: str = Form(...), 
-    modelo: str = Form(...)
+    marca: str = Form(""), 
+    modelo: str = Form("")
 ):
     """
-    Recibe un archivo + marca + modelo.
-    Guarda el archivo en: /uploads/marca_modelo/filename.ext
+    Recibe un archivo (+ marca y modelo, que ya no se usan para la ruta).
+    Guarda el archivo en: /uploads/blobs/xx/<sha256>.ext
     Devuelve la URL pública.
     """
     try:
-        # 1. Limpiar nombres para crear carpeta (ej: "Toyota Corolla" -> "toyota_corolla")
-        clean_folder = f"{marca.strip()}_{modelo.strip()}".lower().replace(" ", "_")
-        
-        # 2. Crear la ruta completa de la carpeta
-        target_folder = os.path.join(UPLOAD_DIR, clean_folder)
-        os.makedirs(target_folder, exist_ok=True) # Crea la carpeta si no existe
-
-        # 3. Manejo de nombre de archivo y duplicados
-        filename = file.filename.replace(" ", "_") # Quitar espacios del nombre del archivo
-        file_location = os.path.join(target_folder, filename)
-
-        # Si el archivo ya existe, le agregamos un número (ej: auto_1.jpg)
-        base_name, extension = os.path.splitext(filename)
-        counter = 1
-        while os.path.exists(file_location):
-            filename = f"{base_name}_{counter}{extension}"
-            file_location = os.path.join(target_folder, filename)
-            counter += 1
-
-        # 4. Guardar el archivo físicamente
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 5. Generar la URL pública (HTTPS)
-        # Nginx mapea /uploads/ -> UPLOAD_DIR
-        public_url = f"https://lionscars.cl/uploads/{clean_folder}/{filename}"
-        
-        return {"url": public_url}
-
+        return {"url": await _save_upload(file)}
+    except uploads.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         print(f"Error subiendo imagen: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/upload/batch", dependencies=[Depends(current_user)])
+async def upload_images(
+    files: List[UploadFile] = File(...),
+    marca: str = Form(""),
+    modelo: str = Form("")
+):
+    """
+    Sube una galería completa en una sola petición. Las fotos se guardan en
+    paralelo (hasta uploads.BATCH_CONCURRENCY a la vez). Devuelve las URLs en el
+    mismo orden de `files`; las que fallan quedan en null y se listan en `errors`.
+    """
+    semaphore = asyncio.Semaphore(uploads.BATCH_CONCURRENCY)
+
+    async def save(file):
+        async with semaphore:
+            return await _save_upload(file)
+
+    results = await asyncio.gather(*(save(f) for f in files), return_exceptions=True)
+    urls, errors = [], []
+    for file, result in zip(files, results):
+        if isinstance(result, BaseException):
+            print(f"Error subiendo imagen {file.filename}: {result}")
+            urls.append(None)
+            errors.append({"filename": file.filename, "detail": str(result)})
+        else:
+            urls.append(result)
+    return {"urls": urls, "errors": errors}
+
+
+@app.get("/api/upload/{sha256}", dependencies=[Depends(current_user)])
+def find_upload(sha256: str):
+    """
+    Permite al cliente saltarse la subida: si ya tenemos una foto con ese
+    SHA-256 devuelve su URL, si no 404. Solo lectura: una foto marcada como
+    huérfana también da 404, así el cliente la sube y es la subida (dedup) la
+    que la saca de la limpieza.
+    """
+    with db.connection() as conn:
+        relpath = uploads.find_blob(conn, sha256.lower())
+        if relpath and upload_gc.is_orphan(conn, relpath):
+            relpath = None
+    if not relpath:
+        raise HTTPException(status_code=404, detail="Foto no encontrada")
+    return {"url": f"{PUBLIC_UPLOAD_URL}/{relpath}"}
+
+
+@app.get("/api/admin/uploads", dependencies=[Depends(require_admin)])
+def get_upload_usage():
+    """
+    Espacio usado en UPLOAD_DIR por carpeta: total, fotos huérfanas, en
+    cuarentena y bytes recuperables (según la última pasada de limpieza).
+    """
+    with db.connection() as conn:
+        return upload_gc.report(conn)
+
+@app.post("/api/admin/uploads/gc", dependencies=[Depends(require_admin)])
+async def run_upload_gc():
+    """Pasada de limpieza inmediata (recorre carpetas cambiadas y aplica plazos)."""
+    result = await run_in_threadpool(upload_collector.run_once)
+    return {**result, "report": await run_in_threadpool(get_upload_usage)}
+
 
 # 1. AUTOS
+def catalog_filters(
+    marca: Optional[List[str]] = Query(None),
+    vendedor: Optional[List[str]] = Query(None),
+    combustible: Optional[List[str]] = Query(None),
+    transmision: Optional[List[str]] = Query(None),
+    traccion: Optional[List[str]] = Query(None),
+    carroceria: Optional[List[str]] = Query(None),
+    tipoVenta: Optional[List[str]] = Query(None),
+    neumaticos: Optional[List[str]] = Query(None),
+    estado: Optional[List[str]] = Query(None),
+    anoMin: Optional[int] = None,
+    anoMax: Optional[int] = None,
+    precioMin: Optional[int] = None,
+    precioMax: Optional[int] = None,
+    kmMin: Optional[int] = None,
+    kmMax: Optional[int] = None,
+    duenosMax: Optional[int] = None,
+    financiable: Optional[bool] = None,
+    aire: Optional[bool] = None,
+):
+    """Filtros del catálogo (mismos que el panel lateral de App.tsx)."""
+    return {k: v for k, v in locals().items() if v is not None}
+
+VEHICULO_FIELDS = set(Vehiculo.__fields__) | {"imagenesVariantes"}
+
+def parse_fields(fields: Optional[str] = None, view: Optional[str] = None):
+    """
+    Proyección pedida por el cliente: ?view=summary (campos de listado, ver
+    storage.SUMMARY_FIELDS) o ?fields=marca,modelo,precio. None = todo.
+    """
+    if view is not None and view not in ("summary", "full"):
+        raise HTTPException(status_code=400, detail=f"view no soportada: {view}")
+    if fields:
+        wanted = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = set(wanted) - VEHICULO_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(sorted(unknown))}")
+        return wanted
+    if view == "summary":
+        return list(storage.SUMMARY_FIELDS) + ["imagenesVariantes"]
+    return None
+
+def _car_response(car_data, fields):
+    """Completa un vehículo leído de la base: clics pendientes y variantes de fotos."""
+    car_data = counter_buffer.merge_into(car_data)
+    if fields is None or "imagenesVariantes" in fields:
+        image_variants.attach(car_data)
+    return car_data
+
+def _with_history(conn, cars, fields):
+    """`precioHistorial` sale de price_history (ver prices.py), no del documento."""
+    if fields is None or "precioHistorial" in fields:
+        prices.attach(conn, cars)
+    return cars
+
+def _read_fields(fields):
+    # imagenesVariantes se arma con `imagenes`, que entonces hay que leer
+    if fields is not None and "imagenesVariantes" in fields:
+        return [f for f in fields if f != "imagenesVariantes"] + ["imagenes"]
+    return fields
+
 @app.get("/api/autos")
-def get_autos():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM vehiculos")
-    rows = c.fetchall()
-    conn.close()
-    
-    results = []
-    for row in rows:
+def get_autos(
+    request: Request,
+    filters: dict = Depends(catalog_filters),
+    sort: str = "id",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = Depends(parse_fields),
+):
+    """
+    Lista de vehículos filtrada y ordenada dentro de SQLite.
+    Sin parámetros devuelve todo el stock (compatibilidad con el frontend).
+    X-Changes-Version es el `since` para pedir después solo los cambios
+    (GET /api/autos/changes) y X-Counters-Version su `counters_since`.
+    Con ?limit= pagina por keyset: el cursor de la siguiente página viene en
+    el header X-Next-Cursor y se envía de vuelta como ?cursor=.
+    La respuesta se cachea ya serializada por query string (ETag / 304); los
+    clics aún no escritos se suman al construirla y la caché se invalida en
+    cada flush de contadores.
+    ?view=summary o ?fields=a,b,c devuelven solo esos campos; en el formato
+    json el resumen está precalculado y no se parsea el documento completo.
+    """
+    def build():
+        select_list, decode = vehiculos.projection(_read_fields(fields))
+        try:
+            with db.connection() as conn:
+                # Antes de la lista: a lo más el cliente recibe de nuevo algo que ya tiene
+                version = changes.current_version(conn)
+                counters_version = changes.current_counters_version(conn)
+                rows, next_cursor = catalog_query.search(conn, filters, sort, limit, cursor, select_list)
+                results = []
+                for row in rows:
+                    try:
+                        car = decode(row)
+                    except ValueError as e:
+                        # Documento corrupto en la base: se omite del listado, pero queda registrado
+                        print(f"Error leyendo vehículo {row['id']}: {e}")
+                        continue
+                    car_data = _car_response(car, fields)
+                    if fields is not None and "imagenes" not in fields:
+                        car_data.pop("imagenes", None)
+                    results.append(car_data)
+                _with_history(conn, results, fields)
+        except catalog_query.QueryError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        headers = {"X-Changes-Version": str(version), "X-Counters-Version": str(counters_version)}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return results, headers
+
+    entry = response_cache.get_or_build("autos", request.url.query, build)
+    return entry.to_response(request)
+
+@app.get("/api/autos/export", dependencies=[Depends(current_user)])
+def export_autos(
+    filters: dict = Depends(catalog_filters),
+    format: str = "ndjson",
+    gzip: bool = False,
+    fields: Optional[List[str]] = Depends(parse_fields),
+):
+    """
+    Exporta el inventario (NDJSON o CSV, opcionalmente gzip) en streaming.
+    Acepta los mismos filtros que GET /api/autos y ?fields= para elegir columnas.
+    """
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {format}")
+    columns = [f for f in (fields or Vehiculo.__fields__) if f not in ("id", "imagenesVariantes")]
+    media_type, extension = export.FORMATS[format]
+    filename = f"inventario.{extension}"
+    if gzip:
+        media_type, filename = "application/gzip", filename + ".gz"
+    chunks = export.iter_export(db, format, filters, columns, counter_buffer.merge_into, gzip)
+    return StreamingResponse(
+        chunks, media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/api/autos/search")
+def search_autos(
+    request: Request,
+    q: str = "",
+    filters: dict = Depends(catalog_filters),
+    limit: int = Query(search.SEARCH_LIMIT, ge=1, le=catalog_query.MAX_PAGE_SIZE),
+    fields: Optional[List[str]] = Depends(parse_fields),
+):
+    """
+    Búsqueda de texto (marca, modelo, versión, motor, color, patente, obs, año)
+    sin importar tildes ni mayúsculas, ordenada por relevancia. Acepta los
+    mismos filtros que GET /api/autos.
+    """
+    def build():
+        select_list, decode = vehiculos.projection(_read_fields(fields))
+        try:
+            with db.connection() as conn:
+                rows = search.search(conn, q, select_list, filters, limit)
+                results = []
+                for row in rows:
+                    car_data = _car_response(decode(row), fields)
+                    if fields is not None and "imagenes" not in fields:
+                        car_data.pop("imagenes", None)
+                    results.append(car_data)
+                _with_history(conn, results, fields)
+        except catalog_query.QueryError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return results, {}
+
+    return response_cache.get_or_build("autos", f"search:{request.url.query}", build).to_response(request)
+
+@app.get("/api/autos/suggest")
+def suggest_autos(request: Request, q: str = "", limit: int = Query(search.SUGGEST_LIMIT, ge=1, le=50)):
+    """Autocompletado del buscador: "marca modelo" que empiezan con lo escrito."""
+    def build():
+        with db.connection() as conn:
+            return search.suggest(conn, q, limit), {}
+    return response_cache.get_or_build("autos", f"suggest:{request.url.query}", build).to_response(request)
+
+@app.get("/api/autos/facets")
+def get_facets(request: Request, filters: dict = Depends(catalog_filters)):
+    """
+    Cantidad de autos por opción de cada filtro del panel (marca, vendedor,
+    combustible, ...) y tramos de precio / año / km. Con los mismos filtros
+    de GET /api/autos cuenta sobre los que calzan; cada faceta ignora su
+    propio filtro para mostrar las alternativas.
+    """
+    def build():
+        with db.connection() as conn:
+            return facets.counts(conn, filters), {}
+    return response_cache.get_or_build("autos", f"facets:{request.url.query}", build).to_response(request)
+
+@app.get("/api/autos/changes")
+async def get_changes(
+    since: int = Query(0, ge=0),
+    wait: float = Query(0, ge=0, le=changes.MAX_WAIT_SECONDS),
+    limit: int = Query(changes.CHANGES_LIMIT, ge=1, le=changes.MAX_CHANGES_LIMIT),
+    fields: Optional[List[str]] = Depends(parse_fields),
+    counters_since: Optional[int] = Query(None, ge=0),
+):
+    """
+    Vehículos creados/modificados (`changed`, completos o con ?fields=/?view=)
+    y borrados (`deleted`, solo ids) después de la versión `since`. `version`
+    es el próximo `since`; con `more` hay que volver a pedir de inmediato. Si
+    `since` es mayor que la última versión (base restaurada) viene `reset` y
+    hay que recargar todo. ?wait=N espera hasta N segundos a que haya cambios.
+    Con ?counters_since=M trae además `counters` (id, vistas, interesados de
+    los autos con clics escritos después de M) y `countersVersion`, el próximo
+    counters_since (GET /api/autos lo entrega en X-Counters-Version). Los
+    contadores solos no cortan la espera.
+    """
+    def read():
+        select_list, decode = vehiculos.projection(_read_fields(fields))
+        counter_list, counter_decode = vehiculos.projection(list(storage.SERVER_FIELDS))
+        with db.connection() as conn:
+            rows, latest = changes.since(conn, since, select_list, limit)
+            changed = [_car_response(decode(r), fields) for r in rows if not r["deleted"]]
+            _with_history(conn, changed, fields)
+            if counters_since is not None:
+                counter_rows, counters_latest = changes.counters_since(conn, counters_since, counter_list, limit)
+        if fields is not None and "imagenes" not in fields:
+            for car_data in changed:
+                car_data.pop("imagenes", None)
+        if since > latest or (counters_since is not None and counters_since > counters_latest):
+            result = {"version": latest, "reset": True, "more": False, "changed": [], "deleted": []}
+            if counters_since is not None:
+                result.update(counters=[], countersVersion=counters_latest)
+            return result
+        version = rows[-1]["change_version"] if rows else since
+        result = {
+            "version": version,
+            "reset": False,
+            "more": version < latest,
+            "changed": changed,
+            "deleted": [r["vehiculo_id"] for r in rows if r["deleted"]],
+        }
+        if counters_since is not None:
+            counters_version = counter_rows[-1]["change_version"] if counter_rows else counters_since
+            result["counters"] = [counter_buffer.merge_into(counter_decode(r)) for r in counter_rows]
+            result["countersVersion"] = counters_version
+            result["more"] = result["more"] or counters_version < counters_latest
+        return result
+
+    deadline = time.monotonic() + wait
+    while True:
+        result = await run_in_threadpool(read)
+        remaining = deadline - time.monotonic()
+        if result["changed"] or result["deleted"] or result["reset"] or remaining <= 0:
+            return result
+        await change_waiter.wait(min(remaining, changes.RECHECK_SECONDS))
+
+@app.get("/api/autos/price-drops")
+def get_price_drops(
+    request: Request,
+    days: int = Query(prices.DROP_DAYS, ge=0, le=3650),
+    sort: str = "descuento",
+    limit: int = Query(prices.DROPS_LIMIT, ge=1, le=prices.MAX_DROPS_LIMIT),
+    filters: dict = Depends(catalog_filters),
+):
+    """
+    Autos cuyo último cambio de precio fue una baja dentro de los últimos
+    `days` días (0 = sin límite), con mayor % de descuento (o ?sort=fecha,
+    más recientes) primero. Cada uno trae el resumen del listado y `ultimoCambio`.
+    """
+    # Fechas en UTC, igual que date('now') de los triggers
+    since = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat() if days else None
+
+    def build():
+        fields = list(storage.SUMMARY_FIELDS)
+        select_list, decode = vehiculos.projection(fields)
         try:
-            car_data = json.loads(row["data"])
-            car_data["id"] = row["id"]
-            results.append(car_data)
-        except:
-            continue
-    return results
-
-@app.post("/api/autos")
+            with db.connection() as conn:
+                rows = prices.recent_drops(conn, select_list, since, filters, sort, limit)
+        except catalog_query.QueryError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return [{**_car_response(decode(row), fields), "ultimoCambio": prices.latest_change(row)} for row in rows], {}
+
+    key = f"price-drops:{since}:{request.url.query}"
+    return response_cache.get_or_build("autos", key, build).to_response(request)
+
+@app.get("/api/autos/{item_id}/price-history")
+def get_price_history(item_id: int):
+    """Todos los cambios de precio de un vehículo y el último (con % de baja)."""
+    with db.connection() as conn:
+        result = prices.history(conn, item_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Vehículo no encontrado")
+    return result
+
+@app.get("/api/autos/{item_id}/similar")
+def get_similar(
+    item_id: int,
+    limit: int = Query(similar.SIMILAR_LIMIT, ge=1, le=similar.MAX_SIMILAR_LIMIT),
+    vendidos: bool = False,
+):
+    """
+    Los `limit` autos más parecidos (precio, año, km, carrocería, combustible,
+    transmisión y marca), el más cercano primero, con el resumen del listado
+    y su `distancia`. Los vendidos solo aparecen con ?vendidos=true.
+    """
+    nearest = similar_index.similar(item_id, limit, include_sold=vendidos)
+    if nearest is None:
+        raise HTTPException(status_code=404, detail="Vehículo no encontrado")
+    fields = list(storage.SUMMARY_FIELDS)
+    select_list, decode = vehiculos.projection(fields)
+    with db.connection() as conn:
+        rows = conn.execute(
+            f"SELECT {select_list} FROM vehiculos WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps([i for i, _ in nearest]),),
+        ).fetchall()
+    cars = {car["id"]: car for car in map(decode, rows)}
+    return [
+        {**_car_response(cars[i], fields), "distancia": round(distance, 4)}
+        for i, distance in nearest if i in cars
+    ]
+
+@app.get("/api/autos/{item_id}")
+def get_auto(item_id: int, fields: Optional[List[str]] = Depends(parse_fields)):
+    """Un vehículo con todos sus campos (o los de ?fields=), incluidos los pesados."""
+    select_list, decode = vehiculos.projection(_read_fields(fields))
+    with db.connection() as conn:
+        row = conn.execute(f"SELECT {select_list} FROM vehiculos WHERE id = ?", (item_id,)).fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Vehículo no encontrado")
+        car_data = _car_response(decode(row), fields)
+        _with_history(conn, [car_data], fields)
+    if fields is not None and "imagenes" not in fields:
+        car_data.pop("imagenes", None)
+    return car_data
+
+@app.post("/api/autos", dependencies=[Depends(current_user)])
 def create_auto(auto: Vehiculo):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
     # Ahora 'auto.imagenes' ya debe venir con URLs reales desde el frontend
-    json_data = auto.json(exclude={"id"})
-    c.execute("INSERT INTO vehiculos (data) VALUES (?)", (json_data,))
-    new_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    def insert(conn):
+        # El historial va a price_history, no dentro del documento
+        new_id = vehiculos.insert(conn, auto.dict(exclude={"id", "precioHistorial"}))
+        prices.import_history(conn, new_id, auto.precioHistorial)
+        uploads.sync_vehicle_refs(conn, new_id, auto.imagenes + [auto.imagen])
+        return new_id
+    new_id = db_writer.run(insert)
+    response_cache.invalidate("autos")
     return {**auto.dict(), "id": new_id}
 
-@app.put("/api/autos/{item_id}")
+@app.put("/api/autos/{item_id}", dependencies=[Depends(current_user)])
 def update_auto(item_id: int, auto: Vehiculo):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    json_data = auto.json(exclude={"id"})
-    c.execute("UPDATE vehiculos SET data = ? WHERE id = ?", (json_data, item_id))
-    conn.commit()
-    conn.close()
-    return {**auto.dict(), "id": item_id}
+    def update(conn):
+        # vistas/interesados los lleva el servidor: se conservan los guardados
+        # para no pisar clics que el formulario no conocía
+        # precioHistorial lo lleva price_history: un cambio de precio lo agrega el trigger
+        if not vehiculos.update(conn, item_id, auto.dict(exclude={"id", "precioHistorial"})):
+            # Antes de sync_vehicle_refs: no dejar fotos enlazadas a un auto inexistente
+            raise HTTPException(status_code=404, detail="Vehículo no encontrado")
+        uploads.sync_vehicle_refs(conn, item_id, auto.imagenes + [auto.imagen])
+        row = conn.execute(
+            f"SELECT {vehiculos.field_expr('vistas')} AS vistas, {vehiculos.field_expr('interesados')} AS interesados FROM vehiculos WHERE id = ?",
+            (item_id,),
+        ).fetchone()
+        return row, prices.load(conn, [item_id])[item_id]
+    row, history = db_writer.run(update)
+    response_cache.invalidate("autos")
+    result = {**auto.dict(), "id": item_id}
+    if row:
+        result.update(vistas=row["vistas"], interesados=row["interesados"], precioHistorial=history)
+    return counter_buffer.merge_into(result)
 
-@app.delete("/api/autos/{item_id}")
+@app.delete("/api/autos/{item_id}", dependencies=[Depends(current_user)])
 def delete_auto(item_id: int):
-    # Opcional: Aquí podrías agregar lógica para borrar también las fotos del disco si quisieras
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM vehiculos WHERE id = ?", (item_id,))
-    conn.commit()
-    conn.close()
+    # Las fotos quedan en disco: upload_collector las borra cuando ningún auto las usa
+    def delete(conn):
+        conn.execute("DELETE FROM vehiculos WHERE id = ?", (item_id,))
+        uploads.sync_vehicle_refs(conn, item_id, [])
+    db_writer.run(delete)
+    counter_buffer.discard(item_id)
+    response_cache.invalidate("autos")
     return {"message": "Eliminado"}
 
+def bulk_patch_autos(values, ids=None, filters=None, all_rows=False):
+    """Un solo UPDATE sobre el conjunto elegido, en una transacción corta."""
+    if values.keys() & set(storage.SERVER_FIELDS):
+        # Escribir antes los clics pendientes para que el nuevo valor los reemplace
+        counter_buffer.flush()
+    try:
+        updated = db_writer.run(catalog_query.bulk_update, values, ids, filters, all_rows)
+    except catalog_query.QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response_cache.invalidate("autos")
+    return updated
+
+@app.patch("/api/autos", dependencies=[Depends(current_user)])
+def bulk_update_autos(body: BulkPatch):
+    """
+    Actualización masiva: aplica `patch` a los vehículos elegidos por `ids`,
+    por `filters` (mismos nombres que los filtros de GET /api/autos) o a todos
+    con "all": true. Ej: marcar como Vendido, reasignar vendedor, normalizar marca.
+    """
+    values = body.patch.dict(exclude_unset=True)
+    updated = bulk_patch_autos(values, body.ids, body.filters, body.all)
+    return {"updated": updated}
+
 # 2. CONFIGURACIÓN (Marcas, Colores, Usuarios)
 @app.get("/api/brands")
-def get_brands():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute("SELECT * FROM brands").fetchall()
-    conn.close()
-    return [{"id": r["id"], "name": r["name"]} for r in rows]
-
-@app.post("/api/brands")
+def get_brands(request: Request):
+    def build():
+        with db.connection() as conn:
+            rows = conn.execute("SELECT * FROM brands").fetchall()
+        return [{"id": r["id"], "name": r["name"]} for r in rows], {}
+    return response_cache.get_or_build("brands", "", build).to_response(request)
+
+@app.post("/api/brands", dependencies=[Depends(current_user)])
 def create_brand(brand: Brand):
-    conn = sqlite3.connect(DB_NAME)
     try:
-        conn.execute("INSERT INTO brands (name) VALUES (?)", (brand.name,))
-        conn.commit()
-    except: pass
-    conn.close()
+        db_writer.run(lambda conn: conn.execute("INSERT INTO brands (name) VALUES (?)", (brand.name,)))
+    except sqlite3.IntegrityError: pass
+    response_cache.invalidate("brands")
     return {"message": "OK"}
 
-@app.delete("/api/brands/{id}")
+@app.delete("/api/brands/{id}", dependencies=[Depends(current_user)])
 def delete_brand(id: int):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("DELETE FROM brands WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
+    db_writer.run(lambda conn: conn.execute("DELETE FROM brands WHERE id=?", (id,)))
+    response_cache.invalidate("brands")
     return {"message": "Deleted"}
 
 @app.get("/api/colors")
-def get_colors():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute("SELECT * FROM colors").fetchall()
-    conn.close()
-    return [{"id": r["id"], "name": r["name"], "hex": r["hex"]} for r in rows]
-
-@app.post("/api/colors")
+def get_colors(request: Request):
+    def build():
+        with db.connection() as conn:
+            rows = conn.execute("SELECT * FROM colors").fetchall()
+        return [{"id": r["id"], "name": r["name"], "hex": r["hex"]} for r in rows], {}
+    return response_cache.get_or_build("colors", "", build).to_response(request)
+
+@app.post("/api/colors", dependencies=[Depends(current_user)])
 def create_color(color: Color):
-    conn = sqlite3.connect(DB_NAME)
     try:
-        conn.execute("INSERT INTO colors (name, hex) VALUES (?, ?)", (color.name, color.hex))
-        conn.commit()
-    except: pass
-    conn.close()
+        db_writer.run(lambda conn: conn.execute("INSERT INTO colors (name, hex) VALUES (?, ?)", (color.name, color.hex)))
+    except sqlite3.IntegrityError: pass
+    response_cache.invalidate("colors")
     return {"message": "OK"}
 
-@app.delete("/api/colors/{id}")
+@app.delete("/api/colors/{id}", dependencies=[Depends(current_user)])
 def delete_color(id: int):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("DELETE FROM colors WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
+    db_writer.run(lambda conn: conn.execute("DELETE FROM colors WHERE id=?", (id,)))
+    response_cache.invalidate("colors")
     return {"message": "Deleted"}
 
-@app.get("/api/users")
+@app.get("/api/users", dependencies=[Depends(require_admin)])
 def get_users():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute("SELECT id, username, role FROM users").fetchall()
-    conn.close()
+    with db.connection() as conn:
+        rows = conn.execute("SELECT id, username, role FROM users").fetchall()
     return [{"id": r["id"], "username": r["username"], "role": r["role"]} for r in rows]
 
-@app.post("/api/users")
-def create_user(user: User):
-    conn = sqlite3.connect(DB_NAME)
+@app.post("/api/users", dependencies=[Depends(require_admin)])
+async def create_user(user: User):
+    # scrypt en HASH_POOL: no bloquea el event loop
+    password = await asyncio.get_running_loop().run_in_executor(auth.HASH_POOL, auth.hash_password, user.password)
     try:
-        conn.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (user.username, user.password, user.role))
-        conn.commit()
-    except: pass
-    conn.close()
+        await db_writer.run_async(
+            lambda conn: conn.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (user.username, password, user.role))
+        )
+    except sqlite3.IntegrityError: pass
     return {"message": "OK"}
 
-@app.delete("/api/users/{id}")
+@app.delete("/api/users/{id}", dependencies=[Depends(require_admin)])
 def delete_user(id: int):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("DELETE FROM users WHERE id=?", (id,))
-    conn.commit()
-    conn.close()
+    def delete(conn):
+        row = conn.execute("SELECT username FROM users WHERE id=?", (id,)).fetchone()
+        conn.execute("DELETE FROM users WHERE id=?", (id,))
+        return row
+    row = db_writer.run(delete)
+    if row:
+        # Sus sesiones dejan de valer de inmediato en este proceso
+        token_cache.forget_user(row["username"])
     return {"message": "Deleted"}
 
+# Hash de relleno: un usuario inexistente tarda lo mismo que una clave incorrecta
+_DUMMY_HASH = auth.hash_password(os.urandom(16).hex())
+
 @app.post("/api/login")
-def login(creds: LoginRequest):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE username = ? AND password = ?", (creds.username, creds.password))
-    user = c.fetchone()
-    conn.close()
-    if user:
-        return {"status": "ok", "role": user["role"]}
+async def login(creds: LoginRequest):
+    def find_user():
+        with db.connection() as conn:
+            return conn.execute("SELECT username, password, role FROM users WHERE username = ?", (creds.username,)).fetchone()
+    user = await run_in_threadpool(find_user)
+    stored = user["password"] if user else _DUMMY_HASH
+    ok = await asyncio.get_running_loop().run_in_executor(auth.HASH_POOL, auth.verify_password, creds.password, stored)
+    if user and ok:
+        token, claims = session_signer.issue(user["username"], user["role"])
+        return {"status": "ok", "role": user["role"], "token": token, "expires": claims["exp"]}
     else:
         raise HTTPException(status_code=401, detail="Error")
 
 # 3. MÉTRICAS - Incrementar vistas
+def _increment_counter(item_id, field):
+    """Suma 1 en el buffer en memoria; la escritura real la hace counter_buffer."""
+    with db.connection() as conn:
+        row = conn.execute(
+            f"SELECT {vehiculos.field_expr(field)} AS value FROM vehiculos WHERE id = ?", (item_id,)
+        ).fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Vehículo no encontrado")
+    pending = counter_buffer.add(item_id, field)
+    return (row["value"] or 0) + pending
+
 @app.post("/api/autos/{item_id}/view")
 def increment_view(item_id: int):
     """Incrementa el contador de vistas cuando alguien ve un vehículo"""
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Obtener el vehículo actual
-    c.execute("SELECT * FROM vehiculos WHERE id = ?", (item_id,))
-    row = c.fetchone()
-    
-    if not row:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Vehículo no encontrado")
-    
-    # Parsear y actualizar vistas
-    car_data = json.loads(row["data"])
-    car_data["vistas"] = car_data.get("vistas", 0) + 1
-    
-    # Guardar
-    c.execute("UPDATE vehiculos SET data = ? WHERE id = ?", (json.dumps(car_data), item_id))
-    conn.commit()
-    conn.close()
-    
-    return {"vistas": car_data["vistas"]}
+    return {"vistas": _increment_counter(item_id, "vistas")}
 
 # 4. MÉTRICAS - Incrementar interesados
 @app.post("/api/autos/{item_id}/interested")
 def increment_interested(item_id: int):
     """Incrementa el contador de interesados cuando alguien hace clic en contactar"""
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Obtener el vehículo actual
-    c.execute("SELECT * FROM vehiculos WHERE id = ?", (item_id,))
-    row = c.fetchone()
-    
-    if not row:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Vehículo no encontrado")
-    
-    # Parsear y actualizar interesados
-    car_data = json.loads(row["data"])
-    car_data["interesados"] = car_data.get("interesados", 0) + 1
-    
-    # Guardar
-    c.execute("UPDATE vehiculos SET data = ? WHERE id = ?", (json.dumps(car_data), item_id))
-    conn.commit()
-    conn.close()
-    
-    return {"interesados": car_data["interesados"]}
+    return {"interesados": _increment_counter(item_id, "interesados")}
 
 # 5. MÉTRICAS - Resetear todas las métricas
-@app.post("/api/autos/reset-metrics")
+@app.post("/api/autos/reset-metrics", dependencies=[Depends(require_admin)])
 def reset_all_metrics():
     """Resetea vistas e interesados de todos los vehículos a 0"""
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Obtener todos los vehículos
-    c.execute("SELECT * FROM vehiculos")
-    rows = c.fetchall()
-    
-    updated_count = 0
-    for row in rows:
-        car_data = json.loads(row["data"])
-        car_data["vistas"] = 0
-        car_data["interesados"] = 0
-        
-        c.execute("UPDATE vehiculos SET data = ? WHERE id = ?", (json.dumps(car_data), row["id"]))
-        updated_count += 1
-    
-    conn.commit()
-    conn.close()
-    
-    return {"message": f"Métricas reseteadas en {updated_count} vehículos"}
\ No newline at end of file
+    counter_buffer.discard()
+    updated_count = bulk_patch_autos({"vistas": 0, "interesados": 0}, all_rows=True)
+    return {"message": f"Métricas reseteadas en {updated_count} vehículos"}
+# --- ESTADÍSTICAS DEL PORTAL ---
+# Los totales salen de stats_totals (mantenida por triggers), así el dashboard
+# no necesita descargar todo el stock. Se cachean junto con "autos": cualquier
+# escritura o flush de contadores las invalida. Los clics aún no escritos
+# aparecen en el siguiente flush (COUNTER_FLUSH_MS).
+
+def _stats_response(request, build):
+    key = f"stats:{request.url.path}?{request.url.query}"
+    return response_cache.get_or_build("autos", key, lambda: (build(), {})).to_response(request)
+
+def _stats_cars(query, **kwargs):
+    fields = list(storage.SUMMARY_FIELDS)
+    select_list, decode = vehiculos.projection(fields)
+    with db.connection() as conn:
+        rows = query(conn, select_list, **kwargs)
+    return [_car_response(decode(row), fields) for row in rows]
+
+@app.get("/api/stats", dependencies=[Depends(current_user)])
+def get_stats(request: Request):
+    """Totales del dashboard: stock, valor, comisión, vistas, conversión y antigüedad."""
+    def build():
+        with db.connection() as conn:
+            return stats.overview(conn)
+    return _stats_response(request, build)
+
+@app.get("/api/stats/vendedores", dependencies=[Depends(current_user)])
+def get_stats_vendedores(request: Request):
+    def build():
+        with db.connection() as conn:
+            return stats.by_dimension(conn, "vendedor")
+    return _stats_response(request, build)
+
+@app.get("/api/stats/marcas", dependencies=[Depends(current_user)])
+def get_stats_marcas(request: Request):
+    def build():
+        with db.connection() as conn:
+            return stats.by_dimension(conn, "marca")
+    return _stats_response(request, build)
+
+@app.get("/api/stats/estados", dependencies=[Depends(current_user)])
+def get_stats_estados(request: Request):
+    def build():
+        with db.connection() as conn:
+            return stats.by_estado(conn)
+    return _stats_response(request, build)
+
+@app.get("/api/stats/top-conversion", dependencies=[Depends(current_user)])
+def get_top_conversion(request: Request, limit: int = Query(stats.TOP_LIMIT, ge=1, le=stats.MAX_TOP_LIMIT)):
+    """Autos con mejor tasa interesados / vistas (vista resumida)."""
+    return _stats_response(request, lambda: _stats_cars(stats.top_conversion, limit=limit))
+
+@app.get("/api/stats/attention", dependencies=[Depends(current_user)])
+def get_needs_attention(
+    request: Request,
+    dias: int = stats.ATTENTION_DAYS,
+    limit: int = Query(stats.TOP_LIMIT, ge=1, le=stats.MAX_TOP_LIMIT),
+):
+    """Autos disponibles con más de `dias` días en stock, los más antiguos primero."""
+    return _stats_response(request, lambda: _stats_cars(stats.needs_attention, days=dias, limit=limit))
+
+# --- HISTORIAL DE VISTAS / INTERESADOS ---
+# Series por hora o por día servidas desde los buckets de events.py (se
+# actualizan cada LIONS_EVENT_ROLLUP_S segundos).
+
+DEFAULT_RANGES = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+def _event_range(granularity, since, until):
+    if granularity not in events.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity debe ser: {', '.join(events.GRANULARITIES)}")
+    if until is None:
+        # Fin del bucket actual: el rango por defecto (y su clave en caché) no
+        # cambia en cada request
+        now = datetime.now()
+        if granularity == "hour":
+            until = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        else:
+            until = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    since = since or until - DEFAULT_RANGES[granularity]
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since debe ser anterior a until")
+    return int(since.timestamp()), int(until.timestamp())
+
+@app.get("/api/stats/timeseries", dependencies=[Depends(current_user)])
+def get_timeseries(
+    request: Request,
+    granularity: str = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    vehiculo: Optional[int] = None,
+):
+    """
+    Vistas e interesados por hora o por día (todo el stock o ?vehiculo=id).
+    Por defecto: últimas 48 horas / últimos 30 días.
+    """
+    start, end = _event_range(granularity, since, until)
+    def build():
+        with db.connection() as conn:
+            return events.timeseries(conn, granularity, start, end, vehiculo), {}
+    key = f"timeseries:{granularity}:{start}:{end}:{vehiculo}"
+    return response_cache.get_or_build("events", key, build).to_response(request)
+
+@app.get("/api/stats/top-viewed", dependencies=[Depends(current_user)])
+def get_top_viewed(
+    request: Request,
+    field: str = "vistas",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(10, ge=1, le=stats.MAX_TOP_LIMIT),
+):
+    """Vehículos con más vistas (o ?field=interesados) en el rango, por defecto 30 días."""
+    if field not in events.EVENT_KINDS:
+        raise HTTPException(status_code=400, detail=f"field debe ser: {', '.join(events.EVENT_KINDS)}")
+    start, end = _event_range("day", since, until)
+    def build():
+        with db.connection() as conn:
+            rows = events.top_vehicles(conn, start, end, field, limit)
+        return [{"id": r["vehiculo_id"], field: r["total"]} for r in rows], {}
+    key = f"top:{field}:{start}:{end}:{limit}"
+    return response_cache.get_or_build("events", key, build).to_response(request)
+
+# --- MÉTRICAS (Prometheus) ---
+# /metrics es por proceso: con varios workers, Prometheus debe leer cada uno
+# (o juntar las series por pid). Si LIONS_METRICS_TOKEN está definido se pide
+# "Authorization: Bearer <token>"; si no, conviene no exponerlo en Nginx.
+METRICS_TOKEN = os.getenv("LIONS_METRICS_TOKEN")
+
+def metrics_access(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+
+@app.get("/metrics", dependencies=[Depends(metrics_access)])
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/slow-queries", dependencies=[Depends(metrics_access)])
+def get_slow_queries():
+    """Últimas sentencias sobre LIONS_SLOW_QUERY_MS en este worker."""
+    return {"pid": os.getpid(), "thresholdMs": metrics.SLOW_QUERY_MS, "queries": metrics.slow_queries()}
+
+@app.post("/metrics/profiler/start", dependencies=[Depends(require_admin)])
+def start_profiler(seconds: float = Query(30, gt=0, le=600), interval_ms: float = Query(10, ge=1, le=1000)):
+    """Muestrea los stacks de ESTE worker durante `seconds` segundos."""
+    started = metrics.profiler.start(interval_ms / 1000, seconds)
+    return {"started": started, **metrics.profiler.status()}
+
+@app.post("/metrics/profiler/stop", dependencies=[Depends(require_admin)])
+def stop_profiler():
+    metrics.profiler.stop()
+    return metrics.profiler.status()
+
+@app.get("/metrics/profiler", dependencies=[Depends(require_admin)])
+def get_profile():
+    """Resultado en formato collapsed (flamegraph.pl / speedscope)."""
+    return PlainTextResponse(metrics.profiler.collapsed(), headers={"X-Profiler-Pid": str(os.getpid())})
+
+# --- ARRANQUE ---
+# Respuestas que se construyen antes de aceptar tráfico (LIONS_PREWARM, rutas
+# GET separadas por coma; vacío = nada). Así un reinicio no deja a los
+# primeros visitantes esperando el armado del catálogo completo.
+PREWARM_PATHS = [p for p in os.getenv(
+    "LIONS_PREWARM", "/api/autos,/api/autos?view=summary,/api/brands,/api/colors"
+).split(",") if p.strip()]
+
+async def _asgi_get(path):
+    """GET a la propia app sin pasar por la red (llena response_cache)."""
+    route, _, query = path.strip().partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": route, "raw_path": route.encode(), "root_path": "",
+        "query_string": query.encode(), "headers": [(b"host", b"prewarm")],
+        "client": None, "server": None,
+    }
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await app(scope, receive, send)
+    return status.get("code")
+
+async def prewarm():
+    # La matriz de autos similares se arma una vez; después solo se actualiza
+    await run_in_threadpool(similar_index.refresh)
+    for path in PREWARM_PATHS:
+        try:
+            code = await _asgi_get(path)
+        except Exception as e:
+            code = e
+        if code != 200:
+            print(f"Prewarm {path}: {code}")
+
+if __name__ == "__main__":
+    import uvicorn
+    # LIONS_WORKERS > 1: varios procesos sobre el mismo archivo SQLite. Cada
+    # uno tiene su pool, su hilo escritor, sus contadores de clics, su pool de
+    # variantes (LIONS_IMAGE_WORKERS procesos) y sus cachés (coherentes vía
+    # cache_sync); /metrics y el profiler son por worker. SQLite sigue
+    # teniendo un solo escritor: más workers reparten lecturas y JSON, pero
+    # los hilos escritores compiten por BEGIN IMMEDIATE. Por eso se limita a
+    # MAX_WORKERS. La limpieza de fotos corre en un solo worker por pasada
+    # (lease en app_settings) y la compactación de eventos es segura en
+    # paralelo (avanza last_id dentro de la misma transacción).
+    MAX_WORKERS = int(os.getenv("LIONS_MAX_WORKERS", "4"))
+    workers = int(os.getenv("LIONS_WORKERS", "2"))
+    if workers > MAX_WORKERS:
+        logger.warning("LIONS_WORKERS=%d supera LIONS_MAX_WORKERS=%d: se usan %d", workers, MAX_WORKERS, MAX_WORKERS)
+        workers = MAX_WORKERS
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("LIONS_HOST", "0.0.0.0"),
+        port=int(os.getenv("LIONS_PORT", "8000")),
+        workers=workers,
+    )
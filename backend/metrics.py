@@ -0,0 +1,376 @@
+import collections
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# --- MÉTRICAS (formato texto de Prometheus) ---
+# Sin dependencias: histogramas y contadores propios que GET /metrics
+# serializa en el formato que entiende Prometheus.
+#   - HTTP: latencia y tamaño de respuesta por ruta, requests en curso
+#   - SQL: tiempo por fase (tomar conexión del pool, consulta, decodificar
+#     JSON) y por sentencia; las lentas quedan en el log "lions.sql"
+#   - Profiler por muestreo, opcional, que se prende en un solo worker
+#
+# LIONS_SQL_METRICS=0 apaga el cronometraje de SQL (queda la conexión normal).
+
+SQL_METRICS = os.getenv("LIONS_SQL_METRICS", "1") != "0"
+SLOW_QUERY_MS = float(os.getenv("LIONS_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("LIONS_SLOW_QUERY_LOG_SIZE", "200"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+slow_log = logging.getLogger("lions.sql")
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        for label_values, (counts, total, count) in items:
+            base = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, ("le", _num(bound)))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, ("le", "+Inf"))} {count}')
+            lines.append(f"{self.name}_sum{base} {_num(total)}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=(), kind="counter"):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.kind = kind
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labels, k)} {_num(v)}" for k, v in items]
+        return lines
+
+
+def Gauge(name, help_text, labels=()):
+    return Counter(name, help_text, labels, kind="gauge")
+
+
+def _num(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+# --- REGISTRO ---
+
+http_latency = Histogram(
+    "lions_http_request_duration_seconds", "Latencia de los requests HTTP", LATENCY_BUCKETS,
+    ("method", "route", "status"),
+)
+http_size = Histogram(
+    "lions_http_response_size_bytes", "Tamaño del cuerpo de las respuestas", SIZE_BUCKETS, ("method", "route"),
+)
+http_in_flight = Gauge("lions_http_requests_in_flight", "Requests en curso")
+sql_phase = Histogram(
+    "lions_sql_phase_seconds", "Tiempo de SQL por fase (connect, query, fetch, decode, commit)", SQL_BUCKETS, ("phase",),
+)
+sql_statement = Histogram(
+    "lions_sql_statement_seconds", "Tiempo de cada tipo de sentencia SQL", SQL_BUCKETS, ("statement",),
+)
+sql_slow = Counter("lions_sql_slow_queries_total", "Sentencias sobre LIONS_SLOW_QUERY_MS", ("statement",))
+
+REGISTRY = [http_latency, http_size, http_in_flight, sql_phase, sql_statement, sql_slow]
+
+# Otras métricas (pool, cola de escrituras, caché...) se agregan con
+# register_gauge(nombre, ayuda, función) y se leen al momento del scrape
+_gauge_callbacks = []
+
+
+def register_gauge(name, help_text, fn):
+    _gauge_callbacks.append((name, help_text, fn))
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    for name, help_text, fn in _gauge_callbacks:
+        try:
+            value = fn()
+        except Exception:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_num(value)}"]
+    return "\n".join(lines) + "\n"
+
+
+# --- HTTP ---
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia, tamaño de respuesta y requests en curso por ruta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        state = {"status": 500, "size": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["size"] += len(message.get("body", b""))
+            await send(message)
+
+        http_in_flight.inc(1)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.inc(-1)
+            # El router deja la ruta en el scope; así /api/autos/7 y /api/autos/8 son una sola serie
+            route = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            method = scope["method"]
+            http_latency.observe(time.perf_counter() - start, method, route, f"{state['status'] // 100}xx")
+            http_size.observe(state["size"], method, route)
+
+
+# --- SQL ---
+
+_TABLE = re.compile(r'\b(?:FROM|INTO|JOIN)\s+"?(\w+)', re.IGNORECASE)
+
+_recent_slow = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_labels_cache = {}
+
+
+def statement_label(sql):
+    """'SELECT ... FROM vehiculos ...' -> 'SELECT vehiculos' (pocas series distintas)."""
+    label = _labels_cache.get(sql)
+    if label is not None:
+        return label
+    words = sql.split(None, 2)
+    verb = words[0].upper() if words else "OTHER"
+    if verb == "UPDATE" and len(words) > 1:
+        table = words[1].strip('"')
+    else:
+        match = _TABLE.search(sql)
+        table = match.group(1) if match else None
+    label = f"{verb} {table}" if table else verb
+    if len(_labels_cache) < 2048:
+        _labels_cache[sql] = label
+    return label
+
+
+def observe_sql(sql, seconds, phase="query"):
+    label = statement_label(sql)
+    sql_phase.observe(seconds, phase)
+    sql_statement.observe(seconds, label)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        sql_slow.inc(1, label)
+        entry = {"ms": round(seconds * 1000, 2), "phase": phase, "sql": " ".join(sql.split())[:500], "at": time.time()}
+        _recent_slow.append(entry)
+        slow_log.warning("SQL lenta (%.1f ms, %s): %s", entry["ms"], phase, entry["sql"])
+
+
+def slow_queries():
+    return list(_recent_slow)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor que mide execute y fetch* por separado."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._sql = sql
+            observe_sql(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql = sql
+            observe_sql(sql, time.perf_counter() - start)
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            observe_sql(getattr(self, "_sql", ""), time.perf_counter() - start, "fetch")
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Conexión cuyos execute/executemany usan TimedCursor."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+CONNECTION_FACTORY = TimedConnection if SQL_METRICS else sqlite3.Connection
+
+
+def observe_phase(phase, seconds):
+    if SQL_METRICS:
+        sql_phase.observe(seconds, phase)
+
+
+# --- PROFILER POR MUESTREO ---
+# Cada `interval` segundos toma el stack de todos los hilos (sys._current_frames)
+# y cuenta cuántas veces aparece cada uno. El resultado está en formato
+# "collapsed" (una línea por stack: marco;marco;marco cantidad), que leen
+# flamegraph.pl y speedscope. Solo afecta al proceso (worker) donde se prende.
+
+class SamplingProfiler:
+    def __init__(self):
+        self._stacks = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.started_at = None
+        self.samples = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.01, duration=None):
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks = collections.Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(interval, duration), name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, interval, duration):
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration if duration else None
+        while not self._stop.wait(interval):
+            sample = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                sample.append(";".join(reversed(stack)))
+            # collapsed() lee desde otro hilo mientras se sigue muestreando
+            with self._lock:
+                self._stacks.update(sample)
+                self.samples += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+    def collapsed(self):
+        with self._lock:
+            stacks = collections.Counter(self._stacks)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def status(self):
+        return {
+            "pid": os.getpid(), "running": self.running, "samples": self.samples,
+            "startedAt": self.started_at, "stacks": len(self._stacks),
+        }
+
+
+profiler = SamplingProfiler()
+PROFILE_DIR = os.getenv("LIONS_PROFILE_DIR", ".")
+
+
+def toggle_profiler(*_):
+    """
+    Handler de SIGUSR2: prende el profiler o, si ya estaba corriendo, lo
+    detiene y escribe profile-<pid>-<hora>.txt en LIONS_PROFILE_DIR.
+      kill -USR2 <pid del worker>
+    """
+    if not profiler.running:
+        profiler.start()
+        return
+    threading.Thread(target=_dump_profile, name="profile-dump", daemon=True).start()
+
+
+def _dump_profile():
+    profiler.stop()
+    path = os.path.join(PROFILE_DIR, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+    with open(path, "w") as f:
+        f.write(profiler.collapsed())
+    slow_log.warning("Profiler guardado en %s (%d muestras)", path, profiler.samples)
@@ -0,0 +1,168 @@
+import argparse
+import sys
+
+from sqlalchemy import create_engine
+
+import models  # noqa: F401  (registra las tablas en Base.metadata)
+import prices
+from database import Base
+from sqlite_pool import get_pool
+from storage import DEFAULT_DB_NAMES, ColumnarStorage, JsonStorage
+
+# --- MIGRACIÓN: vehiculos JSON (lions_cars.db) -> columnar (lionscars.db) ---
+# Se puede correr con el backend en marcha: lee el origen por lotes cortos y
+# cada lote se escribe en su propia transacción. Es idempotente, así que para
+# terminar basta repetirla justo antes de reiniciar con LIONS_STORAGE=columnar
+# (la segunda pasada copia lo editado/borrado mientras tanto).
+#
+#   python migrate_columnar.py                 # copia + verificación
+#   python migrate_columnar.py --verify-only   # solo compara origen y destino
+
+CONFIG_TABLES = {
+    "brands": ["id", "name"],
+    "colors": ["id", "name", "hex"],
+    "users": ["id", "username", "password", "role"],
+}
+
+
+def copy_vehicles(source, target, batch_size):
+    json_storage, columnar = JsonStorage(), ColumnarStorage()
+    copied, skipped, last_id = 0, 0, 0
+    while True:
+        with source.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, data FROM vehiculos WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+        if not rows:
+            break
+        with target.transaction() as conn:
+            for row in rows:
+                try:
+                    car = json_storage.row_to_car(row)
+                except ValueError:
+                    print(f"ID {row['id']}: JSON inválido, se omite")
+                    skipped += 1
+                    continue
+                conn.execute("DELETE FROM vehiculos WHERE id = ?", (row["id"],))
+                columnar.insert(conn, car, item_id=row["id"])
+                copied += 1
+        last_id = rows[-1]["id"]
+        print(f"  ... {copied} vehículos copiados (hasta id {last_id})")
+
+    # Lo que ya no existe en el origen se borra del destino
+    with source.connection() as conn:
+        source_ids = {r["id"] for r in conn.execute("SELECT id FROM vehiculos")}
+    with target.transaction() as conn:
+        target_ids = {r["id"] for r in conn.execute("SELECT id FROM vehiculos")}
+        stale = sorted(target_ids - source_ids)
+        conn.executemany("DELETE FROM vehiculos WHERE id = ?", [(i,) for i in stale])
+    return copied, skipped, len(stale)
+
+
+def copy_price_history(source, target):
+    """
+    price_history tal cual (el destino no tiene triggers durante la copia).
+    Si el origen es anterior a la tabla, el historial sigue embebido en cada
+    vehículo y el backend lo importa al arrancar.
+    """
+    with source.connection() as conn:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'price_history'").fetchone() is None:
+            print("  price_history: no existe en el origen")
+            return
+        rows = [tuple(r) for r in conn.execute("SELECT id, vehiculo_id, fecha, precio FROM price_history")]
+    with target.transaction() as conn:
+        prices.create_tables(conn)
+        conn.execute("DELETE FROM price_history")
+        conn.executemany("INSERT INTO price_history (id, vehiculo_id, fecha, precio) VALUES (?, ?, ?, ?)", rows)
+        prices.refresh_latest(conn)
+    print(f"  price_history: {len(rows)} filas")
+
+
+def copy_config_tables(source, target):
+    for table, columns in CONFIG_TABLES.items():
+        names = ", ".join(columns)
+        with source.connection() as conn:
+            rows = [tuple(r) for r in conn.execute(f"SELECT {names} FROM {table}")]
+        with target.transaction() as conn:
+            conn.execute(f"DELETE FROM {table}")
+            marks = ", ".join("?" for _ in columns)
+            conn.executemany(f"INSERT INTO {table} ({names}) VALUES ({marks})", rows)
+        print(f"  {table}: {len(rows)} filas")
+
+
+def verify(source, target, batch_size):
+    """Compara conteos de todas las tablas y el contenido de cada vehículo."""
+    ok = True
+    for table in ["vehiculos", *CONFIG_TABLES]:
+        with source.connection() as conn:
+            n_source = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        with target.connection() as conn:
+            n_target = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        status = "OK" if n_source == n_target else "DIFERENTE"
+        ok = ok and n_source == n_target
+        print(f"  {table}: origen={n_source} destino={n_target} {status}")
+
+    json_storage, columnar = JsonStorage(), ColumnarStorage()
+    mismatches, last_id = 0, 0
+    while True:
+        with source.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, data FROM vehiculos WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        ids = [r["id"] for r in rows]
+        marks = ", ".join("?" for _ in ids)
+        with target.connection() as conn:
+            migrated = {
+                r["id"]: columnar.row_to_car(r)
+                for r in conn.execute(f"SELECT {columnar.select_list} FROM vehiculos WHERE id IN ({marks})", ids)
+            }
+        for row in rows:
+            try:
+                original = json_storage.row_to_car(row)
+            except ValueError:
+                continue
+            copy = migrated.get(row["id"])
+            diff = [c for c in columnar.columns if copy is None or copy.get(c) != original.get(c)]
+            if diff:
+                mismatches += 1
+                print(f"  ID {row['id']}: difiere en {', '.join(diff[:5])}")
+    ok = ok and mismatches == 0
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra vehiculos del formato JSON al columnar")
+    parser.add_argument("--source", default=DEFAULT_DB_NAMES["json"])
+    parser.add_argument("--target", default=DEFAULT_DB_NAMES["columnar"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--verify-only", action="store_true")
+    args = parser.parse_args()
+
+    source, target = get_pool(args.source), get_pool(args.target)
+
+    if not args.verify_only:
+        print(f"🔧 Creando esquema columnar en {args.target}...")
+        Base.metadata.create_all(create_engine(f"sqlite:///{args.target}"))
+
+        print("🚗 Copiando vehículos...")
+        copied, skipped, deleted = copy_vehicles(source, target, args.batch_size)
+        print(f"  copiados={copied} omitidos={skipped} borrados_en_destino={deleted}")
+
+        print("⚙️  Copiando marcas, colores y usuarios...")
+        copy_config_tables(source, target)
+
+        print("💲 Copiando historial de precios...")
+        copy_price_history(source, target)
+
+    print("🔍 Verificando...")
+    if not verify(source, target, args.batch_size):
+        print("\n❌ La verificación falló, no cambies LIONS_STORAGE todavía.")
+        sys.exit(1)
+    print(f"\n✅ Listo. Reinicia el backend con LIONS_STORAGE=columnar (usa {args.target}).")
+
+
+if __name__ == "__main__":
+    main()
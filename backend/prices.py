@@ -0,0 +1,202 @@
+import json
+
+import catalog_query
+import storage
+
+# --- HISTORIAL DE PRECIOS ---
+# Antes cada vehículo guardaba `precioHistorial` dentro de su documento y cada
+# edición lo reescribía completo. Ahora cada cambio de precio es una fila de
+# price_history (id creciente = orden cronológico) y price_latest guarda, por
+# vehículo, el último cambio y el % de baja para poder ordenar y filtrar sin
+# parsear nada. Igual que stats_totals, los mantienen triggers sobre
+# "vehiculos": cualquier escritura que cambie el precio (formulario, PATCH
+# masivo, scripts) queda registrada.
+#
+# La API sigue entregando `precioHistorial` ([{date, price}, ...]) armado desde
+# price_history. El arreglo embebido de antes se copia pero no se borra ni se
+# reescribe (storage lo conserva al editar): volver a la versión anterior del
+# código no pierde el historial.
+
+DROP_DAYS = 7
+DROPS_LIMIT = 50
+MAX_DROPS_LIMIT = 500
+
+# Orden de /api/autos/price-drops -> columna de price_latest
+DROP_SORTS = {"descuento": "baja_pct", "fecha": "fecha_cambio"}
+
+
+def _price(alias):
+    return storage.backend.field_expr("precio", alias)
+
+
+def create_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS price_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vehiculo_id INTEGER NOT NULL, fecha TEXT NOT NULL, precio INTEGER NOT NULL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_price_history_vehiculo ON price_history (vehiculo_id, id)")
+    conn.execute('''CREATE TABLE IF NOT EXISTS price_latest (
+        vehiculo_id INTEGER PRIMARY KEY,
+        ultimo_precio INTEGER, precio_anterior INTEGER, fecha_cambio TEXT, baja_pct REAL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_price_latest_baja ON price_latest (baja_pct) WHERE baja_pct > 0")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_price_latest_fecha ON price_latest (fecha_cambio) WHERE baja_pct > 0"
+    )
+
+
+def create_schema(conn):
+    create_tables(conn)
+    new, old = _price("NEW"), _price("OLD")
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_price_insert AFTER INSERT ON vehiculos WHEN {new} IS NOT NULL
+        BEGIN
+            INSERT INTO price_history (vehiculo_id, fecha, precio) VALUES (NEW.id, date('now'), {new});
+            INSERT OR REPLACE INTO price_latest (vehiculo_id, ultimo_precio, precio_anterior, fecha_cambio, baja_pct)
+            VALUES (NEW.id, {new}, NULL, date('now'), NULL);
+        END''')
+    # Los flush de contadores también son UPDATE: solo si cambió el precio
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_price_update AFTER UPDATE ON vehiculos
+        WHEN {old} IS NOT {new} AND {new} IS NOT NULL
+        BEGIN
+            INSERT INTO price_history (vehiculo_id, fecha, precio) VALUES (NEW.id, date('now'), {new});
+            INSERT OR REPLACE INTO price_latest (vehiculo_id, ultimo_precio, precio_anterior, fecha_cambio, baja_pct)
+            VALUES (NEW.id, {new}, {old}, date('now'),
+                    CASE WHEN {old} > 0 THEN ({old} - {new}) * 100.0 / {old} END);
+        END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_price_delete AFTER DELETE ON vehiculos
+        BEGIN
+            DELETE FROM price_history WHERE vehiculo_id = OLD.id;
+            DELETE FROM price_latest WHERE vehiculo_id = OLD.id;
+        END''')
+
+    # Base con autos anteriores a la tabla: se copia el historial embebido
+    if conn.execute("SELECT 1 FROM price_history LIMIT 1").fetchone() is None:
+        backfill(conn)
+
+
+def backfill(conn):
+    """Copia los `precioHistorial` embebidos a price_history (los documentos no se tocan)."""
+    history = storage.backend.field_expr("precioHistorial", "v")
+    conn.execute(f'''INSERT INTO price_history (vehiculo_id, fecha, precio)
+        SELECT v.id, COALESCE(json_extract(h.value, '$.date'), date('now')), json_extract(h.value, '$.price')
+        FROM vehiculos v JOIN json_each(COALESCE({history}, '[]')) h
+        WHERE json_type(h.value, '$.price') IN ('integer', 'real')
+        ORDER BY v.id, h.key''')
+    _drop_repeated(conn)
+    # El precio actual es siempre la última entrada
+    conn.execute(f'''INSERT INTO price_history (vehiculo_id, fecha, precio)
+        SELECT v.id, date('now'), {_price("v")} FROM vehiculos v
+        WHERE {_price("v")} IS NOT NULL AND {_price("v")} IS NOT
+            (SELECT precio FROM price_history WHERE vehiculo_id = v.id ORDER BY id DESC LIMIT 1)''')
+    refresh_latest(conn)
+
+
+def _drop_repeated(conn, vehiculo_id=None):
+    # Entradas con el mismo precio que la anterior no son un cambio
+    where, params = ("WHERE vehiculo_id = ?", (vehiculo_id,)) if vehiculo_id is not None else ("", ())
+    conn.execute(f'''DELETE FROM price_history WHERE id IN (
+        SELECT id FROM (
+            SELECT id, precio, LAG(precio) OVER (PARTITION BY vehiculo_id ORDER BY id) AS anterior
+            FROM price_history {where})
+        WHERE precio = anterior)''', params)
+
+
+def refresh_latest(conn, vehiculo_id=None):
+    """Recalcula price_latest desde price_history (todo, o un solo vehículo)."""
+    where, params = ("WHERE vehiculo_id = ?", (vehiculo_id,)) if vehiculo_id is not None else ("", ())
+    conn.execute(f"DELETE FROM price_latest {where}", params)
+    conn.execute(f'''INSERT INTO price_latest (vehiculo_id, ultimo_precio, precio_anterior, fecha_cambio, baja_pct)
+        SELECT vehiculo_id, precio, anterior, fecha,
+               CASE WHEN anterior > 0 THEN (anterior - precio) * 100.0 / anterior END
+        FROM (
+            SELECT vehiculo_id, precio, fecha,
+                   LAG(precio) OVER (PARTITION BY vehiculo_id ORDER BY id) AS anterior,
+                   ROW_NUMBER() OVER (PARTITION BY vehiculo_id ORDER BY id DESC) AS pos
+            FROM price_history {where})
+        WHERE pos = 1''', params)
+
+
+def import_history(conn, vehiculo_id, entries):
+    """
+    Reemplaza el historial de un vehículo recién creado con el que mandó el
+    cliente ([{date, price}, ...]); el precio actual queda como última entrada.
+    """
+    rows = [
+        (vehiculo_id, str(e.get("date") or ""), e["price"]) for e in entries or []
+        if isinstance(e, dict) and isinstance(e.get("price"), (int, float)) and e.get("date")
+    ]
+    if not rows:
+        return
+    conn.execute("DELETE FROM price_history WHERE vehiculo_id = ?", (vehiculo_id,))
+    conn.executemany("INSERT INTO price_history (vehiculo_id, fecha, precio) VALUES (?, ?, ?)", rows)
+    conn.execute(
+        f'''INSERT INTO price_history (vehiculo_id, fecha, precio)
+        SELECT id, date('now'), {_price(None)} FROM vehiculos WHERE id = ? AND {_price(None)} IS NOT
+            (SELECT precio FROM price_history WHERE vehiculo_id = ? ORDER BY id DESC LIMIT 1)''',
+        (vehiculo_id, vehiculo_id),
+    )
+    _drop_repeated(conn, vehiculo_id)
+    refresh_latest(conn, vehiculo_id)
+
+
+# --- LECTURA ---
+
+def load(conn, ids):
+    """{vehiculo_id: [{date, price}, ...]} en orden cronológico."""
+    histories = {i: [] for i in ids}
+    if not histories:
+        return histories
+    rows = conn.execute(
+        "SELECT vehiculo_id, fecha, precio FROM price_history "
+        "WHERE vehiculo_id IN (SELECT value FROM json_each(?)) ORDER BY vehiculo_id, id",
+        (json.dumps(list(histories)),),
+    ).fetchall()
+    for r in rows:
+        histories[r["vehiculo_id"]].append({"date": r["fecha"], "price": r["precio"]})
+    return histories
+
+
+def attach(conn, cars):
+    """Completa `precioHistorial` de cada vehículo (una sola consulta para todos)."""
+    histories = load(conn, [car["id"] for car in cars])
+    for car in cars:
+        car["precioHistorial"] = histories.get(car["id"], [])
+    return cars
+
+
+def latest_change(row):
+    if row is None or row["precio_anterior"] is None:
+        return None
+    return {
+        "fecha": row["fecha_cambio"],
+        "precioAnterior": row["precio_anterior"],
+        "precio": row["ultimo_precio"],
+        "bajaPct": round(row["baja_pct"], 2) if row["baja_pct"] is not None else None,
+    }
+
+
+def history(conn, vehiculo_id):
+    """Historial completo y último cambio de un vehículo (None si no existe)."""
+    latest = conn.execute("SELECT * FROM price_latest WHERE vehiculo_id = ?", (vehiculo_id,)).fetchone()
+    entries = load(conn, [vehiculo_id])[vehiculo_id]
+    if latest is None and not entries:
+        return None
+    return {"id": vehiculo_id, "precioHistorial": entries, "ultimoCambio": latest_change(latest)}
+
+
+def recent_drops(conn, select_list, since=None, filters=None, sort="descuento", limit=DROPS_LIMIT):
+    """
+    Vehículos cuyo último cambio de precio fue una baja (desde `since`,
+    'YYYY-MM-DD'), con mayor descuento o más recientes primero.
+    """
+    column = DROP_SORTS.get(sort)
+    if column is None:
+        raise catalog_query.QueryError(f"Orden no soportado: {sort}")
+    where, params = catalog_query.build_where(filters or {})
+    if since is not None:
+        where += " AND fecha_cambio >= ?"
+        params.append(since)
+    return conn.execute(
+        f"SELECT {select_list}, ultimo_precio, precio_anterior, fecha_cambio, baja_pct "
+        f"FROM price_latest JOIN vehiculos ON id = vehiculo_id "
+        f"WHERE baja_pct > 0 AND {where} ORDER BY {column} DESC, id DESC LIMIT ?",
+        [*params, limit],
+    ).fetchall()
@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from fastapi import Response
+
+# --- CACHÉ DE RESPUESTAS YA SERIALIZADAS ---
+# Guarda los bytes JSON (y su versión gzip) de los GET del catálogo. Cada
+# "namespace" (autos, brands, colors) tiene una versión que suben los
+# endpoints que modifican datos; al subir, todas sus entradas quedan inválidas.
+# Con varios workers, `sync` (cache_sync.CacheSync) trae las invalidaciones
+# hechas por los otros procesos.
+
+GZIP_MIN_BYTES = 1024
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "headers", "_gzip_body")
+
+    def __init__(self, body, headers=None):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.headers = headers or {}
+        self._gzip_body = None
+
+    def gzip_body(self):
+        # Se comprime una sola vez, la primera vez que alguien la pide
+        if self._gzip_body is None:
+            self._gzip_body = gzip.compress(self.body, compresslevel=6)
+        return self._gzip_body
+
+    def to_response(self, request):
+        headers = {
+            **self.headers,
+            "ETag": self.etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        body = self.body
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+            body = self.gzip_body()
+            headers["Content-Encoding"] = "gzip"
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, sync=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.sync = sync
+        if sync is not None:
+            sync.subscribe(lambda changed: self.bump(*changed))
+
+    def version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def bump(self, *namespaces):
+        """Invalida solo en este proceso."""
+        with self._lock:
+            for ns in namespaces:
+                self._versions[ns] = self._versions.get(ns, 0) + 1
+
+    def invalidate(self, *namespaces):
+        """
+        Llamar después del commit. Con sync, la escritura ya subió el contador
+        compartido: se lee de ahí (así el poll siguiente no invalida dos veces)
+        y solo se sube localmente lo que no estaba registrado.
+        """
+        changed = self.sync.poll(force=True) if self.sync is not None else set()
+        self.bump(*(ns for ns in namespaces if ns not in changed))
+
+    def get_or_build(self, namespace, key, builder):
+        """
+        Devuelve la respuesta cacheada para (namespace, key) o la construye con
+        builder() -> (payload, headers). Si hubo una invalidación mientras se
+        construía, el resultado se entrega pero no se guarda.
+        """
+        if self.sync is not None:
+            self.sync.poll()
+        with self._lock:
+            version = self.version(namespace)
+            cache_key = (namespace, version, key)
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+                return entry
+
+        payload, headers = builder()
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        entry = CachedResponse(body, headers)
+
+        with self._lock:
+            if self.version(namespace) == version:
+                self._entries[cache_key] = entry
+                # Las entradas de versiones viejas nunca se vuelven a pedir y
+                # terminan saliendo por aquí
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
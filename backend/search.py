@@ -0,0 +1,111 @@
+import re
+
+import catalog_query
+import storage
+
+# --- BÚSQUEDA DE TEXTO (SQLite FTS5) ---
+# vehiculos_fts indexa los campos de texto de cada vehículo (rowid = id del
+# vehículo). El tokenizador unicode61 con remove_diacritics ignora tildes y
+# mayúsculas: "citroen" encuentra "Citroën" y "camion" encuentra "Camión".
+# Igual que stats_totals, la mantienen triggers sobre "vehiculos", así que
+# todas las escrituras (endpoints, PATCH masivo, fix_brands...) la actualizan.
+# prefix='1 2 3' guarda índices de prefijo para que el autocompletado con
+# "toy*" no tenga que recorrer todo el vocabulario.
+
+FTS_FIELDS = ("marca", "modelo", "version", "motor", "color", "patente", "obs", "ano")
+# Peso de cada columna en bm25 (mismo orden que FTS_FIELDS)
+FTS_WEIGHTS = (10.0, 10.0, 4.0, 2.0, 2.0, 6.0, 1.0, 3.0)
+
+SUGGEST_FIELDS = ("marca", "modelo")
+SUGGEST_LIMIT = 8
+SEARCH_LIMIT = 50
+MAX_QUERY_TERMS = 8
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def _values(alias):
+    return ", ".join(f"COALESCE({storage.backend.field_expr(f, alias)}, '')" for f in FTS_FIELDS)
+
+
+def create_schema(conn):
+    columns = ", ".join(FTS_FIELDS)
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS vehiculos_fts USING fts5({columns}, "
+        f"tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')"
+    )
+    insert = f"INSERT INTO vehiculos_fts (rowid, {columns}) VALUES (NEW.id, {_values('NEW')});"
+    delete = "DELETE FROM vehiculos_fts WHERE rowid = OLD.id;"
+    # Los flush de contadores también son UPDATE: solo reindexar si cambió texto
+    changed = " OR ".join(
+        f"{storage.backend.field_expr(f, 'OLD')} IS NOT {storage.backend.field_expr(f, 'NEW')}"
+        for f in FTS_FIELDS
+    )
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON vehiculos BEGIN {insert} END")
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE ON vehiculos WHEN {changed} "
+        f"BEGIN {delete} {insert} END"
+    )
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON vehiculos BEGIN {delete} END")
+
+    # Base con autos anteriores al índice
+    if conn.execute("SELECT 1 FROM vehiculos_fts LIMIT 1").fetchone() is None:
+        rebuild(conn)
+
+
+def rebuild(conn):
+    conn.execute("DELETE FROM vehiculos_fts")
+    conn.execute(
+        f"INSERT INTO vehiculos_fts (rowid, {', '.join(FTS_FIELDS)}) SELECT id, {_values(None)} FROM vehiculos"
+    )
+
+
+def match_query(text, columns=None):
+    """
+    Convierte lo que escribió el usuario en una consulta FTS5 segura: cada
+    palabra entre comillas (sin operadores) y como prefijo, igual que el
+    filtro anterior del catálogo ("toy co" -> Toyota Corolla). None si no hay
+    palabras.
+    """
+    terms = _TOKEN.findall(text or "")[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    query = " ".join(f'"{t}"*' for t in terms)
+    if columns:
+        query = f"{{{' '.join(columns)}}} : ({query})"
+    return query
+
+
+def search(conn, text, select_list, filters=None, limit=SEARCH_LIMIT):
+    """Vehículos que coinciden con `text`, los más relevantes primero (bm25)."""
+    query = match_query(text)
+    if query is None:
+        return []
+    where, params = catalog_query.build_where(filters or {})
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    return conn.execute(
+        f"SELECT {select_list} FROM ("
+        f"  SELECT rowid AS hit, bm25(vehiculos_fts, {weights}) AS score"
+        f"  FROM vehiculos_fts WHERE vehiculos_fts MATCH ?"
+        f") JOIN vehiculos ON id = hit WHERE {where} ORDER BY score LIMIT ?",
+        [query, *params, limit],
+    ).fetchall()
+
+
+def suggest(conn, text, limit=SUGGEST_LIMIT):
+    """
+    Autocompletado: combinaciones marca + modelo que calzan con lo escrito,
+    las con más autos primero. Solo lee el índice FTS (no toca vehiculos).
+    """
+    query = match_query(text, SUGGEST_FIELDS)
+    if query is None:
+        return []
+    rows = conn.execute(
+        "SELECT marca, modelo, COUNT(*) AS total FROM vehiculos_fts WHERE vehiculos_fts MATCH ? "
+        "GROUP BY marca, modelo ORDER BY total DESC, marca, modelo LIMIT ?",
+        (query, limit),
+    ).fetchall()
+    return [
+        {"texto": f"{r['marca']} {r['modelo']}".strip(), "marca": r["marca"], "modelo": r["modelo"], "total": r["total"]}
+        for r in rows
+    ]
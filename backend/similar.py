@@ -0,0 +1,234 @@
+import heapq
+import math
+import os
+import threading
+
+import changes
+import storage
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se compara en Python puro (más lento)
+    np = None
+
+# --- AUTOS SIMILARES ---
+# Cada vehículo es un vector: precio, año y km normalizados (z-score) más
+# carrocería, combustible, transmisión y marca en one-hot. Cada grupo se
+# multiplica por su peso, así la distancia euclidiana refleja qué pesa más al
+# buscar "algo parecido". Con NumPy los vectores viven en una matriz en
+# memoria y los vecinos de un auto salen de un solo producto matriz-vector:
+#   |a - b|² = |a|² - 2 a·b + |b|²   (|a|² se guarda por fila)
+#
+# El índice se actualiza leyendo el feed de cambios (vehicle_changes) desde la
+# última versión vista: solo se recalculan las filas de los autos que
+# cambiaron, vengan de este worker o de otro. Para no consultar la base en cada
+# request, solo se lee el feed después de que cache_sync avisa un cambio en
+# "autos". Si aparece una categoría nueva (otra marca, otra carrocería) o
+# cambió más de REBUILD_RATIO del stock desde la última construcción (las
+# medias y desviaciones de la normalización quedarían viejas) se reconstruye
+# completo.
+
+NUMERIC_WEIGHTS = {"precio": 3.0, "ano": 1.5, "km": 1.0}
+CATEGORY_WEIGHTS = {"carroceria": 2.0, "marca": 1.0, "combustible": 1.0, "transmision": 0.5}
+FIELDS = [*NUMERIC_WEIGHTS, *CATEGORY_WEIGHTS, "estado"]
+
+SIMILAR_LIMIT = 6
+MAX_SIMILAR_LIMIT = 50
+SOLD = "Vendido"
+REBUILD_RATIO = float(os.getenv("LIONS_SIMILAR_REBUILD_RATIO", "0.1"))
+
+
+def enabled():
+    return np is not None
+
+
+class _NeedsRebuild(Exception):
+    pass
+
+
+class SimilarIndex:
+    def __init__(self, db, capacity=1024, sync=None):
+        """sync: cache_sync.CacheSync; sus avisos de "autos" marcan el índice como desactualizado."""
+        self.db = db
+        self.capacity = capacity
+        self.version = None  # None = aún no se construye
+        self.sync = sync
+        self._stale = True
+        self._lock = threading.Lock()
+        if sync is not None:
+            sync.subscribe(self._on_change)
+
+    def _on_change(self, changed):
+        if "autos" in changed:
+            self._stale = True
+
+    # --- Construcción ---
+
+    def _reset(self, cars):
+        self.stats = {}
+        for field in NUMERIC_WEIGHTS:
+            values = [c[field] for c in cars if isinstance(c.get(field), (int, float))]
+            mean = sum(values) / len(values) if values else 0.0
+            std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values)) if values else 0.0
+            self.stats[field] = (mean, std or 1.0)
+        self.columns = {}
+        offset = len(NUMERIC_WEIGHTS)
+        for field in CATEGORY_WEIGHTS:
+            values = sorted({str(c.get(field) or "") for c in cars})
+            self.columns[field] = {v: offset + i for i, v in enumerate(values)}
+            offset += len(values)
+        self.dims = offset
+        self.rows = {}  # id -> fila
+        self.changed = 0  # filas tocadas desde esta construcción
+        self.free = []
+        self.ids = [None] * max(self.capacity, len(cars))
+        self.sold = [False] * len(self.ids)
+        if np is not None:
+            self.matrix = np.zeros((len(self.ids), self.dims), dtype=np.float32)
+            self.norms = np.full(len(self.ids), np.inf, dtype=np.float32)
+            self.sold = np.zeros(len(self.ids), dtype=bool)
+        else:
+            self.matrix = [None] * len(self.ids)
+        for car in cars:
+            self._put(car)
+
+    def _encode(self, car):
+        vector = [0.0] * self.dims
+        for i, (field, weight) in enumerate(NUMERIC_WEIGHTS.items()):
+            value = car.get(field)
+            if isinstance(value, (int, float)):
+                mean, std = self.stats[field]
+                vector[i] = (value - mean) / std * weight
+        for field, weight in CATEGORY_WEIGHTS.items():
+            column = self.columns[field].get(str(car.get(field) or ""))
+            if column is None:
+                raise _NeedsRebuild(field)
+            vector[column] = weight
+        return vector
+
+    def _grow(self):
+        extra = len(self.ids)
+        self.ids += [None] * extra
+        if np is not None:
+            self.matrix = np.vstack([self.matrix, np.zeros((extra, self.dims), dtype=np.float32)])
+            self.norms = np.concatenate([self.norms, np.full(extra, np.inf, dtype=np.float32)])
+            self.sold = np.concatenate([self.sold, np.zeros(extra, dtype=bool)])
+        else:
+            self.matrix += [None] * extra
+            self.sold += [False] * extra
+
+    def _put(self, car):
+        vector = self._encode(car)
+        row = self.rows.get(car["id"])
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+            else:
+                row = len(self.rows)
+                if row >= len(self.ids):
+                    self._grow()
+            self.rows[car["id"]] = row
+        self.ids[row] = car["id"]
+        self.sold[row] = car.get("estado") == SOLD
+        if np is not None:
+            self.matrix[row] = vector
+            self.norms[row] = float(np.dot(self.matrix[row], self.matrix[row]))
+        else:
+            self.matrix[row] = vector
+
+    def _remove(self, item_id):
+        row = self.rows.pop(item_id, None)
+        if row is None:
+            return
+        self.ids[row] = None
+        if np is not None:
+            self.norms[row] = np.inf
+        else:
+            self.matrix[row] = None
+        self.free.append(row)
+
+    def _rebuild(self, conn):
+        select_list, decode = storage.backend.projection(FIELDS)
+        # Versión antes de leer: a lo más se aplica dos veces un mismo cambio
+        version = changes.current_version(conn)
+        cars = [decode(r) for r in conn.execute(f"SELECT {select_list} FROM vehiculos")]
+        self._reset(cars)
+        self.version = version
+
+    def refresh(self):
+        """Aplica los cambios del feed desde la última versión vista."""
+        select_list, decode = storage.backend.projection(FIELDS)
+        if self.sync is not None:
+            self.sync.poll()  # la primera vez solo toma la foto de las versiones
+        with self._lock, self.db.connection() as conn:
+            # Antes de leer: un aviso que llegue durante la lectura vuelve a marcarlo
+            self._stale = False
+            if self.version is None:
+                self._rebuild(conn)
+                return
+            while True:
+                rows, latest = changes.since(conn, self.version, select_list, changes.MAX_CHANGES_LIMIT)
+                if self.version > latest:
+                    self._rebuild(conn)  # base restaurada / reemplazada
+                    return
+                try:
+                    for r in rows:
+                        if r["deleted"]:
+                            self._remove(r["vehiculo_id"])
+                        else:
+                            self._put(decode(r))
+                except _NeedsRebuild:
+                    self._rebuild(conn)
+                    return
+                self.changed += len(rows)
+                if self.changed > REBUILD_RATIO * max(len(self.rows), 1):
+                    self._rebuild(conn)
+                    return
+                if rows:
+                    self.version = rows[-1]["change_version"]
+                if len(rows) < changes.MAX_CHANGES_LIMIT:
+                    return
+
+    # --- Consulta ---
+
+    def similar(self, item_id, limit=SIMILAR_LIMIT, include_sold=False):
+        """[(id, distancia)] de los `limit` autos más parecidos; None si no existe."""
+        if self.sync is None:
+            self.refresh()
+        else:
+            self.sync.poll()
+            if self._stale or self.version is None:
+                self.refresh()
+        with self._lock:
+            row = self.rows.get(item_id)
+            if row is None:
+                return None
+            if np is not None:
+                return self._similar_numpy(row, limit, include_sold)
+            return self._similar_python(row, limit, include_sold)
+
+    def _similar_numpy(self, row, limit, include_sold):
+        used = len(self.rows) + len(self.free)
+        vector = self.matrix[row]
+        distances = self.norms[:used] - 2 * (self.matrix[:used] @ vector) + self.norms[row]
+        distances[row] = np.inf
+        if not include_sold:
+            distances[self.sold[:used]] = np.inf
+        limit = min(limit, used - 1)
+        if limit <= 0:
+            return []
+        nearest = np.argpartition(distances, limit - 1)[:limit]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [
+            (self.ids[i], math.sqrt(max(float(distances[i]), 0.0)))
+            for i in nearest if np.isfinite(distances[i])
+        ]
+
+    def _similar_python(self, row, limit, include_sold):
+        vector = self.matrix[row]
+        candidates = (
+            (sum((a - b) ** 2 for a, b in zip(vector, other)), self.ids[i])
+            for i, other in enumerate(self.matrix)
+            if other is not None and i != row and (include_sold or not self.sold[i])
+        )
+        return [(item_id, math.sqrt(d)) for d, item_id in heapq.nsmallest(limit, candidates)]
@@ -0,0 +1,128 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# --- POOL DE CONEXIONES SQLITE ---
+# Conexiones abiertas una sola vez, con pragmas ajustados para muchas lecturas
+# concurrentes (WAL) y un solo escritor. Todo es configurable por variables de
+# entorno para poder ajustarlo en el VPS sin tocar código.
+
+DB_POOL_SIZE = int(os.getenv("LIONS_DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("LIONS_DB_POOL_TIMEOUT", "10"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("LIONS_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_STATEMENT_CACHE = int(os.getenv("LIONS_DB_STATEMENT_CACHE", "256"))
+
+DB_PRAGMAS = {
+    "journal_mode": os.getenv("LIONS_DB_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("LIONS_DB_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("LIONS_DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negativo = KiB (aquí 64 MB por conexión)
+    "cache_size": int(os.getenv("LIONS_DB_CACHE_SIZE", "-65536")),
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """No se liberó ninguna conexión dentro de DB_POOL_TIMEOUT segundos."""
+
+
+class ConnectionPool:
+    def __init__(self, path, size=DB_POOL_SIZE, pragmas=None, timeout=DB_POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.pragmas = dict(DB_PRAGMAS if pragmas is None else pragmas)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE,
+            # Con métricas activas cada execute/fetch se cronometra (ver metrics.py)
+            factory=metrics.CONNECTION_FACTORY,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        # Las conexiones se abren a demanda hasta llegar a self.size
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"Pool de conexiones agotado ({self.size})")
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            # Nunca devolver al pool una conexión con una transacción a medias
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Presta una conexión del pool. Hacer commit() es responsabilidad de quien la usa."""
+        start = time.perf_counter()
+        conn = self._acquire()
+        metrics.observe_phase("connect", time.perf_counter() - start)
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Conexión con commit al salir y rollback si hubo excepción."""
+        with self.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def stats(self):
+        return {"opened": self._opened, "idle": self._idle.qsize(), "size": self.size}
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    """Un pool por archivo de base de datos y por proceso."""
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
@@ -0,0 +1,216 @@
+import storage
+
+# --- ESTADÍSTICAS DEL PORTAL (agregados mantenidos por la base) ---
+# stats_totals guarda, por dimensión (total / vendedor / marca) y estado, la
+# cantidad de autos y las sumas que muestra el dashboard. Los triggers de
+# "vehiculos" restan la fila vieja y suman la nueva en cada INSERT / UPDATE /
+# DELETE, así que cualquier escritura (formulario, PATCH masivo, clics,
+# fix_brands, migración) mantiene los totales sin recorrer el stock.
+
+DIMENSIONS = {
+    "all": None,  # total general, key = ''
+    "vendedor": "vendedor",
+    "marca": "marca",
+}
+
+# columna de stats_totals -> campo del vehículo que se suma
+SUM_FIELDS = {
+    "sum_precio": "precio",
+    "sum_dias": "diasStock",
+    "sum_comision": "comisionEstimada",
+    "sum_vistas": "vistas",
+    "sum_interesados": "interesados",
+}
+
+# Tramos de antigüedad del gráfico del portal (diasStock)
+AGING_BUCKETS = {
+    "dias_0_30": "<= 30",
+    "dias_31_60": "BETWEEN 31 AND 60",
+    "dias_60_mas": "> 60",
+}
+
+COLUMNS = ["count", *SUM_FIELDS, *AGING_BUCKETS]
+
+# "Requiere atención": disponibles con más de N días en stock
+ATTENTION_DAYS = 20
+TOP_LIMIT = 5
+MAX_TOP_LIMIT = 100
+
+
+def _values(alias, sign):
+    """Expresiones SQL (key, estado, columnas...) de la fila NEW u OLD."""
+    f = lambda field: storage.backend.field_expr(field, alias)  # noqa: E731
+    dias = f"COALESCE({f('diasStock')}, 0)"
+    values = [str(sign)]
+    values += [f"{sign} * COALESCE({f(field)}, 0)" for field in SUM_FIELDS.values()]
+    values += [f"{sign} * ({dias} {cond})" for cond in AGING_BUCKETS.values()]
+    return values
+
+
+def _upsert(dimension, alias, sign):
+    field = DIMENSIONS[dimension]
+    key = f"COALESCE({storage.backend.field_expr(field, alias)}, '')" if field else "''"
+    estado = f"COALESCE({storage.backend.field_expr('estado', alias)}, '')"
+    names = ", ".join(COLUMNS)
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in COLUMNS)
+    return (
+        f"INSERT INTO stats_totals (dimension, key, estado, {names}) "
+        f"VALUES ('{dimension}', {key}, {estado}, {', '.join(_values(alias, sign))}) "
+        f"ON CONFLICT (dimension, key, estado) DO UPDATE SET {updates};"
+    )
+
+
+def _trigger_body(*rows):
+    return "\n".join(_upsert(d, alias, sign) for alias, sign in rows for d in DIMENSIONS)
+
+
+def create_schema(conn):
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS stats_totals (
+        dimension TEXT, key TEXT, estado TEXT,
+        {", ".join(f"{c} REAL DEFAULT 0" for c in COLUMNS)},
+        PRIMARY KEY (dimension, key, estado)) WITHOUT ROWID''')
+    triggers = {
+        "insert": _trigger_body(("NEW", 1)),
+        "update": _trigger_body(("OLD", -1), ("NEW", 1)),
+        "delete": _trigger_body(("OLD", -1)),
+    }
+    for event, body in triggers.items():
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_stats_{event} AFTER {event.upper()} ON vehiculos
+            BEGIN {body} END''')
+
+    f = storage.backend.field_expr
+    # Ranking de conversión y lista de "requiere atención" sin recorrer la tabla
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_vehiculos_conversion ON vehiculos "
+        f"(({f('interesados')} * 1.0 / {f('vistas')}), {f('vistas')})"
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_vehiculos_estado_dias ON vehiculos ({f('estado')}, {f('diasStock')})"
+    )
+
+    # Base que ya tenía autos antes de existir los triggers
+    if conn.execute("SELECT 1 FROM stats_totals LIMIT 1").fetchone() is None:
+        rebuild(conn)
+
+
+def rebuild(conn):
+    """Recalcula stats_totals desde cero (una pasada por dimensión)."""
+    f = storage.backend.field_expr
+    dias = f"COALESCE({f('diasStock')}, 0)"
+    sums = ["COUNT(*)"]
+    sums += [f"SUM(COALESCE({f(field)}, 0))" for field in SUM_FIELDS.values()]
+    sums += [f"SUM({dias} {cond})" for cond in AGING_BUCKETS.values()]
+    conn.execute("DELETE FROM stats_totals")
+    for dimension, field in DIMENSIONS.items():
+        key = f"COALESCE({f(field)}, '')" if field else "''"
+        estado = f"COALESCE({f('estado')}, '')"
+        conn.execute(
+            f"INSERT INTO stats_totals (dimension, key, estado, {', '.join(COLUMNS)}) "
+            f"SELECT '{dimension}', {key}, {estado}, {', '.join(sums)} FROM vehiculos "
+            f"GROUP BY 2, 3"
+        )
+
+
+# --- LECTURA ---
+
+def _number(value):
+    return int(value) if value is not None and float(value).is_integer() else value
+
+
+def _totals(rows):
+    total = dict.fromkeys(COLUMNS, 0)
+    for row in rows:
+        for c in COLUMNS:
+            total[c] += row[c] or 0
+    return total
+
+
+def _format(total, sold):
+    """Mismas fórmulas que el dashboard de SellerPortal.tsx."""
+    count = total["count"]
+    return {
+        "count": _number(count),
+        "vendidos": _number(sold["count"]),
+        "vistas": _number(total["sum_vistas"]),
+        "interesados": _number(total["sum_interesados"]),
+        "promedioDias": round(total["sum_dias"] / count) if count else 0,
+        "conversion": sold["count"] / count * 100 if count else 0,
+        "antiguedad": {
+            "0-30": _number(total["dias_0_30"]),
+            "31-60": _number(total["dias_31_60"]),
+            "60+": _number(total["dias_60_mas"]),
+        },
+    }
+
+
+def _summarize(rows):
+    """Totales de un grupo a partir de sus filas por estado."""
+    rows = list(rows)
+    sold = _totals(r for r in rows if r["estado"] == "Vendido")
+    available = _totals(r for r in rows if r["estado"] != "Vendido")
+    result = _format(_totals(rows), sold)
+    result.update({
+        "disponibles": _number(available["count"]),
+        "valorTotal": _number(available["sum_precio"]),
+        "comisionTotal": _number(available["sum_comision"]),
+        "precioPromedio": available["sum_precio"] / available["count"] if available["count"] else 0,
+    })
+    return result
+
+
+def overview(conn):
+    rows = conn.execute("SELECT * FROM stats_totals WHERE dimension = 'all'").fetchall()
+    result = _summarize(rows)
+    result["porEstado"] = {r["estado"]: _number(r["count"]) for r in rows if r["count"]}
+    return result
+
+
+def by_dimension(conn, dimension):
+    """Totales por vendedor o por marca: {key: {...}} ordenado por cantidad."""
+    rows = conn.execute(
+        "SELECT * FROM stats_totals WHERE dimension = ? AND count > 0 ORDER BY key", (dimension,)
+    ).fetchall()
+    groups = {}
+    for row in rows:
+        groups.setdefault(row["key"], []).append(row)
+    result = [{"key": key, **_summarize(group)} for key, group in groups.items()]
+    result.sort(key=lambda g: g["count"], reverse=True)
+    return result
+
+
+def by_estado(conn):
+    rows = conn.execute(
+        "SELECT * FROM stats_totals WHERE dimension = 'all' AND count > 0 ORDER BY count DESC"
+    ).fetchall()
+    return [
+        {
+            "estado": row["estado"],
+            "count": _number(row["count"]),
+            "valorTotal": _number(row["sum_precio"]),
+            "comisionTotal": _number(row["sum_comision"]),
+            "vistas": _number(row["sum_vistas"]),
+            "interesados": _number(row["sum_interesados"]),
+            "promedioDias": round(row["sum_dias"] / row["count"]),
+        }
+        for row in rows
+    ]
+
+
+def top_conversion(conn, select_list, limit=TOP_LIMIT):
+    """Autos con vistas ordenados por interesados / vistas (y luego por vistas)."""
+    f = storage.backend.field_expr
+    return conn.execute(
+        f"SELECT {select_list} FROM vehiculos WHERE {f('vistas')} > 0 "
+        f"ORDER BY {f('interesados')} * 1.0 / {f('vistas')} DESC, {f('vistas')} DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+
+
+def needs_attention(conn, select_list, days=ATTENTION_DAYS, limit=TOP_LIMIT):
+    """Autos 'Disponible' con más de `days` días en stock, los más antiguos primero."""
+    f = storage.backend.field_expr
+    return conn.execute(
+        f"SELECT {select_list} FROM vehiculos WHERE {f('estado')} = 'Disponible' AND {f('diasStock')} > ? "
+        f"ORDER BY {f('diasStock')} DESC LIMIT ?",
+        (days, limit),
+    ).fetchall()
@@ -0,0 +1,276 @@
+import json
+import os
+import re
+import time
+import unicodedata
+
+import metrics
+
+# --- ALMACENAMIENTO DE VEHÍCULOS ---
+# Dos formatos para la tabla "vehiculos":
+#   json      -> (id, data TEXT) con el documento completo (formato histórico)
+#   columnar  -> una columna tipada por campo, según VehiculoDB en models.py
+# Se elige con LIONS_STORAGE. Los endpoints solo hablan con `backend`, así el
+# formato de la respuesta de la API es el mismo en ambos casos.
+# Para pasar de uno a otro ver migrate_columnar.py.
+
+STORAGE_BACKEND = os.getenv("LIONS_STORAGE", "json")
+
+# Cada formato vive en su propio archivo (ambos usan el nombre de tabla
+# "vehiculos"); LIONS_DB_NAME permite apuntar a otro.
+DEFAULT_DB_NAMES = {"json": "lions_cars.db", "columnar": "lionscars.db"}
+DB_NAME = os.getenv("LIONS_DB_NAME") or DEFAULT_DB_NAMES[STORAGE_BACKEND]
+
+# Campos que lleva el servidor (contadores); un PUT del formulario no los pisa
+SERVER_FIELDS = ("vistas", "interesados")
+
+# Vista resumida para listados (catálogo, tablas del portal). Lo pesado
+# (hotspots, precioHistorial, obs...) queda solo en GET /api/autos/{id}.
+SUMMARY_FIELDS = (
+    "marca", "modelo", "version", "ano", "precio", "km", "duenos", "traccion",
+    "transmision", "combustible", "carroceria", "tipoVenta", "vendedor",
+    "financiable", "valorPie", "aire", "neumaticos", "estado", "diasStock",
+    "vistas", "interesados", "patente", "color", "comisionEstimada", "imagen",
+    "imagenes",
+)
+
+
+def make_summary(car):
+    return {f: car.get(f) for f in SUMMARY_FIELDS}
+
+
+def _picker(decode, fields):
+    """Envuelve un decodificador de filas para quedarse solo con `fields` (+ id)."""
+    if fields is None:
+        return decode
+    wanted = set(fields) | {"id"}
+    return lambda row: {k: v for k, v in decode(row).items() if k in wanted}
+
+
+def slugify(*parts):
+    text = " ".join(str(p) for p in parts if p not in (None, ""))
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+class JsonStorage:
+    name = "json"
+    select_list = "id, data"
+
+    def create_schema(self, conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS vehiculos (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT)")
+        # Resumen precalculado en cada escritura: los listados no parsean `data`
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(vehiculos)")}
+        if "summary" not in columns:
+            conn.execute("ALTER TABLE vehiculos ADD COLUMN summary TEXT")
+        self.backfill_summaries(conn)
+
+    def backfill_summaries(self, conn, batch_size=500):
+        while True:
+            rows = conn.execute(
+                "SELECT id, data FROM vehiculos WHERE summary IS NULL LIMIT ?", (batch_size,)
+            ).fetchall()
+            updates = []
+            for row in rows:
+                try:
+                    updates.append((json.dumps(make_summary(json.loads(row["data"]))), row["id"]))
+                except (TypeError, ValueError):
+                    updates.append(("{}", row["id"]))
+            if not updates:
+                return
+            conn.executemany("UPDATE vehiculos SET summary = ? WHERE id = ?", updates)
+
+    def projection(self, fields=None):
+        """(select_list, decode) para leer solo `fields`; None = documento completo."""
+        if fields is not None and set(fields) <= set(SUMMARY_FIELDS) | {"id"}:
+            return "id, summary", _picker(self.row_to_summary, fields)
+        return self.select_list, _picker(self.row_to_car, fields)
+
+    def row_to_summary(self, row):
+        start = time.perf_counter()
+        car_data = json.loads(row["summary"] or "{}")
+        metrics.observe_phase("decode", time.perf_counter() - start)
+        car_data["id"] = row["id"]
+        return car_data
+
+    def field_expr(self, field, alias=None):
+        prefix = f"{alias}." if alias else ""
+        if field == "id":
+            return f"{prefix}id"
+        return f"json_extract({prefix}data, '$.{field}')"
+
+    def content_changed(self, old="OLD", new="NEW"):
+        """Condición SQL (triggers de UPDATE): cambió algo más que los contadores."""
+        counters = ", ".join(f"'$.{f}'" for f in SERVER_FIELDS)
+        return f"json_remove({old}.data, {counters}) IS NOT json_remove({new}.data, {counters})"
+
+    def counters_changed(self, old="OLD", new="NEW"):
+        """Condición SQL (triggers de UPDATE): cambió alguno de SERVER_FIELDS."""
+        return " OR ".join(
+            f"json_extract({old}.data, '$.{f}') IS NOT json_extract({new}.data, '$.{f}')" for f in SERVER_FIELDS
+        )
+
+    def row_to_car(self, row):
+        start = time.perf_counter()
+        car_data = json.loads(row["data"])
+        metrics.observe_phase("decode", time.perf_counter() - start)
+        car_data["id"] = row["id"]
+        return car_data
+
+    def insert(self, conn, car):
+        data = {k: v for k, v in car.items() if k != "id"}
+        return conn.execute(
+            "INSERT INTO vehiculos (data, summary) VALUES (?, ?)",
+            (json.dumps(data), json.dumps(make_summary(data))),
+        ).lastrowid
+
+    def update(self, conn, item_id, car):
+        """Reemplaza el documento conservando SERVER_FIELDS. Devuelve False si no existe."""
+        data = {k: v for k, v in car.items() if k != "id"}
+        keep = ", ".join(f"'$.{f}', COALESCE(json_extract(data, '$.{f}'), 0)" for f in SERVER_FIELDS)
+        keep_data = keep
+        if "precioHistorial" not in data:
+            # Historial embebido de antes de price_history: se deja como estaba
+            keep_data += ", '$.precioHistorial', json(COALESCE(json_extract(data, '$.precioHistorial'), '[]'))"
+        cur = conn.execute(
+            f"UPDATE vehiculos SET data = json_set(?, {keep_data}), summary = json_set(?, {keep}) WHERE id = ?",
+            (json.dumps(data), json.dumps(make_summary(data)), item_id),
+        )
+        return cur.rowcount > 0
+
+    def assign(self, values):
+        """SET para fijar varios campos en una sola sentencia: (sql, params)."""
+        paths = ", ".join(f"'$.{field}', json(?)" for field in values)
+        sql, params = f"data = json_set(data, {paths})", [json.dumps(v) for v in values.values()]
+        in_summary = {f: v for f, v in values.items() if f in SUMMARY_FIELDS}
+        if in_summary:
+            paths = ", ".join(f"'$.{field}', json(?)" for field in in_summary)
+            sql += f", summary = json_set(summary, {paths})"
+            params += [json.dumps(v) for v in in_summary.values()]
+        return sql, params
+
+    def increment(self, fields):
+        """SET que suma el parámetro con nombre :campo a cada campo numérico de `fields`."""
+        sets = []
+        for column in ("data", "summary"):
+            paths = ", ".join(
+                f"'$.{f}', COALESCE(json_extract({column}, '$.{f}'), 0) + :{f}" for f in fields
+            )
+            sets.append(f"{column} = json_set({column}, {paths})")
+        return ", ".join(sets)
+
+
+class ColumnarStorage:
+    name = "columnar"
+
+    def __init__(self):
+        # models.py importa SQLAlchemy: solo se carga si se usa este formato
+        from models import VehiculoDB
+        from sqlalchemy import Boolean, JSON
+
+        self.table = VehiculoDB.__table__
+        self.columns = [c.name for c in self.table.columns if c.name not in ("id", "slug")]
+        self.json_columns = {c.name for c in self.table.columns if isinstance(c.type, JSON)}
+        self.bool_columns = {c.name for c in self.table.columns if isinstance(c.type, Boolean)}
+        self.select_list = "id, " + ", ".join(f'"{c}"' for c in self.columns)
+
+    def create_schema(self, conn):
+        from sqlalchemy.dialects import sqlite
+        from sqlalchemy.schema import CreateIndex, CreateTable
+
+        dialect = sqlite.dialect()
+        conn.execute(str(CreateTable(self.table, if_not_exists=True).compile(dialect=dialect)))
+        for index in self.table.indexes:
+            conn.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect)))
+
+    def field_expr(self, field, alias=None):
+        prefix = f"{alias}." if alias else ""
+        return f'{prefix}"{field}"'
+
+    def content_changed(self, old="OLD", new="NEW"):
+        """Condición SQL (triggers de UPDATE): cambió algo más que los contadores."""
+        return " OR ".join(
+            f'{old}."{c}" IS NOT {new}."{c}"' for c in self.columns if c not in SERVER_FIELDS
+        )
+
+    def counters_changed(self, old="OLD", new="NEW"):
+        """Condición SQL (triggers de UPDATE): cambió alguno de SERVER_FIELDS."""
+        return " OR ".join(f'{old}."{f}" IS NOT {new}."{f}"' for f in SERVER_FIELDS)
+
+    def _encode(self, column, value):
+        if column in self.json_columns:
+            return json.dumps(value if value is not None else [])
+        return value
+
+    def _decode(self, column, value):
+        if column in self.json_columns:
+            return json.loads(value) if value else []
+        if column in self.bool_columns and value is not None:
+            return bool(value)
+        return value
+
+    def row_to_car(self, row, columns=None):
+        start = time.perf_counter()
+        car_data = {c: self._decode(c, row[c]) for c in columns or self.columns}
+        metrics.observe_phase("decode", time.perf_counter() - start)
+        car_data["id"] = row["id"]
+        return car_data
+
+    def projection(self, fields=None):
+        """(select_list, decode) para leer solo las columnas de `fields`."""
+        if fields is None:
+            return self.select_list, self.row_to_car
+        columns = [c for c in self.columns if c in fields]
+        select_list = ", ".join(["id"] + [f'"{c}"' for c in columns])
+        return select_list, lambda row: self.row_to_car(row, columns)
+
+    def insert(self, conn, car, item_id=None):
+        columns = ["id"] + self.columns if item_id is not None else self.columns
+        values = [self._encode(c, car.get(c)) for c in self.columns]
+        if item_id is not None:
+            values.insert(0, item_id)
+        names = ", ".join(f'"{c}"' for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        new_id = conn.execute(f"INSERT INTO vehiculos ({names}) VALUES ({marks})", values).lastrowid
+        conn.execute(
+            "UPDATE vehiculos SET slug = ? WHERE id = ?",
+            (slugify(car.get("marca"), car.get("modelo"), car.get("ano"), new_id), new_id),
+        )
+        return new_id
+
+    def update(self, conn, item_id, car):
+        """Escribe solo las columnas que cambiaron. Devuelve False si no existe."""
+        row = conn.execute(f"SELECT {self.select_list} FROM vehiculos WHERE id = ?", (item_id,)).fetchone()
+        if row is None:
+            return False
+        current = self.row_to_car(row)
+        changed = {
+            c: car[c] for c in self.columns
+            if c in car and c not in SERVER_FIELDS and car[c] != current[c]
+        }
+        if changed:
+            set_sql, params = self.assign(changed)
+            if {"marca", "modelo", "ano"} & changed.keys():
+                merged = {**current, **changed}
+                set_sql += ", slug = ?"
+                params.append(slugify(merged["marca"], merged["modelo"], merged["ano"], item_id))
+            conn.execute(f"UPDATE vehiculos SET {set_sql} WHERE id = ?", params + [item_id])
+        return True
+
+    def assign(self, values):
+        sql = ", ".join(f'"{c}" = ?' for c in values)
+        return sql, [self._encode(c, v) for c, v in values.items()]
+
+    def increment(self, fields):
+        return ", ".join(f'"{f}" = COALESCE("{f}", 0) + :{f}' for f in fields)
+
+
+def get_storage(name=STORAGE_BACKEND):
+    if name == "json":
+        return JsonStorage()
+    if name == "columnar":
+        return ColumnarStorage()
+    raise ValueError(f"LIONS_STORAGE desconocido: {name}")
+
+
+backend = get_storage()
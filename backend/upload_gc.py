@@ -0,0 +1,363 @@
+import json
+import os
+import threading
+import time
+
+import storage
+import uploads
+
+# --- LIMPIEZA DE FOTOS HUÉRFANAS EN UPLOAD_DIR ---
+# Borrar un auto o reemplazar sus fotos deja los archivos en disco. Un hilo
+# recorre UPLOAD_DIR y mantiene un índice (upload_files: ruta, carpeta, tamaño)
+# sin releer todo cada vez: upload_dirs guarda el mtime de cada carpeta y solo
+# se lista (os.scandir) la que cambió; agregar o borrar un archivo cambia el
+# mtime de su carpeta. Una pasada sin cambios es un stat por carpeta.
+#
+# Una foto está en uso si su URL aparece en `imagenes`/`imagen` de algún
+# vehículo, si es variante (thumb/medium) de una foto en uso o si es un blob
+# enlazado en vehicle_photos. Las demás siguen este camino:
+#   1. huérfana: se anota desde cuándo (orphan_since)
+#   2. después de GRACE_HOURS (y si el archivo tampoco es reciente) se mueve a
+#      UPLOAD_DIR/.quarantine/<misma ruta>
+#   3. después de QUARANTINE_DAYS en cuarentena se borra
+# Si en el camino algún auto vuelve a usarla, se devuelve a su lugar. El plazo
+# de gracia cubre las fotos recién subidas cuyo formulario aún no se guarda.
+#
+# GET /api/admin/uploads muestra, por carpeta, cuánto se puede recuperar.
+
+GC_INTERVAL_MINUTES = float(os.getenv("LIONS_UPLOAD_GC_MINUTES", "60"))  # 0 = sin hilo
+GRACE_HOURS = float(os.getenv("LIONS_UPLOAD_GC_GRACE_H", "24"))
+QUARANTINE_DAYS = float(os.getenv("LIONS_UPLOAD_GC_QUARANTINE_D", "7"))
+
+QUARANTINE_FOLDER = ".quarantine"
+
+
+def create_schema(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS upload_dirs (path TEXT PRIMARY KEY, mtime REAL) WITHOUT ROWID")
+    conn.execute('''CREATE TABLE IF NOT EXISTS upload_files (
+        path TEXT PRIMARY KEY, dir TEXT NOT NULL, folder TEXT NOT NULL,
+        size INTEGER, mtime REAL, orphan_since REAL, quarantined_at REAL) WITHOUT ROWID''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_upload_files_dir ON upload_files (dir)")
+
+
+def _folder(relpath):
+    # Primera carpeta bajo UPLOAD_DIR ("toyota_yaris", "blobs"); "" = raíz
+    return relpath.split("/", 1)[0] if "/" in relpath else ""
+
+
+def _parent(relpath):
+    return relpath.rsplit("/", 1)[0] if "/" in relpath else ""
+
+
+# --- RECORRIDO DEL DISCO ---
+
+def _list_dir(upload_dir, rel):
+    """(archivos [(ruta, tamaño, mtime)], subcarpetas) de una carpeta."""
+    files, dirs = [], []
+    with os.scandir(os.path.join(upload_dir, rel) if rel else upload_dir) as entries:
+        for entry in entries:
+            # Temporales (.upload-*.part) y la cuarentena
+            if entry.name.startswith("."):
+                continue
+            relpath = f"{rel}/{entry.name}" if rel else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(relpath)
+            elif entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                files.append((relpath, st.st_size, st.st_mtime))
+    return files, dirs
+
+
+def scan(db, writer, upload_dir):
+    """Pone al día upload_files listando solo las carpetas cuyo mtime cambió."""
+    with db.connection() as conn:
+        known = dict(conn.execute("SELECT path, mtime FROM upload_dirs").fetchall())
+    pending = ["", *known]
+    seen = set()
+    checkpoints, listings, gone = {}, {}, []
+    while pending:
+        rel = pending.pop()
+        if rel in seen:
+            continue
+        seen.add(rel)
+        try:
+            # mtime antes de listar: si algo cambia mientras tanto se relista la próxima vez
+            mtime = os.stat(os.path.join(upload_dir, rel) if rel else upload_dir).st_mtime
+            if known.get(rel) == mtime:
+                continue
+            files, dirs = _list_dir(upload_dir, rel)
+        except (FileNotFoundError, NotADirectoryError):
+            gone.append(rel)
+            continue
+        checkpoints[rel] = mtime
+        listings[rel] = files
+        pending += [d for d in dirs if d not in seen]
+
+    def write(conn):
+        for rel in gone:
+            conn.execute("DELETE FROM upload_dirs WHERE path = ?", (rel,))
+            conn.execute("DELETE FROM upload_files WHERE dir = ? AND quarantined_at IS NULL", (rel,))
+        for rel, files in listings.items():
+            present = {path for path, _, _ in files}
+            stale = [
+                r["path"] for r in conn.execute(
+                    "SELECT path FROM upload_files WHERE dir = ? AND quarantined_at IS NULL", (rel,)
+                ) if r["path"] not in present
+            ]
+            conn.executemany("DELETE FROM upload_files WHERE path = ?", [(p,) for p in stale])
+            # Un archivo que volvió a aparecer (p.ej. el mismo blob subido de nuevo) sale de la cuarentena
+            restored = [
+                r["path"] for r in conn.execute(
+                    "SELECT path FROM upload_files WHERE dir = ? AND quarantined_at IS NOT NULL", (rel,)
+                ) if r["path"] in present
+            ]
+            for path in restored:
+                _remove_quietly(os.path.join(upload_dir, QUARANTINE_FOLDER, path))
+            conn.executemany(
+                "INSERT INTO upload_files (path, dir, folder, size, mtime) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, "
+                "quarantined_at = NULL",
+                [(path, rel, _folder(path), size, mtime) for path, size, mtime in files],
+            )
+        conn.executemany(
+            "INSERT OR REPLACE INTO upload_dirs (path, mtime) VALUES (?, ?)", list(checkpoints.items())
+        )
+
+    writer.run(write)
+    return {"listedDirs": len(listings), "checkedDirs": len(seen)}
+
+
+# --- FOTOS EN USO ---
+
+def referenced_paths(conn, public_url):
+    """Rutas relativas a UPLOAD_DIR de las fotos que algún vehículo usa."""
+    prefix = public_url.rstrip("/") + "/"
+    urls = {
+        r[0] for r in conn.execute(
+            f"SELECT h.value FROM vehiculos v JOIN json_each(COALESCE({storage.backend.field_expr('imagenes', 'v')}, '[]')) h "
+            f"UNION SELECT {storage.backend.field_expr('imagen')} FROM vehiculos"
+        ) if isinstance(r[0], str)
+    }
+    for r in conn.execute("SELECT url, variants FROM image_variants"):
+        if r["url"] in urls:
+            urls.update(json.loads(r["variants"]).values())
+    paths = {u[len(prefix):] for u in urls if u.startswith(prefix)}
+    paths.update(
+        r[0] for r in conn.execute(
+            "SELECT path FROM photo_blobs WHERE hash IN (SELECT hash FROM vehicle_photos)"
+        ) if r[0]
+    )
+    return paths
+
+
+def touch(upload_dir, relpath):
+    """
+    Una subida repetida (dedup) entrega la URL de un blob que ya existía: se
+    renueva su mtime para que el plazo de gracia vuelva a correr desde ahora,
+    aunque el formulario se guarde mucho después. Va junto con keep().
+    """
+    try:
+        os.utime(os.path.join(upload_dir, relpath))
+    except FileNotFoundError:
+        pass
+
+
+def keep(conn, relpath):
+    conn.execute(
+        "UPDATE upload_files SET orphan_since = NULL, mtime = ? WHERE path = ? AND quarantined_at IS NULL",
+        (time.time(), relpath),
+    )
+
+
+def is_orphan(conn, relpath):
+    """True si la última pasada la marcó huérfana (o ya está en cuarentena)."""
+    row = conn.execute(
+        "SELECT orphan_since IS NOT NULL OR quarantined_at IS NOT NULL AS orphan FROM upload_files WHERE path = ?",
+        (relpath,),
+    ).fetchone()
+    return bool(row and row["orphan"])
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _move(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(src, dst)
+
+
+def reconcile(db, writer, upload_dir, public_url, now=None, grace_hours=GRACE_HOURS, quarantine_days=QUARANTINE_DAYS):
+    """Marca huérfanas, mueve a cuarentena las vencidas y borra las que cumplieron el plazo."""
+    now = time.time() if now is None else now
+    grace_until = now - grace_hours * 3600
+    delete_until = now - quarantine_days * 86400
+    with db.connection() as conn:
+        in_use = referenced_paths(conn, public_url)
+        rows = conn.execute(
+            "SELECT path, size, mtime, orphan_since, quarantined_at FROM upload_files"
+        ).fetchall()
+
+    quarantine = os.path.join(upload_dir, QUARANTINE_FOLDER)
+    marked, cleared, quarantined, restored, deleted = [], [], [], [], []
+    for r in rows:
+        path = r["path"]
+        if path in in_use:
+            if r["quarantined_at"] is not None:
+                try:
+                    _move(os.path.join(quarantine, path), os.path.join(upload_dir, path))
+                except FileNotFoundError:
+                    continue
+                restored.append(r)
+            elif r["orphan_since"] is not None:
+                cleared.append(path)
+        elif r["orphan_since"] is None:
+            marked.append(path)
+        elif r["quarantined_at"] is None:
+            if r["orphan_since"] <= grace_until and (r["mtime"] or 0) <= grace_until:
+                try:
+                    # El índice se leyó antes: una subida repetida (touch) pudo renovarlo
+                    if os.stat(os.path.join(upload_dir, path)).st_mtime > grace_until:
+                        continue
+                    _move(os.path.join(upload_dir, path), os.path.join(quarantine, path))
+                except FileNotFoundError:
+                    continue  # ya no está: lo saca el próximo scan
+                quarantined.append(path)
+        elif r["quarantined_at"] <= delete_until:
+            _remove_quietly(os.path.join(quarantine, path))
+            deleted.append(r)
+
+    for r in deleted:
+        # Carpetas antiguas (marca_modelo) que quedaron vacías
+        for base in (upload_dir, quarantine):
+            try:
+                os.rmdir(os.path.join(base, _parent(r["path"])))
+            except OSError:
+                pass
+
+    def write(conn):
+        conn.executemany("UPDATE upload_files SET orphan_since = ? WHERE path = ?", [(now, p) for p in marked])
+        conn.executemany("UPDATE upload_files SET orphan_since = NULL WHERE path = ?", [(p,) for p in cleared])
+        conn.executemany(
+            "UPDATE upload_files SET quarantined_at = ? WHERE path = ?", [(now, p) for p in quarantined]
+        )
+        # find_blob no debe ofrecer un blob que ya no está en su lugar
+        conn.executemany("DELETE FROM photo_blobs WHERE path = ?", [(p,) for p in quarantined])
+        for r in restored:
+            conn.execute(
+                "UPDATE upload_files SET orphan_since = NULL, quarantined_at = NULL WHERE path = ?", (r["path"],)
+            )
+            digest = uploads.blob_hash_from_url(f"/{r['path']}")
+            if digest:
+                uploads.register_blob(conn, digest, r["path"], r["size"])
+        conn.executemany("DELETE FROM upload_files WHERE path = ?", [(r["path"],) for r in deleted])
+        conn.executemany(
+            "DELETE FROM image_variants WHERE url = ?", [(f"{public_url}/{r['path']}",) for r in deleted]
+        )
+
+    writer.run(write)
+    return {
+        "marked": len(marked), "quarantined": len(quarantined),
+        "restored": len(restored), "deleted": len(deleted),
+        "deletedBytes": sum(r["size"] or 0 for r in deleted),
+    }
+
+
+# --- REPORTE ---
+
+def report(conn):
+    """Uso de disco por carpeta: total, huérfanas, en cuarentena y recuperable."""
+    rows = conn.execute('''SELECT folder,
+            COUNT(*) AS files, COALESCE(SUM(size), 0) AS bytes,
+            SUM(orphan_since IS NOT NULL AND quarantined_at IS NULL) AS orphan_files,
+            COALESCE(SUM(CASE WHEN orphan_since IS NOT NULL AND quarantined_at IS NULL THEN size END), 0) AS orphan_bytes,
+            SUM(quarantined_at IS NOT NULL) AS quarantined_files,
+            COALESCE(SUM(CASE WHEN quarantined_at IS NOT NULL THEN size END), 0) AS quarantined_bytes
+        FROM upload_files GROUP BY folder''').fetchall()
+    folders = [
+        {
+            "folder": r["folder"],
+            "files": r["files"],
+            "bytes": r["bytes"],
+            "orphanFiles": r["orphan_files"],
+            "orphanBytes": r["orphan_bytes"],
+            "quarantinedFiles": r["quarantined_files"],
+            "quarantinedBytes": r["quarantined_bytes"],
+            "reclaimableBytes": r["orphan_bytes"] + r["quarantined_bytes"],
+        }
+        for r in rows
+    ]
+    folders.sort(key=lambda f: (-f["reclaimableBytes"], f["folder"]))
+    totals = {
+        key: sum(f[key] for f in folders)
+        for key in ("files", "bytes", "orphanFiles", "orphanBytes", "quarantinedFiles", "quarantinedBytes", "reclaimableBytes")
+    }
+    last = conn.execute("SELECT value FROM app_settings WHERE name = 'upload_gc_last'").fetchone()
+    return {
+        "lastRun": float(last["value"]) if last else None,
+        "graceHours": GRACE_HOURS,
+        "quarantineDays": QUARANTINE_DAYS,
+        "totals": totals,
+        "folders": folders,
+    }
+
+
+# --- HILO ---
+
+def _claim(conn, now, interval):
+    # Con varios workers solo uno hace cada pasada: el que logra mover la marca
+    conn.execute("INSERT OR IGNORE INTO app_settings (name, value) VALUES ('upload_gc_next', '0')")
+    return conn.execute(
+        "UPDATE app_settings SET value = ? WHERE name = 'upload_gc_next' AND CAST(value AS REAL) <= ?",
+        (str(now + interval), now),
+    ).rowcount == 1
+
+
+class UploadCollector:
+    """Hilo que llama a run_once() cada `interval_minutes` minutos."""
+
+    def __init__(self, db, writer, upload_dir, public_url, interval_minutes=GC_INTERVAL_MINUTES):
+        """db: pool para leer; writer: cola de escrituras (writer.WriteQueue)."""
+        self.db = db
+        self.writer = writer
+        self.upload_dir = upload_dir
+        self.public_url = public_url
+        self.interval = interval_minutes * 60
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        with self._lock:
+            result = scan(self.db, self.writer, self.upload_dir)
+            result.update(reconcile(self.db, self.writer, self.upload_dir, self.public_url))
+            self.writer.run(
+                lambda conn: conn.execute(
+                    "INSERT OR REPLACE INTO app_settings (name, value) VALUES ('upload_gc_last', ?)",
+                    (str(time.time()),),
+                )
+            )
+        return result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self.writer.run(_claim, time.time(), self.interval):
+                    self.run_once()
+            except Exception as e:
+                print(f"Error limpiando fotos huérfanas: {e}")
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="upload-gc", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import tempfile
+
+# --- GUARDADO DE FOTOS EN DISCO (por contenido) ---
+# Cada foto se guarda UNA vez con el nombre de su SHA-256:
+#   UPLOAD_DIR/blobs/3f/3fa9...e1.jpg
+# Si alguien vuelve a subir la misma foto (p.ej. un auto que se vuelve a
+# publicar) no se escribe nada: se devuelve la URL que ya existía. Como el
+# contenido de una URL nunca cambia, Nginx puede cachearlas para siempre:
+#
+#   location /uploads/blobs/ {
+#       add_header Cache-Control "public, max-age=31536000, immutable";
+#   }
+#
+# Las funciones de disco son I/O bloqueante: los endpoints async las llaman con
+# run_in_threadpool para no frenar el event loop mientras se copia una foto.
+# Las fotos antiguas (UPLOAD_DIR/marca_modelo/nombre.jpg) siguen funcionando.
+
+MAX_UPLOAD_BYTES = int(os.getenv("LIONS_MAX_UPLOAD_MB", "15")) * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+# Cuántas fotos de un mismo lote se guardan a la vez
+BATCH_CONCURRENCY = int(os.getenv("LIONS_UPLOAD_CONCURRENCY", "4"))
+
+BLOB_FOLDER = "blobs"
+# Extensiones equivalentes se guardan con un solo nombre para no duplicar
+EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg", ".tif": ".tiff"}
+
+
+class UploadTooLarge(Exception):
+    """El archivo supera MAX_UPLOAD_BYTES (se traduce a un 413)."""
+
+
+def folder_name(marca, modelo):
+    # Ej: "Toyota Corolla" -> "toyota_corolla" (carpetas del formato antiguo)
+    return f"{marca.strip()}_{modelo.strip()}".lower().replace(" ", "_")
+
+
+def clean_extension(filename):
+    _, extension = os.path.splitext(os.path.basename(filename or ""))
+    extension = extension.lower()
+    return EXTENSION_ALIASES.get(extension, extension) or ".jpg"
+
+
+def blob_relpath(digest, extension):
+    """Ruta relativa a UPLOAD_DIR (y a la URL pública) de un blob."""
+    return f"{BLOB_FOLDER}/{digest[:2]}/{digest}{extension}"
+
+
+def blob_hash_from_url(url):
+    """SHA-256 de una URL de blob, o None si es una foto del formato antiguo."""
+    marker = f"/{BLOB_FOLDER}/"
+    if not url or marker not in url:
+        return None
+    name = url.rsplit("/", 1)[-1]
+    digest = name.split(".", 1)[0]
+    return digest if len(digest) == 64 else None
+
+
+def _write_temp(src, target_folder, max_bytes):
+    """
+    Copia src por bloques a un temporal en la misma carpeta (mismo disco =>
+    rename atómico) calculando el SHA-256 en la misma pasada.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=target_folder, prefix=".upload-", suffix=".part")
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"La foto supera {max_bytes // (1024 * 1024)} MB")
+                sha.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path, sha.hexdigest(), size
+
+
+def store_blob(src, upload_dir, filename, max_bytes=None):
+    """
+    Guarda un archivo subido por contenido. Devuelve (sha256, ruta_relativa,
+    tamaño, nuevo); nuevo=False si la foto ya estaba guardada.
+    """
+    if max_bytes is None:
+        max_bytes = MAX_UPLOAD_BYTES
+    staging = os.path.join(upload_dir, BLOB_FOLDER)
+    os.makedirs(staging, exist_ok=True)
+    tmp_path, digest, size = _write_temp(src, staging, max_bytes)
+    relpath = blob_relpath(digest, clean_extension(filename))
+    final_path = os.path.join(upload_dir, relpath)
+    try:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        # os.link falla si ya existe: dos subidas iguales nunca se pisan y no
+        # hace falta revisar antes con os.path.exists
+        os.link(tmp_path, final_path)
+        created = True
+    except FileExistsError:
+        created = False
+    finally:
+        os.unlink(tmp_path)
+    return digest, relpath, size, created
+
+
+# --- ÍNDICE DE FOTOS (blobs y qué vehículos los usan) ---
+
+def create_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS photo_blobs (
+        hash TEXT PRIMARY KEY, path TEXT, size INTEGER, created_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS vehicle_photos (
+        vehiculo_id INTEGER, hash TEXT, PRIMARY KEY (vehiculo_id, hash)) WITHOUT ROWID''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vehicle_photos_hash ON vehicle_photos (hash)")
+
+
+def register_blob(conn, digest, relpath, size):
+    conn.execute(
+        "INSERT OR IGNORE INTO photo_blobs (hash, path, size) VALUES (?, ?, ?)", (digest, relpath, size)
+    )
+
+
+def find_blob(conn, digest):
+    row = conn.execute("SELECT path FROM photo_blobs WHERE hash = ?", (digest,)).fetchone()
+    return row["path"] if row else None
+
+
+def sync_vehicle_refs(conn, vehiculo_id, urls):
+    """Deja en vehicle_photos exactamente los blobs que usa el vehículo."""
+    hashes = {h for h in (blob_hash_from_url(u) for u in urls or []) if h}
+    conn.execute("DELETE FROM vehicle_photos WHERE vehiculo_id = ?", (vehiculo_id,))
+    conn.executemany(
+        "INSERT INTO vehicle_photos (vehiculo_id, hash) VALUES (?, ?)",
+        [(vehiculo_id, h) for h in hashes],
+    )
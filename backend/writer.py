@@ -0,0 +1,153 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+from sqlite_pool import PoolTimeout
+
+# --- ESCRITOR ÚNICO CON GROUP COMMIT ---
+# SQLite admite un solo escritor a la vez. En vez de que cada endpoint abra su
+# transacción (y espere el lock y haga su propio fsync), todas las escrituras
+# se encolan aquí como funciones fn(conn) -> resultado. Un hilo las toma de a
+# lotes y las ejecuta en UNA transacción: más carga = lotes más grandes, no
+# más peleas por el lock.
+#
+# Cada operación corre dentro de un SAVEPOINT: si una falla (p.ej. un UNIQUE)
+# solo se deshace esa y su excepción le llega a quien la pidió; las demás del
+# lote se guardan igual. Los resultados se entregan después del COMMIT.
+#
+# La cola es acotada (WRITE_QUEUE_SIZE): si se llena, quien escribe espera
+# hasta WRITE_QUEUE_TIMEOUT y luego recibe WriteQueueFull (503).
+
+WRITE_QUEUE_SIZE = int(os.getenv("LIONS_WRITE_QUEUE_SIZE", "512"))
+WRITE_QUEUE_TIMEOUT = float(os.getenv("LIONS_WRITE_QUEUE_TIMEOUT", "10"))
+WRITE_BATCH_SIZE = int(os.getenv("LIONS_WRITE_BATCH_SIZE", "200"))
+# Espera extra para juntar más operaciones en el lote (0 = solo las ya encoladas)
+WRITE_TICK_MS = float(os.getenv("LIONS_WRITE_TICK_MS", "0"))
+
+
+class WriteQueueFull(PoolTimeout):
+    """La cola de escrituras está llena (se traduce a un 503 igual que el pool)."""
+
+
+_STOP = object()
+
+
+class WriteQueue:
+    def __init__(self, db, max_pending=WRITE_QUEUE_SIZE, max_batch=WRITE_BATCH_SIZE, tick_ms=WRITE_TICK_MS):
+        self.db = db
+        self.max_batch = max_batch
+        self.tick = tick_ms / 1000
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --- API para los endpoints ---
+
+    def submit(self, fn, *args, block=True):
+        """
+        Encola fn(conn, *args) y devuelve un Future con su resultado. fn no
+        debe hacer commit(): el lote completo se confirma al final.
+        """
+        if threading.current_thread() is self._thread:
+            # Se quedaría esperando a sí misma: fn debe hacer todo con su conn
+            raise RuntimeError("No se puede encolar una escritura desde el hilo escritor")
+        self.start()
+        future = Future()
+        try:
+            self._queue.put((fn, args, future), block=block, timeout=WRITE_QUEUE_TIMEOUT if block else None)
+        except queue.Full:
+            raise WriteQueueFull(f"Cola de escrituras llena ({self._queue.maxsize})")
+        return future
+
+    def run(self, fn, *args):
+        """Escribe y espera el resultado (para endpoints y hilos síncronos)."""
+        return self.submit(fn, *args).result()
+
+    async def run_async(self, fn, *args):
+        """Igual que run() pero sin bloquear el event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, block=False))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    # --- Hilo escritor ---
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = self.tick
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=deadline) if deadline else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Terminar este lote y después salir
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _commit_batch(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    results.append(None)
+                    continue
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((True, fn(conn, *args)))
+                    conn.execute("RELEASE op")
+                except BaseException as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((False, e))
+            start = time.perf_counter()
+            conn.commit()
+            metrics.observe_phase("commit", time.perf_counter() - start)
+        except BaseException as e:
+            # Falló el lote completo (lock tomado por otro proceso, disco lleno en el COMMIT...)
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if result is None:
+                continue
+            ok, value = result
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _run(self):
+        with self.db.connection() as conn:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self._commit_batch(conn, batch)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Termina de escribir lo encolado y detiene el hilo."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
@@ -2,12 +2,12 @@
 
 echo "🚀 Actualizando backend en producción..."
 
-# 1. Copiar main.py al VPS
-echo "📤 Copiando main.py al servidor..."
-scp /home/neuro/lions-cars-tienda/backend/main.py root@lionscars.cl:/root/lions-cars-tienda/backend/main.py
+# 1. Copiar los módulos del backend al VPS (main.py importa los demás .py)
+echo "📤 Copiando backend/*.py al servidor..."
+scp /home/neuro/lions-cars-tienda/backend/*.py root@lionscars.cl:/root/lions-cars-tienda/backend/
 
 if [ $? -eq 0 ]; then
-    echo "✅ Archivo copiado exitosamente"
+    echo "✅ Archivos copiados exitosamente"
     
     # 2. Reiniciar el backend en el VPS
     echo "🔄 Reiniciando backend en el servidor..."
@@ -15,13 +15,17 @@ if [ $? -eq 0 ]; then
 cd /root/lions-cars-tienda/backend
 pkill -f "python main.py"
 sleep 2
+# Pocos workers sobre el mismo SQLite: hay un solo escritor y cada worker
+# suma su hilo escritor y su pool de variantes (LIONS_WORKERS=1 vuelve a un
+# proceso; main.py no pasa de LIONS_MAX_WORKERS)
+export LIONS_WORKERS=${LIONS_WORKERS:-2}
 nohup python main.py > backend.log 2>&1 &
-echo "✅ Backend reiniciado"
+echo "✅ Backend reiniciado con $LIONS_WORKERS workers"
 ENDSSH
     
     echo "🎉 ¡Actualización completada!"
     echo "Los nuevos endpoints están disponibles en https://lionscars.cl"
 else
-    echo "❌ Error al copiar el archivo"
+    echo "❌ Error al copiar los archivos"
     exit 1
 fi
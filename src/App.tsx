@@ -21,8 +21,8 @@ import SellerPortal from './components/SellerPortal';
 import { ConfirmModal } from './components/ConfirmModal';
 
 // --- IMPORTACIÓN DE SERVICIOS (CONEXIÓN BACKEND) ---
-import { carService } from './services/api';
-import type { Vehiculo, Hotspot } from './services/api';
+import { carService, imageUrls, applyChanges } from './services/api';
+import type { Vehiculo, Hotspot, CatalogFacets } from './services/api';
 
 // --- COLORES DE MARCA LIONS CARS ---
 const GOLD_MAIN = '#E8B923';
@@ -114,7 +114,7 @@ const CarCard = ({ car, onClick, isFavorite, onToggleFavorite }: CarCardProps) =
   if (!car) return null;
 
   const imageList = Array.isArray(car.imagenes) && car.imagenes.length > 0
-    ? car.imagenes
+    ? imageUrls(car, 'medium')
     : (car.imagen ? [car.imagen] : ["https://via.placeholder.com/800x600?text=Lions+Cars"]);
 
   return (
@@ -868,11 +868,18 @@ const Footer = () => {
 
 function App() {
   const [stock, setStock] = useState<Vehiculo[]>([]);
+  // Versiones del catálogo cargado (para pedir solo los cambios y los contadores nuevos)
+  const [changesVersion, setChangesVersion] = useState<{ version: number; countersVersion: number } | null>(null);
   const navigate = useNavigate();
   const { id } = useParams();
   const [loading, setLoading] = useState(true);
   const [selectedSeller, setSelectedSeller] = useState('Todos');
   const [searchTerm, setSearchTerm] = useState('');
+  // Resultado de la búsqueda en el servidor (null = sin texto o sin respuesta aún)
+  const [searchIds, setSearchIds] = useState<Set<number> | null>(null);
+  const [suggestions, setSuggestions] = useState<string[]>([]);
+  // Cantidad de autos por opción de marca / vendedor según los demás filtros
+  const [facets, setFacets] = useState<CatalogFacets | null>(null);
   const [favorites, setFavorites] = useState<number[]>([]);
   const [selectedCar, setSelectedCar] = useState<Vehiculo | null>(null);
   const [financeCar, setFinanceCar] = useState<Vehiculo | null>(null);
@@ -905,7 +912,11 @@ useEffect(() => {
   if (id && stock.length > 0) {
     const carFound = stock.find(v => v.id === Number(id));
     if (carFound) {
-      setSelectedCar(carFound);
+      // El listado viene resumido: se muestra al tiro y se completa con el documento entero
+      setSelectedCar(prev => (prev && prev.id === carFound.id ? prev : carFound));
+      carService.getById(carFound.id)
+        .then(full => setSelectedCar(prev => (prev && prev.id === full.id ? full : prev)))
+        .catch(err => console.error('Error cargando vehículo:', err));
       // Incrementar vistas automáticamente cuando se abre el modal
       carService.incrementView(carFound.id).catch(err => console.error('Error incrementando vistas:', err));
     } else {
@@ -924,8 +935,9 @@ useEffect(() => {
   const fetchCars = async () => {
     try {
       setLoading(true);
-      const data = await carService.getAll();
-      setStock(data);
+      const { cars, version, countersVersion } = await carService.getCatalog();
+      setStock(cars);
+      setChangesVersion({ version, countersVersion });
     } catch (error) {
       console.error("Error cargando autos:", error);
       setNotification({ message: "Error de Conexión", sub: "Asegúrate de que el backend esté corriendo." });
@@ -934,6 +946,31 @@ useEffect(() => {
     }
   };
 
+  // --- CAMBIOS EN VIVO: long-poll a /autos/changes desde la versión cargada ---
+  useEffect(() => {
+    if (changesVersion === null) return;
+    let cancelled = false;
+    const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+    (async () => {
+      let { version: since, countersVersion: countersSince } = changesVersion;
+      while (!cancelled) {
+        try {
+          const delta = await carService.getChanges(since, 25, countersSince);
+          if (cancelled) return;
+          if (delta.reset) { fetchCars(); return; }
+          if (delta.changed.length || delta.deleted.length || delta.counters?.length) setStock(prev => applyChanges(prev, delta));
+          since = delta.version;
+          countersSince = delta.countersVersion ?? countersSince;
+          // Los contadores no cortan la espera; las ediciones se juntan un poco antes de volver a pedir
+          if (!delta.more) await sleep(2000);
+        } catch {
+          await sleep(10000);
+        }
+      }
+    })();
+    return () => { cancelled = true; };
+  }, [changesVersion]);
+
   // --- HANDLERS CONECTADOS A LA API ---
 
   const handleAddCar = async (car: Vehiculo) => {
@@ -982,17 +1019,81 @@ useEffect(() => {
     }
   };
 
-  const sellers = useMemo(() => ['Todos', ...Array.from(new Set(stock.map(c => c.vendedor)))], [stock]);
-  const marcas = useMemo(() => ['Todas', ...Array.from(new Set(stock.map(c => c.marca))).sort()], [stock]);
+  // --- BÚSQUEDA EN EL SERVIDOR (FTS, sin tildes) con espera de 200 ms entre teclas ---
+  useEffect(() => {
+    const q = searchTerm.trim();
+    if (!q) { setSearchIds(null); setSuggestions([]); return; }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const [ids, names] = await Promise.all([carService.searchIds(q), carService.suggest(q)]);
+        if (!cancelled) { setSearchIds(new Set(ids)); setSuggestions(names); }
+      } catch (error) {
+        console.error("Error en la búsqueda:", error);
+        if (!cancelled) setSearchIds(null);
+      }
+    }, 200);
+    return () => { cancelled = true; clearTimeout(timer); };
+  }, [searchTerm]);
+
+  // Firma de los campos que cuenta el panel: un delta que solo trae clics
+  // (vistas/interesados) no cambia la firma y no vuelve a pedir las facetas
+  const facetSignature = useMemo(() => {
+    let hash = 0;
+    for (const c of stock) {
+      const key = [c.id, c.marca, c.vendedor, c.combustible, c.transmision, c.traccion, c.carroceria,
+        c.tipoVenta, c.neumaticos, c.estado, c.precio, c.ano, c.km].join('|');
+      for (let i = 0; i < key.length; i++) hash = (Math.imul(hash, 31) + key.charCodeAt(i)) | 0;
+    }
+    return hash;
+  }, [stock]);
+
+  // --- FACETAS DEL PANEL (conteos del servidor con los filtros activos) ---
+  useEffect(() => {
+    const params = new URLSearchParams();
+    const set = (name: string, value: string, empty: string) => { if (value && value !== empty) params.set(name, value); };
+    set('marca', filters.marca, 'Todas');
+    set('vendedor', selectedSeller, 'Todos');
+    set('anoMin', filters.yearMin, ''); set('anoMax', filters.yearMax, '');
+    set('precioMin', filters.priceMin, ''); set('precioMax', filters.priceMax, '');
+    set('kmMin', filters.kmMin, ''); set('kmMax', filters.kmMax, '');
+    set('duenosMax', filters.duenosMax, '');
+    set('combustible', filters.combustible, 'Todos');
+    set('transmision', filters.transmision, 'Todas');
+    set('traccion', filters.traccion, 'Todas');
+    set('tipoVenta', filters.tipoVenta, 'Todos');
+    set('neumaticos', filters.neumaticos, 'Todos');
+    if (filters.financiable !== 'Todos') params.set('financiable', String(filters.financiable === 'Si'));
+    if (filters.aire !== 'Todos') params.set('aire', String(filters.aire === 'Si'));
+    let cancelled = false;
+    const timer = setTimeout(() => {
+      carService.getFacets(params)
+        .then(data => { if (!cancelled) setFacets(data); })
+        .catch(() => { if (!cancelled) setFacets(null); });
+    }, 200);
+    return () => { cancelled = true; clearTimeout(timer); };
+  }, [filters, selectedSeller, facetSignature]);
+
+  // Sin respuesta del servidor se arman desde el stock descargado (sin conteos)
+  const facetCount = (facet: string, value: string) => facets?.facets[facet]?.find(f => f.value === value)?.count;
+  // La opción elegida se mantiene aunque con los otros filtros quede en 0
+  const sellers = useMemo(() => ['Todos', ...Array.from(new Set([...(facets
+    ? facets.facets.vendedor.map(f => f.value)
+    : stock.map(c => c.vendedor)), ...(selectedSeller !== 'Todos' ? [selectedSeller] : [])]))], [stock, facets, selectedSeller]);
+  const marcas = useMemo(() => ['Todas', ...Array.from(new Set([...(facets
+    ? facets.facets.marca.map(f => f.value)
+    : stock.map(c => c.marca)), ...(filters.marca !== 'Todas' ? [filters.marca] : [])])).sort()], [stock, facets, filters.marca]);
 
   const filteredStock = useMemo(() => {
     return stock.filter(car => {
       const matchSeller = selectedSeller === 'Todos' || car.vendedor === selectedSeller;
+      // Mientras llega la respuesta del servidor se filtra como antes
       const searchLower = searchTerm.toLowerCase();
-      const matchSearch =
-        car.marca.toLowerCase().includes(searchLower) ||
-        car.modelo.toLowerCase().includes(searchLower) ||
-        car.ano.toString().includes(searchLower);
+      const matchSearch = searchIds
+        ? searchIds.has(car.id)
+        : car.marca.toLowerCase().includes(searchLower) ||
+          car.modelo.toLowerCase().includes(searchLower) ||
+          car.ano.toString().includes(searchLower);
 
       const matchMarca = filters.marca === 'Todas' || car.marca === filters.marca;
       const matchYearMin = !filters.yearMin || car.ano >= parseInt(filters.yearMin);
@@ -1012,7 +1113,7 @@ useEffect(() => {
 
       return matchSeller && matchSearch && matchMarca && matchYearMin && matchYearMax && matchPriceMin && matchPriceMax && matchKmMin && matchKmMax && matchCombustible && matchTransmision && matchTraccion && matchTipoVenta && matchFinanciable && matchDuenos && matchAire && matchNeumaticos;
     });
-  }, [stock, selectedSeller, searchTerm, filters]);
+  }, [stock, selectedSeller, searchTerm, searchIds, filters]);
 
   const toggleFavorite = (e: React.MouseEvent, id: number) => {
     e.stopPropagation();
@@ -1174,12 +1275,13 @@ useEffect(() => {
                     <h3 className="text-lg font-bold mb-3 flex items-center gap-2"><Filter size={18} className="text-[#E8B923]" /> Filtros</h3>
                     <div className="relative mb-4">
                       <Search className="absolute left-3 top-1/2 -translate-y-1/2 text-gray-500" size={16} />
-                      <input type="text" placeholder="Buscar..." className="w-full bg-black border border-gray-800 rounded-xl py-2 pl-10 pr-3 text-sm focus:border-[#E8B923] transition-all" value={searchTerm} onChange={(e) => setSearchTerm(e.target.value)} />
+                      <input type="text" placeholder="Buscar..." className="w-full bg-black border border-gray-800 rounded-xl py-2 pl-10 pr-3 text-sm focus:border-[#E8B923] transition-all" value={searchTerm} onChange={(e) => setSearchTerm(e.target.value)} list="catalog-suggestions" />
+                      <datalist id="catalog-suggestions">{suggestions.map(s => <option key={s} value={s} />)}</datalist>
                     </div>
                     <div className="space-y-3">
                       <div className="grid grid-cols-2 gap-2">
-                        <select value={filters.marca} onChange={e => setFilters({ ...filters, marca: e.target.value })} className="w-full bg-black border border-gray-800 rounded-lg py-2 px-2 text-xs text-white cursor-pointer">{marcas.map(m => <option key={m} value={m}>{m}</option>)}</select>
-                        <select value={selectedSeller} onChange={e => setSelectedSeller(e.target.value)} className="w-full bg-black border border-gray-800 rounded-lg py-2 px-2 text-xs text-white cursor-pointer">{sellers.map(s => <option key={s} value={s}>{s}</option>)}</select>
+                        <select value={filters.marca} onChange={e => setFilters({ ...filters, marca: e.target.value })} className="w-full bg-black border border-gray-800 rounded-lg py-2 px-2 text-xs text-white cursor-pointer">{marcas.map(m => <option key={m} value={m}>{m}{facetCount('marca', m) !== undefined ? ` (${facetCount('marca', m)})` : ''}</option>)}</select>
+                        <select value={selectedSeller} onChange={e => setSelectedSeller(e.target.value)} className="w-full bg-black border border-gray-800 rounded-lg py-2 px-2 text-xs text-white cursor-pointer">{sellers.map(s => <option key={s} value={s}>{s}{facetCount('vendedor', s) !== undefined ? ` (${facetCount('vendedor', s)})` : ''}</option>)}</select>
                       </div>
                       <div className="grid grid-cols-2 gap-2">
                         <input type="number" placeholder="Precio Min" value={filters.priceMin} onChange={e => setFilters({ ...filters, priceMin: e.target.value })} className="bg-black border border-gray-800 rounded-lg py-2 px-2 text-xs text-white" />
@@ -1,5 +1,5 @@
 import { Page, Text, View, Document, StyleSheet, Image, Link } from '@react-pdf/renderer';
-import type { Vehiculo } from '../services/api';
+import { imageUrls, type Vehiculo } from '../services/api';
 
 // --- ESTILOS PREMIUM (Lions Cars V3) ---
 const styles = StyleSheet.create({
@@ -126,8 +126,9 @@ const ZebraRow = ({ label, value, index }: { label: string, value: string | numb
 );
 
 export const CarPdfDocument = ({ car }: { car: Vehiculo }) => {
-  const mainImage = car.imagenes?.[0] || car.imagen;
-  const galleryImages = car.imagenes?.slice(1, 4) || [];
+  const pdfImages = imageUrls(car, 'mediumJpg');
+  const mainImage = pdfImages[0] || car.imagen;
+  const galleryImages = pdfImages.slice(1, 4);
   const isAvailable = car.estado === 'Disponible';
 
   // Datos para la tabla izquierda
@@ -17,8 +17,8 @@ import {
 } from 'recharts';
 
 // --- IMPORTACIÓN DE SERVICIOS (Simulada para mantener integridad) ---
-import { carService } from '../services/api';
-import type { Vehiculo, Hotspot, Brand, Color, User } from '../services/api';
+import { carService, imageUrls } from '../services/api';
+import type { Vehiculo, Hotspot, Brand, Color, User, DashboardStats } from '../services/api';
 
 // --- ESTILOS ---
 const GOLD_MAIN = '#E8B923';
@@ -30,6 +30,8 @@ const CAR_BRANDS = ["Abarth", "Acura", "Alfa Romeo", "Aston Martin", "Audi", "Be
 
 const currentYear = new Date().getFullYear();
 const YEARS = Array.from({ length: (currentYear + 1) - 2000 + 1 }, (_, i) => (currentYear + 1 - i).toString());
+// El dashboard pide los totales al servidor a lo más una vez por este intervalo
+const STATS_REFRESH_MS = 10000;
 
 // ===== INTERFACES =====
 interface Toast { id: number; message: string; type: 'success' | 'error' | 'info'; }
@@ -859,7 +861,7 @@ const InventoryView: React.FC<InventoryViewProps> = ({ stock, onEdit, onDelete }
                   <td className="p-4">
                     <div className="flex items-center gap-6">
                       <motion.div whileHover={{ scale: 1.1 }} className="w-24 h-16 rounded-2xl overflow-hidden ring-1 ring-white/10 group-hover:ring-[#E8B923]/50 transition-all shadow-lg relative flex-shrink-0">
-                        {car.imagenes && car.imagenes.length > 0 ? <AutoCarousel images={car.imagenes} interval={3500} /> : <img src={car.imagen || 'https://images.unsplash.com/photo-1503376780353-7e6692767b70?auto=format&fit=crop&q=80&w=800'} alt="" className="w-full h-full object-cover" />}
+                        {car.imagenes && car.imagenes.length > 0 ? <AutoCarousel images={imageUrls(car, 'thumb')} interval={3500} /> : <img src={car.imagen || 'https://images.unsplash.com/photo-1503376780353-7e6692767b70?auto=format&fit=crop&q=80&w=800'} alt="" className="w-full h-full object-cover" />}
                         <div className="absolute top-1 left-1 bg-black/80 backdrop-blur-md px-2 py-0.5 rounded-lg text-[8px] font-bold text-white uppercase">{car.ano}</div>
                       </motion.div>
                       <div>
@@ -1289,7 +1291,74 @@ const LionsEliteDashboard: React.FC<DashboardProps> = ({
     setTimeout(() => setToasts(prev => prev.filter(t => t.id !== id)), 4000);
   };
 
+  // El stock llega en vista resumida: la tabla de inventario (tendencia de precio)
+  // y el formulario de edición usan los documentos completos. El inventario
+  // completo se descarga una vez por visita a la vista; después los cambios del
+  // stock se mezclan aquí y solo se pide de nuevo un auto si cambió su precio.
+  const [inventory, setInventory] = useState<Vehiculo[] | null>(null);
+  const stockRef = useRef(stock);
+  const inventoryBase = useRef<Vehiculo[] | null>(null);
+  stockRef.current = stock;
+  useEffect(() => {
+    inventoryBase.current = null;
+    setInventory(null);
+    if (view !== 'inventory') return;
+    let cancelled = false;
+    carService.getAll()
+      .then(full => { if (!cancelled) { inventoryBase.current = stockRef.current; setInventory(full); } })
+      .catch(() => setInventory(null));
+    return () => { cancelled = true; };
+  }, [view]);
+
+  useEffect(() => {
+    const base = inventoryBase.current;
+    if (!base || base === stock) return;
+    inventoryBase.current = stock;
+    const before = new Map(base.map(c => [c.id, c]));
+    setInventory(prev => {
+      if (!prev) return prev;
+      const full = new Map(prev.map(c => [c.id, c]));
+      return stock.map(c => ({ ...full.get(c.id), ...c }));
+    });
+    const repriced = stock.filter(c => before.get(c.id) !== c && before.get(c.id)?.precio !== c.precio);
+    repriced.forEach(c => carService.getById(c.id)
+      .then(car => setInventory(prev => prev && prev.map(x => (x.id === car.id ? car : x))))
+      .catch(() => undefined));
+  }, [stock]);
+
+  const editCar = async (car: Vehiculo) => {
+    try {
+      setEditingCar(await carService.getById(car.id));
+      setView('form');
+    } catch {
+      showToast('No se pudo cargar el vehículo', 'error');
+    }
+  };
+
+  // Totales del servidor (no recorren el stock); si fallan se calculan aquí
+  // El stock cambia con cada delta del feed: se refresca al tiro la primera vez y
+  // después a lo más cada STATS_REFRESH_MS
+  const [serverStats, setServerStats] = useState<DashboardStats | null>(null);
+  const statsTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+  const statsLoaded = useRef(false);
+  useEffect(() => {
+    if (statsTimer.current) return;
+    statsTimer.current = setTimeout(() => {
+      statsTimer.current = null;
+      carService.getStats().then(setServerStats).catch(() => setServerStats(null));
+    }, statsLoaded.current ? STATS_REFRESH_MS : 0);
+    statsLoaded.current = true;
+  }, [stock]);
+  useEffect(() => () => {
+    if (statsTimer.current) clearTimeout(statsTimer.current);
+    statsTimer.current = null;
+  }, []);
+
   const stats = useMemo(() => {
+    if (serverStats) {
+      const s = serverStats;
+      return { totalValue: s.valorTotal, avgDays: s.promedioDias, leads: s.interesados, count: s.count, totalComission: s.comisionTotal, available: s.disponibles, sold: s.vendidos, totalViews: s.vistas, avgPrice: s.precioPromedio, conversionRate: s.conversion.toFixed(1) };
+    }
     if (!stock) return { totalValue: 0, avgDays: 0, leads: 0, count: 0, totalComission: 0, available: 0, sold: 0, totalViews: 0, avgPrice: 0, conversionRate: '0' };
     const available = stock.filter((c) => c.estado !== 'Vendido');
     const sold = stock.filter((c) => c.estado === 'Vendido');
@@ -1301,7 +1370,7 @@ const LionsEliteDashboard: React.FC<DashboardProps> = ({
     const avgPrice = totalValue / (available.length || 1);
     const conversionRate = ((sold.length / stock.length) * 100).toFixed(1);
     return { totalValue, avgDays, leads, count: stock.length, totalComission, available: available.length, sold: sold.length, totalViews, avgPrice, conversionRate };
-  }, [stock]);
+  }, [stock, serverStats]);
 
   return (
     <div className="min-h-screen bg-[#050505] text-white font-sans selection:bg-[#E8B923] selection:text-black overflow-x-hidden">
@@ -1424,7 +1493,7 @@ const LionsEliteDashboard: React.FC<DashboardProps> = ({
 
             {view === 'inventory' && (
               <motion.div key="inventory" initial={{ opacity: 0 }} animate={{ opacity: 1 }} exit={{ opacity: 0 }}>
-                <InventoryView stock={stock} onEdit={(car) => { setEditingCar(car); setView('form'); }} onDelete={onDelete} />
+                <InventoryView stock={inventory || stock} onEdit={editCar} onDelete={onDelete} />
               </motion.div>
             )}
 
@@ -47,8 +47,16 @@ export interface Vehiculo {
   comisionEstimada: number;
   precioHistorial: { date: string; price: number }[];
   hotspots: Hotspot[];
+  // Versiones reducidas de cada foto (paralelo a imagenes; null si aún no existen)
+  imagenesVariantes?: (ImageVariants | null)[];
 }
 
+export interface ImageVariants { thumb: string; thumbJpg: string; medium: string; mediumJpg: string; }
+
+// URLs de las fotos en la variante pedida, usando el original si no hay variante
+export const imageUrls = (car: Vehiculo, variant: keyof ImageVariants): string[] =>
+  (car.imagenes || []).map((url, i) => car.imagenesVariantes?.[i]?.[variant] || url);
+
 export interface Brand { id: number; name: string; }
 export interface Color { id: number; name: string; hex?: string; }
 export interface User { id: number; username: string; password?: string; role: string; }
@@ -60,6 +68,52 @@ const API_URL = import.meta.env.PROD
   ? "https://lionscars.cl/api" 
   : "http://localhost:8000/api";
 
+// --- SESIÓN ---
+// El token que entrega /api/login se manda en cada llamada del portal
+const TOKEN_KEY = 'lions_token';
+const authHeaders = (extra: Record<string, string> = {}): Record<string, string> => {
+  const token = sessionStorage.getItem(TOKEN_KEY);
+  return token ? { ...extra, Authorization: `Bearer ${token}` } : extra;
+};
+const JSON_HEADERS = { 'Content-Type': 'application/json' };
+
+// Totales del dashboard calculados en el servidor (GET /api/stats)
+export interface DashboardStats {
+  count: number; vendidos: number; disponibles: number;
+  vistas: number; interesados: number; promedioDias: number; conversion: number;
+  valorTotal: number; comisionTotal: number; precioPromedio: number;
+  antiguedad: { '0-30': number; '31-60': number; '60+': number };
+  porEstado: Record<string, number>;
+}
+
+// Cambios del catálogo desde una versión (GET /api/autos/changes); `counters`
+// trae vistas/interesados de los autos con clics nuevos desde countersSince
+export interface CounterChange { id: number; vistas: number; interesados: number; }
+export interface CatalogChanges {
+  version: number; reset: boolean; more: boolean;
+  changed: Vehiculo[]; deleted: number[];
+  counters?: CounterChange[]; countersVersion?: number;
+}
+
+// Aplica un delta a la lista local manteniendo el orden (id más alto primero)
+export const applyChanges = (stock: Vehiculo[], delta: CatalogChanges): Vehiculo[] => {
+  const touched = new Set([...delta.deleted, ...delta.changed.map(c => c.id)]);
+  const counters = new Map((delta.counters || []).map(c => [c.id, c]));
+  const kept = stock
+    .filter(c => !touched.has(c.id))
+    .map(c => { const n = counters.get(c.id); return n ? { ...c, vistas: n.vistas, interesados: n.interesados } : c; });
+  return [...kept, ...delta.changed].sort((a, b) => b.id - a.id);
+};
+
+// Cantidad de autos por opción de cada filtro (GET /api/autos/facets)
+export interface FacetValue { value: string; count: number; }
+export interface HistogramBucket { from: number; to: number; count: number; }
+export interface CatalogFacets {
+  total: number;
+  facets: Record<string, FacetValue[]>;
+  histograms: Record<string, { width: number; buckets: HistogramBucket[] }>;
+}
+
 export const carService = {
   // --- NUEVA FUNCIÓN: SUBIR IMAGEN ---
   // Esta función envía el archivo físico al backend y devuelve la URL pública
@@ -73,6 +127,7 @@ export const carService = {
     // fetch lo maneja solo cuando es FormData.
     const r = await fetch(`${API_URL}/upload`, {
       method: 'POST',
+      headers: authHeaders(),
       body: formData,
     });
 
@@ -93,32 +148,86 @@ export const carService = {
     // AQUÍ ORDENAMOS: b.id - a.id pone el ID más alto (el más nuevo) primero
     return data.sort((a: Vehiculo, b: Vehiculo) => b.id - a.id);
   },
+  // Catálogo en vista resumida (sin hotspots, historial ni obs: eso lo trae getById),
+  // más las versiones desde las que pedir cambios y contadores con getChanges
+  getCatalog: async (): Promise<{ cars: Vehiculo[]; version: number; countersVersion: number }> => {
+    const r = await fetch(`${API_URL}/autos?view=summary`);
+    const data: Vehiculo[] = await r.json();
+    return {
+      cars: data.sort((a, b) => b.id - a.id),
+      version: Number(r.headers.get('X-Changes-Version') || 0),
+      countersVersion: Number(r.headers.get('X-Counters-Version') || 0),
+    };
+  },
+  // Conteos del panel de filtros; `params` son los mismos filtros de /autos (marca=Kia&precioMin=...)
+  getFacets: async (params: URLSearchParams = new URLSearchParams()): Promise<CatalogFacets> => {
+    const r = await fetch(`${API_URL}/autos/facets?${params}`);
+    if (!r.ok) throw new Error("Error cargando filtros");
+    return r.json();
+  },
+  // Solo lo creado/modificado/borrado desde `since` (en vista resumida, igual que
+  // getCatalog) y los contadores desde `countersSince`; espera hasta `wait` s si no hay nada
+  getChanges: async (since: number, wait = 0, countersSince?: number): Promise<CatalogChanges> => {
+    const counters = countersSince === undefined ? '' : `&counters_since=${countersSince}`;
+    const r = await fetch(`${API_URL}/autos/changes?since=${since}&wait=${wait}&view=summary${counters}`);
+    if (!r.ok) throw new Error("Error consultando cambios");
+    return r.json();
+  },
+  // Un vehículo completo (hotspots, historial de precios, obs...)
+  getById: async (id: number): Promise<Vehiculo> => {
+    const r = await fetch(`${API_URL}/autos/${id}`);
+    if (!r.ok) throw new Error("Vehículo no encontrado");
+    return r.json();
+  },
+  // Autos parecidos a `id` (resumen del listado), el más cercano primero
+  getSimilar: async (id: number, limit = 6): Promise<(Vehiculo & { distancia: number })[]> => {
+    const r = await fetch(`${API_URL}/autos/${id}/similar?limit=${limit}`);
+    if (!r.ok) throw new Error("Error buscando autos similares");
+    return r.json();
+  },
+  // Búsqueda de texto en el servidor (sin tildes, por relevancia); devuelve los ids
+  searchIds: async (q: string): Promise<number[]> => {
+    const r = await fetch(`${API_URL}/autos/search?q=${encodeURIComponent(q)}&fields=id&limit=500`);
+    if (!r.ok) throw new Error("Error en la búsqueda");
+    const data: { id: number }[] = await r.json();
+    return data.map(c => c.id);
+  },
+  // Autocompletado del buscador ("Toyota Corolla", ...)
+  suggest: async (q: string): Promise<string[]> => {
+    const r = await fetch(`${API_URL}/autos/suggest?q=${encodeURIComponent(q)}`);
+    if (!r.ok) return [];
+    const data: { texto: string }[] = await r.json();
+    return data.map(s => s.texto);
+  },
   create: async (car: Omit<Vehiculo, 'id'>): Promise<Vehiculo> => {
-    const r = await fetch(`${API_URL}/autos`, { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(car) }); return r.json();
+    const r = await fetch(`${API_URL}/autos`, { method: 'POST', headers: authHeaders(JSON_HEADERS), body: JSON.stringify(car) }); return r.json();
   },
   update: async (car: Vehiculo): Promise<Vehiculo> => {
-    const r = await fetch(`${API_URL}/autos/${car.id}`, { method: 'PUT', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(car) }); return r.json();
+    const r = await fetch(`${API_URL}/autos/${car.id}`, { method: 'PUT', headers: authHeaders(JSON_HEADERS), body: JSON.stringify(car) }); return r.json();
   },
   delete: async (id: number): Promise<void> => {
-    await fetch(`${API_URL}/autos/${id}`, { method: 'DELETE' });
+    await fetch(`${API_URL}/autos/${id}`, { method: 'DELETE', headers: authHeaders() });
   },
 
   // --- CONFIGURACIÓN ---
   getBrands: async (): Promise<Brand[]> => { const r = await fetch(`${API_URL}/brands`); return r.json(); },
-  createBrand: async (name: string) => { await fetch(`${API_URL}/brands`, { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify({name}) }); },
-  deleteBrand: async (id: number) => { await fetch(`${API_URL}/brands/${id}`, { method: 'DELETE' }); },
+  createBrand: async (name: string) => { await fetch(`${API_URL}/brands`, { method: 'POST', headers: authHeaders(JSON_HEADERS), body: JSON.stringify({name}) }); },
+  deleteBrand: async (id: number) => { await fetch(`${API_URL}/brands/${id}`, { method: 'DELETE', headers: authHeaders() }); },
 
   getColors: async (): Promise<Color[]> => { const r = await fetch(`${API_URL}/colors`); return r.json(); },
-  createColor: async (name: string, hex?: string) => { await fetch(`${API_URL}/colors`, { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify({name, hex}) }); },
-  deleteColor: async (id: number) => { await fetch(`${API_URL}/colors/${id}`, { method: 'DELETE' }); },
+  createColor: async (name: string, hex?: string) => { await fetch(`${API_URL}/colors`, { method: 'POST', headers: authHeaders(JSON_HEADERS), body: JSON.stringify({name, hex}) }); },
+  deleteColor: async (id: number) => { await fetch(`${API_URL}/colors/${id}`, { method: 'DELETE', headers: authHeaders() }); },
 
-  getUsers: async (): Promise<User[]> => { const r = await fetch(`${API_URL}/users`); return r.json(); },
-  createUser: async (u: Omit<User, 'id'>) => { await fetch(`${API_URL}/users`, { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(u) }); },
-  deleteUser: async (id: number) => { await fetch(`${API_URL}/users/${id}`, { method: 'DELETE' }); },
+  getUsers: async (): Promise<User[]> => { const r = await fetch(`${API_URL}/users`, { headers: authHeaders() }); return r.json(); },
+  createUser: async (u: Omit<User, 'id'>) => { await fetch(`${API_URL}/users`, { method: 'POST', headers: authHeaders(JSON_HEADERS), body: JSON.stringify(u) }); },
+  deleteUser: async (id: number) => { await fetch(`${API_URL}/users/${id}`, { method: 'DELETE', headers: authHeaders() }); },
   
   login: async (username: string, password: string): Promise<boolean> => {
-      const r = await fetch(`${API_URL}/login`, { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify({username, password}) });
-      return r.ok;
+      const r = await fetch(`${API_URL}/login`, { method: 'POST', headers: JSON_HEADERS, body: JSON.stringify({username, password}) });
+      if (!r.ok) return false;
+      const data = await r.json();
+      sessionStorage.setItem(TOKEN_KEY, data.token);
+      return true;
   },
 
   // --- MÉTRICAS ---
@@ -130,7 +239,20 @@ export const carService = {
     await fetch(`${API_URL}/autos/${id}/interested`, { method: 'POST' });
   },
 
+  // --- ESTADÍSTICAS ---
+  getStats: async (): Promise<DashboardStats> => {
+    const r = await fetch(`${API_URL}/stats`, { headers: authHeaders() });
+    if (!r.ok) throw new Error("Error cargando estadísticas");
+    return r.json();
+  },
+  getTopConversion: async (limit = 5): Promise<Vehiculo[]> => {
+    const r = await fetch(`${API_URL}/stats/top-conversion?limit=${limit}`, { headers: authHeaders() }); return r.json();
+  },
+  getNeedsAttention: async (limit = 5): Promise<Vehiculo[]> => {
+    const r = await fetch(`${API_URL}/stats/attention?limit=${limit}`, { headers: authHeaders() }); return r.json();
+  },
+
   resetMetrics: async (): Promise<void> => {
-    await fetch(`${API_URL}/autos/reset-metrics`, { method: 'POST' });
+    await fetch(`${API_URL}/autos/reset-metrics`, { method: 'POST', headers: authHeaders() });
   }
 };
\ No newline at end of file